@@ -6,7 +6,13 @@ from flask_bootstrap import Bootstrap
 from flask_moment import Moment
 from flask_login import LoginManager
 from flask_migrate import Migrate
+from flask_mail import Mail
 from sqlalchemy import MetaData
+from jinja2 import FileSystemBytecodeCache
+from .cache import FragmentCache
+from .balances import BalanceCache
+from .replica import RoutingSession, ReadReplica
+from .assets import AssetManifest
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -25,7 +31,22 @@ moment = Moment()
 login = LoginManager()
 login.login_view = 'auth.login'
 migrate = Migrate()
-db = SQLAlchemy(metadata=metadata)
+mail = Mail()
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
+fragment_cache = FragmentCache()
+analytics_cache = FragmentCache(max_bytes=16 * 1024 * 1024, config_prefix='ANALYTICS_CACHE')
+balance_cache = BalanceCache()
+read_replica = ReadReplica()
+assets = AssetManifest()
+
+from .sharding import ShardRouter # imported after db, which the router, the directory, the filter and the broker use
+from .directory import RecipientDirectory
+from .emails import EmailFilter
+from .events import EventBroker
+shard_router = ShardRouter()
+recipient_directory = RecipientDirectory()
+email_filter = EmailFilter()
+event_broker = EventBroker()
 
 
 def create_app(config_name):
@@ -38,6 +59,21 @@ def create_app(config_name):
     db.init_app(app)
     login.init_app(app)
     migrate.init_app(app, db, render_as_batch=True)
+    mail.init_app(app)
+    fragment_cache.init_app(app)
+    analytics_cache.init_app(app)
+    balance_cache.init_app(app)
+    shard_router.init_app(app)
+    read_replica.init_app(app)
+    recipient_directory.init_app(app)
+    email_filter.init_app(app)
+    event_broker.init_app(app)
+    assets.init_app(app)
+    
+    # Compiled templates are cached on disk so cold workers skip Jinja's compile step
+    if app.config.get('JINJA_BYTECODE_CACHE_DIR'):
+        os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
     
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -45,5 +81,32 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+    
+    from .archive import archive_command
+    app.cli.add_command(archive_command)
+    
+    from .schedules import run_schedules_command
+    app.cli.add_command(run_schedules_command)
+    
+    from .reconciliation import reconcile_command
+    app.cli.add_command(reconcile_command)
+    
+    from .notifications import dispatch_outbox_command
+    app.cli.add_command(dispatch_outbox_command)
+    
+    from .schema import bootstrap_command
+    app.cli.add_command(bootstrap_command)
+    
+    from .stripes import balances_cli
+    app.cli.add_command(balances_cli)
+
+    from .ingest import ingest_deposits_command
+    app.cli.add_command(ingest_deposits_command)
+    
+    from . import reference_data
+    reference_data.init_app(app)
+    
     return app
     
@@ -0,0 +1,141 @@
+import json
+from collections import namedtuple
+from typing import Dict, Optional
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from .models import Posting, ArchivedPosting
+from .ledger import latest_posting_id, balance_forward_query, archive_bind_arguments_for, BALANCE_FORWARD
+
+AccountColumns = namedtuple('AccountColumns', ['amount', 'posted_at', 'type_id', 'counterparty'])
+AccountColumns.__doc__ = """An account's postings as parallel NumPy arrays, one element per posting
+    - amount (float64): signed amount, negative when money left the account
+    - posted_at (datetime64[s]): date time of the transaction
+    - type_id (int64): transaction type, 0 when unknown
+    - counterparty (int64): other account, the account itself for deposits and withdrawals
+"""
+
+PERCENTILES = (50, 90, 99)
+
+
+def account_columns(session, account_num: int) -> AccountColumns:
+    """Reads an account's postings as columns, a range of the (account_num, posted_at, id) index
+        - An account with a balance forward posting has archived postings, they are read from the archive in a second
+          query and come first, the balance forward itself is left out
+
+    Args:
+        session: session owning the account's rows, see ShardRouter.session_for
+        account_num (int): account number
+
+    Returns:
+        AccountColumns: postings in posting order
+    """
+    rows = []
+    models = [Posting]
+    if session.execute(balance_forward_query(account_num)).first() is not None:
+        models.insert(0, ArchivedPosting)
+    for model in models:
+        rows += session.execute(
+            sa.select(model.amount, model.posted_at, sa.func.coalesce(model.transaction_type_id, 0), model.counterparty)
+            .where(model.account_num == account_num, model.txn_id != BALANCE_FORWARD)
+            .order_by(model.posted_at, model.id),
+            bind_arguments=archive_bind_arguments_for(account_num) if model is ArchivedPosting else None).all()
+    amount, posted_at, type_id, counterparty = zip(*rows) if rows else ((), (), (), ())
+    return AccountColumns(np.array(amount, dtype=np.float64), np.array(posted_at, dtype='datetime64[s]'),
+                          np.array(type_id, dtype=np.int64), np.array(counterparty, dtype=np.int64))
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over up to window values, fewer at the start of the series"""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    return (sums[end] - sums[start]) / (end - start)
+
+
+def spending_summary(columns: AccountColumns, account_num: int, type_names: Dict[int, str], window: int = 3,
+                     top_counterparties: int = 10) -> dict:
+    """Monthly and per category breakdown of an account's money in and out, without a Python loop over postings
+        - Months run from the first posting's to the last one's, months without postings are zeros
+        - Spending is the money leaving the account: transfers out and withdrawals, as positive amounts
+        - by_counterparty ranks the accounts transferred to by total spent
+
+    Args:
+        columns (AccountColumns): postings from account_columns()
+        account_num (int): account the postings belong to
+        type_names (dict): transaction type id to name
+        window (int): months in the moving average of spending
+        top_counterparties (int): counterparties listed
+
+    Returns:
+        dict: months, monthly spent, received and moving average, spent per type per month, top counterparties,
+            and percentiles of the outgoing amounts
+    """
+    if not len(columns.amount):
+        return {'months': [], 'spent': [], 'received': [], 'moving_average': [], 'by_type': {},
+                'by_counterparty': [], 'percentiles': {str(p): None for p in PERCENTILES}}
+    month = columns.posted_at.astype('datetime64[M]')
+    months = np.arange(month.min(), month.max() + 1)
+    month_index = (month - months[0]).astype(np.int64)
+    outgoing = columns.amount < 0
+    spent = np.where(outgoing, -columns.amount, 0.0)
+    received = np.where(outgoing, 0.0, columns.amount)
+    monthly_spent = np.bincount(month_index, weights=spent, minlength=len(months))
+    monthly_received = np.bincount(month_index, weights=received, minlength=len(months))
+
+    types, type_index = np.unique(columns.type_id[outgoing], return_inverse=True)
+    by_type = np.bincount(month_index[outgoing] * len(types) + type_index, weights=spent[outgoing],
+                          minlength=len(months) * len(types)).reshape(len(months), len(types))
+
+    transfers_out = outgoing & (columns.counterparty != account_num)
+    counterparties, counterparty_index = np.unique(columns.counterparty[transfers_out], return_inverse=True)
+    totals = np.bincount(counterparty_index, weights=spent[transfers_out], minlength=len(counterparties))
+    counts = np.bincount(counterparty_index, minlength=len(counterparties))
+    ranked = np.argsort(-totals, kind='stable')[:top_counterparties]
+
+    amounts_out = spent[outgoing]
+    percentiles = np.percentile(amounts_out, PERCENTILES) if len(amounts_out) else [None] * len(PERCENTILES)
+    return {
+        'months': [str(value) for value in months],
+        'spent': monthly_spent.tolist(),
+        'received': monthly_received.tolist(),
+        'moving_average': moving_average(monthly_spent, window).tolist(),
+        'by_type': {type_names.get(int(type_id), str(type_id)): by_type[:, i].tolist() for i, type_id in enumerate(types)},
+        'by_counterparty': [{'account_num': int(counterparties[i]), 'spent': float(totals[i]), 'count': int(counts[i])}
+                            for i in ranked],
+        'percentiles': {str(p): _float(value) for p, value in zip(PERCENTILES, percentiles)},
+    }
+
+
+def account_summary(account, type_names: Dict[int, str]) -> str:
+    """JSON of an account's spending_summary(), computed once per write to the account
+        - Cached in analytics_cache stamped with the account's latest posting id, like the dashboard's
+          transaction list in fragment_cache, so the next transaction of the account is a miss
+        - Config:
+            - ANALYTICS_MOVING_AVERAGE_MONTHS (int): window of the moving average
+            - ANALYTICS_TOP_COUNTERPARTIES (int): counterparties listed
+
+    Args:
+        account (Accounts): account to summarise
+        type_names (dict): transaction type id to name
+
+    Returns:
+        str: JSON object with the account number and the summary
+    """
+    from . import analytics_cache, shard_router
+    session = shard_router.session_for(account)
+    latest = latest_posting_id(session, account.account_num)
+    payload = analytics_cache.get(account.account_num, latest)
+    if payload is None:
+        config = current_app.config
+        summary = spending_summary(account_columns(session, account.account_num), account.account_num, type_names,
+                                   config['ANALYTICS_MOVING_AVERAGE_MONTHS'], config['ANALYTICS_TOP_COUNTERPARTIES'])
+        payload = json.dumps(dict(summary, account_num=account.account_num))
+        analytics_cache.set(account.account_num, latest, payload)
+    return payload
+
+
+def _float(value) -> Optional[float]:
+    return None if value is None else float(value)
@@ -0,0 +1,163 @@
+import json
+from flask import jsonify, request, current_app, Response, abort, stream_with_context
+from flask_login import current_user, login_required
+from app.models import TransactionType
+from app import db, shard_router, event_broker, balance_cache
+from app.replica import read_only
+from app.ledger import account_history, full_history
+from app.decorators import staff_required
+from app.search import search_transactions, cursor, encode_cursor, decode_cursor
+from app.analytics import account_summary
+from app.main.forms import SearchForm
+from .serializers import serialize_balance, serialize_posting, serialize_transaction, transaction_type_names, \
+    csv_header, csv_rows, export_row
+from . import api
+
+# Rows fetched per round trip while streaming the CSV export
+EXPORT_BATCH_SIZE = 500
+
+
+def _current_account():
+    """The logged in user's account picked by ?account=, the lowest numbered one by default, 404 for an account
+    of another user or a user without accounts
+    """
+    accounts = {account.account_num: account for account in shard_router.find_accounts_by_owner(current_user.id)}
+    if not accounts:
+        abort(404)
+    account = accounts.get(request.args.get('account', min(accounts), type=int))
+    if account is None:
+        abort(404)
+    return account
+
+
+def _type_names() -> dict:
+    return transaction_type_names(db.session.execute(db.select(TransactionType.id, TransactionType.name)))
+
+
+@api.route('/balance')
+@login_required
+@read_only
+def balance() -> Response:
+    """Balance of one of the logged in user's accounts as JSON, ?account= picks it, the first one by default
+    """
+    account = _current_account()
+    return jsonify(serialize_balance(account, balance_cache.get(account.account_num).balance))
+
+
+@api.route('/history')
+@login_required
+@read_only
+def history() -> Response:
+    """Page of an account's transactions as JSON, newest first. Paginated with ?page= like the dashboard,
+    ?account= picks one of the logged in user's accounts, the first one by default.
+    """
+    account = _current_account()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['TRANSACTIONS_PER_PAGE']
+    type_names = _type_names()
+    transactions = account_history(shard_router.session_for(account), account.account_num, page, per_page)
+    return jsonify({
+        'account_num': account.account_num,
+        'page': page,
+        'per_page': per_page,
+        'transactions': [serialize_posting(posting, type_names) for posting in transactions],
+    })
+
+
+@api.route('/export.csv')
+@login_required
+@read_only
+def export() -> Response:
+    """Full transaction history of one of the logged in user's accounts as CSV, newest first, ?account= as in /history
+        - Streamed in batches of EXPORT_BATCH_SIZE rows, memory use does not grow with the history
+        - Archived postings follow the others, see ledger.full_history
+
+    Returns:
+        Response: text/csv attachment
+    """
+    account = _current_account()
+    acc_session = shard_router.session_for(account)
+    type_names = _type_names()
+
+    def generate():
+        yield csv_header()
+        for batch in full_history(acc_session, account.account_num, EXPORT_BATCH_SIZE):
+            yield csv_rows(export_row(serialize_posting(posting, type_names)) for posting in batch)
+
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename=transactions-{}.csv'.format(account.account_num)})
+
+
+@api.route('/analytics')
+@login_required
+@read_only
+def analytics() -> Response:
+    """Monthly spending of one of the logged in user's accounts as JSON, see analytics.spending_summary
+        - ?account= picks the account, the first one by default
+
+    Returns:
+        Response: JSON summary, 404 for an account of another user
+    """
+    account = _current_account()
+    return Response(account_summary(account, _type_names()), mimetype='application/json')
+
+
+@api.route('/transactions/search')
+@staff_required
+@read_only
+def search() -> Response:
+    """Support search as JSON, staff only
+        - Same criteria as the search page: date_from, date_to (YYYY-MM-DD), type_id, account, amount_min,
+          amount_max, plus limit up to TRANSACTIONS_PER_PAGE
+        - next is the ?before= cursor of the following page, null on the last one
+
+    Returns:
+        Response: JSON transactions and next, 400 with the form errors for invalid criteria
+    """
+    type_names = _type_names()
+    form = SearchForm(formdata=request.args)
+    form.type_id.choices = [(0, 'Any')] + list(type_names.items())
+    if not form.validate():
+        errors = {field.name: field.errors for field in form if field.errors}
+        if form.form_errors:
+            errors['criteria'] = form.form_errors
+        return jsonify(errors=errors), 400
+    per_page = current_app.config['TRANSACTIONS_PER_PAGE']
+    limit = min(max(request.args.get('limit', per_page, type=int), 1), per_page)
+    transactions = search_transactions(form.filters(), decode_cursor(request.args.get('before')), limit)
+    return jsonify({
+        'transactions': [serialize_transaction(txn, type_names) for txn in transactions],
+        'next': encode_cursor(cursor(transactions[-1])) if len(transactions) == limit else None,
+    })
+
+
+@api.route('/events')
+@login_required
+def events() -> Response:
+    """Server-sent events stream of the logged in user's new transactions
+        - One 'transaction' event per posting to any of the user's accounts, carrying the account's balance and the
+          transaction serialized as in /history
+        - Idle streams get a comment every EVENTS_KEEPALIVE_SECONDS so proxies keep them open
+        - The stream holds no database connection, see EventBroker
+
+    Returns:
+        Response: text/event-stream
+    """
+    account_nums = [account.account_num for account in shard_router.find_accounts_by_owner(current_user.id)]
+    keepalive = current_app.config['EVENTS_KEEPALIVE_SECONDS']
+    subscription = event_broker.subscribe(account_nums)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.get(keepalive)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield 'event: transaction\ndata: {}\n\n'.format(json.dumps(event))
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache',
+                                                                       'X-Accel-Buffering': 'no'})
@@ -0,0 +1,67 @@
+import csv
+import io
+from typing import Dict, Iterable
+
+# Columns of the CSV export, shared by the WSGI and ASGI endpoints
+EXPORT_COLUMNS = ['id', 'date_time', 'type', 'amount', 'sender', 'receiver']
+
+
+def serialize_balance(account, balance=None) -> dict:
+    return {'account_num': account.account_num, 'balance': account.balance if balance is None else balance}
+
+
+def serialize_posting(posting, type_names: Dict[int, str]) -> dict:
+    """JSON representation of a Posting, the transaction as seen from the posting's account
+        - Money leaving the account carries a negative amount, as on the dashboard
+        - Type names come from a preloaded {id: name} map, so serializing never lazy loads
+
+    Args:
+        posting: Posting row
+        type_names (Dict[int, str]): transaction type names by id, see transaction_type_names()
+
+    Returns:
+        dict: id of the transaction, date_time (ISO 8601), type, amount, sender and receiver
+    """
+    outgoing = posting.amount < 0 and posting.counterparty != posting.account_num
+    sender, receiver = (posting.account_num, posting.counterparty) if outgoing else (posting.counterparty, posting.account_num)
+    return {
+        'id': posting.txn_id,
+        'date_time': posting.posted_at.isoformat() if posting.posted_at else None,
+        'type': type_names.get(posting.transaction_type_id),
+        'amount': posting.amount,
+        'sender': sender,
+        'receiver': receiver,
+    }
+
+
+def serialize_transaction(txn, type_names: Dict[int, str]) -> dict:
+    """JSON representation of a Transactions row as stored, used by the support search
+    """
+    return {
+        'id': txn.id,
+        'date_time': txn.date_time.isoformat() if txn.date_time else None,
+        'type': type_names.get(txn.transaction_type_id),
+        'amount': txn.amount,
+        'sender': txn.sender,
+        'receiver': txn.receiver,
+    }
+
+
+def transaction_type_names(rows: Iterable) -> Dict[int, str]:
+    return {type_id: name for type_id, name in rows}
+
+
+def csv_header() -> str:
+    return csv_rows([EXPORT_COLUMNS])
+
+
+def csv_rows(rows: Iterable[Iterable]) -> str:
+    """Encodes rows as CSV text, used to stream the export one chunk at a time
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def export_row(record: dict) -> list:
+    return [record[column] for column in EXPORT_COLUMNS]
@@ -0,0 +1,155 @@
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db, shard_router
+from .models import Transactions, ArchivedTransactions, Posting, ArchivedPosting
+
+TRANSACTION_COLUMNS = ['id', 'receiver', 'sender', 'amount', 'date_time', 'transaction_type_id']
+POSTING_COLUMNS = ['id', 'txn_id', 'account_num', 'counterparty', 'amount', 'posted_at', 'transaction_type_id']
+
+
+def archive_engine() -> Optional[sa.engine.Engine]:
+    """Engine of the archive database when ARCHIVE_BIND is configured, None when the archive table lives next to
+    transactions_table in the default database
+    """
+    bind_key = current_app.config.get('ARCHIVE_BIND')
+    return db.engines[bind_key] if bind_key else None
+
+
+def archive_transactions(older_than: timedelta, chunk_size: int = 1000, pause: float = 0) -> int:
+    """Moves transactions and postings older than the horizon into their archive tables, shard by shard, one chunk
+    per commit
+        - Each shard archives into the archive tables of its own database, ids are only unique within a shard.
+          ARCHIVE_BIND moves the default shard's archive to its own database.
+        - Same database: INSERT ... SELECT then DELETE in one transaction per chunk
+        - Archive database: the chunk is inserted into the archive first, ignoring ids already there, then deleted
+          from the live table, so a run interrupted between the two commits is completed by the next run
+        - Balances are never touched, archived rows still count towards them
+        - The archived postings of an account are replaced by its balance forward posting, created or increased in
+          the commit deleting them, so the sum of postings_table stays the balance. The history reads the archive
+          past the horizon, see ledger.account_history.
+
+    Args:
+        older_than (timedelta): archive horizon, rows with an older date_time are moved
+        chunk_size (int): rows moved per commit, keeps the write lock short
+        pause (float): seconds slept between chunks to leave room for foreground writes
+
+    Returns:
+        int: number of transactions archived
+    """
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    for shard in shard_router.shards:
+        engine = archive_engine() if shard.bind_key is None else None
+        if shard.bind_key is not None:
+            ArchivedTransactions.__table__.create(db.engines[shard.bind_key], checkfirst=True)
+            ArchivedPosting.__table__.create(db.engines[shard.bind_key], checkfirst=True)
+        session = shard_router.session(shard)
+        moved += _archive_shard(session, engine, cutoff, chunk_size, pause)
+        _archive_postings(session, engine, cutoff, chunk_size, pause)
+    return moved
+
+
+def _archive_shard(session, engine: Optional[sa.engine.Engine], cutoff: datetime, chunk_size: int,
+                   pause: float) -> int:
+    hot = Transactions.__table__
+    cold = ArchivedTransactions.__table__
+    bind_arguments = {'mapper': Transactions}
+    if engine is not None:
+        cold.create(engine, checkfirst=True)
+    moved = 0
+    while True:
+        ids = session.execute(
+            sa.select(hot.c.id).where(hot.c.date_time < cutoff).order_by(hot.c.id).limit(chunk_size),
+            bind_arguments=bind_arguments).scalars().all()
+        if not ids:
+            break
+        if engine is None:
+            session.execute(cold.insert().from_select(
+                TRANSACTION_COLUMNS, sa.select(*[hot.c[name] for name in TRANSACTION_COLUMNS]).where(hot.c.id.in_(ids))),
+                bind_arguments=bind_arguments)
+        else:
+            rows = session.execute(sa.select(hot).where(hot.c.id.in_(ids)),
+                                   bind_arguments=bind_arguments).mappings().all()
+            with engine.begin() as connection:
+                connection.execute(cold.insert().prefix_with('OR IGNORE', dialect='sqlite'), [dict(row) for row in rows])
+        session.execute(hot.delete().where(hot.c.id.in_(ids)), bind_arguments=bind_arguments)
+        session.commit()
+        moved += len(ids)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def _archive_postings(session, engine: Optional[sa.engine.Engine], cutoff: datetime, chunk_size: int,
+                      pause: float) -> int:
+    """Moves the postings older than the cutoff into the archive, adding their amounts to each account's balance
+    forward posting in the same commit as the delete
+    """
+    from .ledger import BALANCE_FORWARD
+    hot = Posting.__table__
+    cold = ArchivedPosting.__table__
+    bind_arguments = {'mapper': Posting}
+    if engine is not None:
+        cold.create(engine, checkfirst=True)
+    moved = 0
+    while True:
+        rows = session.execute(
+            sa.select(hot).where(hot.c.posted_at < cutoff, hot.c.txn_id != BALANCE_FORWARD).order_by(hot.c.id)
+            .limit(chunk_size), bind_arguments=bind_arguments).mappings().all()
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        if engine is None:
+            session.execute(cold.insert().from_select(
+                POSTING_COLUMNS, sa.select(*[hot.c[name] for name in POSTING_COLUMNS]).where(hot.c.id.in_(ids))),
+                bind_arguments=bind_arguments)
+        else:
+            with engine.begin() as connection:
+                connection.execute(cold.insert().prefix_with('OR IGNORE', dialect='sqlite'), [dict(row) for row in rows])
+        forwards = {}
+        for row in rows:
+            amount, posted_at = forwards.get(row['account_num'], (0, row['posted_at']))
+            forwards[row['account_num']] = (amount + row['amount'], max(posted_at, row['posted_at']))
+        existing = {posting.account_num: posting for posting in session.execute(
+            sa.select(Posting).where(Posting.account_num.in_(forwards), Posting.txn_id == BALANCE_FORWARD)).scalars()}
+        for account_num, (amount, posted_at) in forwards.items():
+            forward = existing.get(account_num)
+            if forward is None:
+                session.add(Posting(txn_id=BALANCE_FORWARD, account_num=account_num, counterparty=account_num,
+                                    amount=amount, posted_at=posted_at))
+            else:
+                forward.amount += amount
+                forward.posted_at = max(forward.posted_at, posted_at)
+        session.execute(hot.delete().where(hot.c.id.in_(ids)), bind_arguments=bind_arguments)
+        session.commit()
+        moved += len(ids)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def archive_bind_arguments() -> Optional[dict]:
+    """bind_arguments sending archive queries to the archive database, None when the archive is in the default one
+    """
+    engine = archive_engine()
+    return {'bind': engine} if engine is not None else None
+
+
+@click.command('archive-transactions')
+@click.option('--days', type=int, default=None, help='Archive horizon in days, defaults to ARCHIVE_HORIZON_DAYS.')
+@click.option('--chunk-size', type=int, default=None, help='Rows moved per commit, defaults to ARCHIVE_CHUNK_SIZE.')
+@click.option('--pause', type=float, default=0, show_default=True, help='Seconds to sleep between chunks.')
+@with_appcontext
+def archive_command(days: Optional[int], chunk_size: Optional[int], pause: float) -> None:
+    """Move transactions older than the horizon into the archive."""
+    days = days if days is not None else current_app.config['ARCHIVE_HORIZON_DAYS']
+    chunk_size = chunk_size or current_app.config['ARCHIVE_CHUNK_SIZE']
+    moved = archive_transactions(timedelta(days=days), chunk_size, pause)
+    click.echo('Archived {} transaction(s) older than {} day(s)'.format(moved, days))
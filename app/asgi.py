@@ -0,0 +1,254 @@
+import json
+from contextlib import asynccontextmanager
+from http.cookies import SimpleCookie
+from typing import Optional
+from urllib.parse import parse_qs
+
+import sqlalchemy as sa
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from . import create_app, db
+from .api.routes import EXPORT_BATCH_SIZE
+from .api.serializers import serialize_balance, serialize_posting, transaction_type_names, csv_header, csv_rows, \
+    export_row
+from .ledger import history_query, balance_forward_query, history_count_query
+from .models import Accounts, ArchivedPosting, TransactionType
+from .replica import within_write_window
+from .sharding import Shard
+
+# asyncio DBAPI drivers by SQLAlchemy backend
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+
+def async_url(url) -> sa.engine.URL:
+    """Swaps the driver of a database URL for its asyncio counterpart, e.g. sqlite:// becomes sqlite+aiosqlite://
+    """
+    url = sa.engine.make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('No asyncio driver known for {} databases'.format(backend))
+    return url.set(drivername='{}+{}'.format(backend, ASYNC_DRIVERS[backend]))
+
+
+class AsyncReadApp:
+    """ASGI application serving the read-only API routes with async SQLAlchemy sessions
+        - Serves GET /api/balance, /api/history and /api/export.csv with the same JSON and CSV as the WSGI
+          routes of the api blueprint. Everything else stays with the WSGI app in webapp.py, the proxy in front
+          sends the read paths here.
+        - Users are authenticated with the Flask session cookie set by /auth/login, so both apps must share
+          SECRET_KEY. Remember-me cookies are not read: a user whose session expired gets a 401.
+        - Engines mirror the Flask-SQLAlchemy binds: account shards and the read replica,
+          which is used outside the user's read-your-writes window just like in RoutingSession
+        - In-memory SQLite databases are private to each connection and cannot be shared with the WSGI app
+
+    """
+
+    def __init__(self, flask_app) -> None:
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        shards = self.config.get('ACCOUNT_SHARDS')
+        self.shards = [Shard(*shard) for shard in shards] if shards else [Shard(None, 1, None)]
+        with flask_app.app_context():
+            urls = {bind_key: engine.url for bind_key, engine in db.engines.items()}
+        self.engines = {bind_key: create_async_engine(async_url(url)) for bind_key, url in urls.items()}
+        self.routes = {
+            '/api/balance': self.balance,
+            '/api/history': self.history,
+            '/api/export.csv': self.export,
+        }
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get(scope['path'])
+        if handler is None:
+            await self._send_json(send, 404, {'error': 'Not Found'})
+            return
+        if scope['method'] != 'GET':
+            await self._send_json(send, 405, {'error': 'Method Not Allowed'})
+            return
+        user_session = self.load_session(scope)
+        if '_user_id' not in user_session:
+            await self._send_json(send, 401, {'error': 'Unauthorized'})
+            return
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        await handler(int(user_session['_user_id']), user_session, query, send)
+
+    def load_session(self, scope) -> dict:
+        """Decodes the Flask session cookie of a request, an empty dict when it is missing, expired or tampered with
+        """
+        cookies = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookies.load(value.decode('latin-1'))
+        morsel = cookies.get(self.config['SESSION_COOKIE_NAME'])
+        if morsel is None or self.serializer is None:
+            return {}
+        try:
+            return self.serializer.loads(morsel.value, max_age=self.session_max_age)
+        except BadSignature:
+            return {}
+
+    def default_engine(self, user_session: dict):
+        """Engine of the default database for this user: the read replica unless they wrote recently
+        """
+        replica = self.config.get('READ_REPLICA_BIND')
+        window = self.config.get('READ_YOUR_WRITES_SECONDS', 0)
+        if replica and not within_write_window(user_session.get('last_write_at'), window):
+            return self.engines[replica]
+        return self.engines[None]
+
+    @asynccontextmanager
+    async def account_session(self, user_id: int, user_session: dict, query: dict):
+        """Yields one of the user's accounts and a session on the shard owning it
+            - ?account= picks the account, by default the lowest numbered one as in the WSGI routes, which takes one
+              query per shard
+
+        Yields:
+            Tuple[Optional[Accounts], AsyncSession]: account is None when the user has no account or does not own
+                the requested one
+        """
+        default = self.default_engine(user_session)
+        account_num = _int_arg(query, 'account', None)
+        if account_num is None:
+            for shard in self.shards:
+                engine = default if shard.bind_key is None else self.engines[shard.bind_key]
+                async with AsyncSession(engine) as session:
+                    first = (await session.execute(
+                        sa.select(sa.func.min(Accounts.account_num)).filter_by(owner=user_id))).scalar()
+                if first is not None and (account_num is None or first < account_num):
+                    account_num = first
+        shard = self.shard_for(account_num) if account_num is not None else None
+        engine = default if shard is None or shard.bind_key is None else self.engines[shard.bind_key]
+        async with AsyncSession(engine) as session:
+            account = None
+            if shard is not None:
+                account = (await session.execute(
+                    sa.select(Accounts).filter_by(account_num=account_num, owner=user_id))).scalar()
+            yield account, session
+
+    @asynccontextmanager
+    async def archive_session(self, account_num: int, session: AsyncSession):
+        """Yields a session reading the account's archived postings: the account's session, or one on the
+        ARCHIVE_BIND database for the default shard, as ledger.archive_bind_arguments_for
+        """
+        archive_bind = self.config.get('ARCHIVE_BIND')
+        shard = self.shard_for(account_num)
+        if not archive_bind or (shard is not None and shard.bind_key is not None):
+            yield session
+            return
+        async with AsyncSession(self.engines[archive_bind]) as archive:
+            yield archive
+
+    def shard_for(self, account_num: int) -> Optional[Shard]:
+        """Shard whose range contains the account number, as ShardRouter.shard_for
+        """
+        for shard in self.shards:
+            if shard.first <= account_num and (shard.last is None or account_num <= shard.last):
+                return shard
+        return None
+
+    async def type_names(self, user_session: dict) -> dict:
+        async with AsyncSession(self.default_engine(user_session)) as session:
+            return transaction_type_names(await session.execute(sa.select(TransactionType.id, TransactionType.name)))
+
+    async def balance(self, user_id: int, user_session: dict, query: dict, send) -> None:
+        async with self.account_session(user_id, user_session, query) as (account, session):
+            if account is None:
+                await self._send_json(send, 404, {'error': 'Not Found'})
+                return
+            balance = (await session.execute(sa.select(Accounts.total_balance).where(
+                Accounts.account_num == account.account_num))).scalar() if account.stripes else None
+            await self._send_json(send, 200, serialize_balance(account, balance))
+
+    async def history(self, user_id: int, user_session: dict, query: dict, send) -> None:
+        page = max(_int_arg(query, 'page', 1), 1)
+        per_page = self.config['TRANSACTIONS_PER_PAGE']
+        type_names = await self.type_names(user_session)
+        async with self.account_session(user_id, user_session, query) as (account, session):
+            if account is None:
+                await self._send_json(send, 404, {'error': 'Not Found'})
+                return
+            # Same fall-through into the archive as ledger.account_history
+            offset = (page - 1) * per_page
+            transactions = (await session.execute(
+                history_query(account.account_num).offset(offset).limit(per_page))).scalars().all()
+            if len(transactions) < per_page and (
+                    await session.execute(balance_forward_query(account.account_num))).first() is not None:
+                hot_count = offset + len(transactions) if transactions else (
+                    await session.execute(history_count_query(account.account_num))).scalar()
+                async with self.archive_session(account.account_num, session) as archive:
+                    transactions += (await archive.execute(
+                        history_query(account.account_num, ArchivedPosting).offset(max(offset - hot_count, 0))
+                        .limit(per_page - len(transactions)))).scalars().all()
+            await self._send_json(send, 200, {
+                'account_num': account.account_num,
+                'page': page,
+                'per_page': per_page,
+                'transactions': [serialize_posting(posting, type_names) for posting in transactions],
+            })
+
+    async def export(self, user_id: int, user_session: dict, query: dict, send) -> None:
+        """Streams the CSV export one batch of EXPORT_BATCH_SIZE rows at a time, archived postings last
+        """
+        type_names = await self.type_names(user_session)
+        async with self.account_session(user_id, user_session, query) as (account, session):
+            if account is None:
+                await self._send_json(send, 404, {'error': 'Not Found'})
+                return
+            disposition = 'attachment; filename=transactions-{}.csv'.format(account.account_num)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/csv; charset=utf-8'), (b'content-disposition', disposition.encode('latin-1'))]})
+            await send({'type': 'http.response.body', 'body': csv_header().encode('utf-8'), 'more_body': True})
+            await self._send_postings(send, session, history_query(account.account_num), type_names)
+            if (await session.execute(balance_forward_query(account.account_num))).first() is not None:
+                async with self.archive_session(account.account_num, session) as archive:
+                    await self._send_postings(send, archive, history_query(account.account_num, ArchivedPosting),
+                                              type_names)
+            await send({'type': 'http.response.body', 'body': b''})
+
+    async def _send_postings(self, send, session: AsyncSession, statement: sa.Select, type_names: dict) -> None:
+        result = await session.stream_scalars(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for batch in result.partitions():
+            rows = csv_rows(export_row(serialize_posting(posting, type_names)) for posting in batch)
+            await send({'type': 'http.response.body', 'body': rows.encode('utf-8'), 'more_body': True})
+
+    async def dispose(self) -> None:
+        for engine in self.engines.values():
+            await engine.dispose()
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _int_arg(query: dict, name: str, default: Optional[int]) -> Optional[int]:
+    try:
+        return int(query[name][0])
+    except (KeyError, ValueError):
+        return default
+
+
+def create_asgi_app(config_name: Optional[str] = None) -> AsyncReadApp:
+    """ASGI counterpart of create_app, run with e.g. `uvicorn asgi:app`
+    """
+    return AsyncReadApp(create_app(config_name or 'default'))
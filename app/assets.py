@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from collections import namedtuple
+from typing import Dict, Optional
+
+from flask import Response, current_app, request, send_file
+
+try:
+    import brotli
+except ImportError: # optional, assets are precompressed with gzip only
+    brotli = None
+
+Asset = namedtuple('Asset', ['path', 'mimetype', 'etag', 'encodings'])
+Asset.__doc__ = """Fingerprinted static file: absolute path, mimetype, content hash and precompressed bodies by Content-Encoding"""
+
+# Text formats worth compressing, smaller files are sent as they are
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.html')
+MIN_COMPRESS_BYTES = 256
+
+
+class AssetManifest:
+    """Content-hashed static files served with far-future caching
+        - At startup every file under the static folder is hashed and mapped to a fingerprinted name, e.g.
+          styles.css becomes styles.1a2b3c4d5e6f.css, and text files are gzip (and brotli, when the brotli package is
+          installed) compressed in memory
+        - url_for('static', filename='styles.css') builds the fingerprinted URL, templates are unchanged
+        - Fingerprinted URLs are served with Cache-Control: public, max-age=ASSET_MAX_AGE, immutable: a changed file
+          gets a new URL, so browsers never revalidate. Plain names are still served with Flask's default caching.
+        - Config:
+            - ASSET_FINGERPRINTING (bool): enables the manifest, off in development where files change under a
+              running server
+            - ASSET_MAX_AGE (int): Cache-Control max-age of fingerprinted files in seconds
+
+    """
+
+    def __init__(self) -> None:
+        self._names: Dict[str, str] = {}
+        self._assets: Dict[str, Asset] = {}
+
+    def init_app(self, app) -> None:
+        app.extensions['asset_manifest'] = self
+        if not app.config.get('ASSET_FINGERPRINTING') or not app.static_folder:
+            return
+        self.build(app.static_folder)
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = self.send
+
+    def build(self, static_folder: str) -> None:
+        """Hashes and precompresses every file of the static folder
+        """
+        names, assets = {}, {}
+        for directory, _, files in os.walk(static_folder):
+            for file in files:
+                path = os.path.join(directory, file)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                root, extension = os.path.splitext(filename)
+                fingerprinted = '{}.{}{}'.format(root, digest, extension)
+                names[filename] = fingerprinted
+                assets[fingerprinted] = Asset(path, mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                                              digest, self._compress(extension, content))
+        self._names, self._assets = names, assets
+
+    @staticmethod
+    def _compress(extension: str, content: bytes) -> Dict[str, bytes]:
+        if extension.lower() not in COMPRESSIBLE_EXTENSIONS or len(content) < MIN_COMPRESS_BYTES:
+            return {}
+        encodings = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encodings['br'] = brotli.compress(content)
+        return {encoding: body for encoding, body in encodings.items() if len(body) < len(content)}
+
+    def url_name(self, filename: str) -> str:
+        return self._names.get(filename, filename)
+
+    def _fingerprint(self, endpoint: str, values: dict) -> None:
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.url_name(values['filename'])
+
+    def _encoding(self, asset: Asset) -> Optional[str]:
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.encodings and request.accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def send(self, filename: str) -> Response:
+        """static endpoint: fingerprinted files with immutable caching, precompressed when the client accepts it,
+        other files through Flask's send_static_file
+        """
+        asset = self._assets.get(filename)
+        if asset is None:
+            return current_app.send_static_file(filename)
+        max_age = current_app.config['ASSET_MAX_AGE']
+        encoding = self._encoding(asset)
+        if encoding is None:
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=asset.etag, conditional=True, max_age=max_age)
+        else:
+            response = Response(asset.encodings[encoding], mimetype=asset.mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag('{}-{}'.format(asset.etag, encoding))
+            response.make_conditional(request)
+        if asset.encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+        return response
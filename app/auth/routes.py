@@ -1,11 +1,44 @@
-from flask import render_template, redirect, url_for, flash, request, Response
+from flask import render_template, redirect, url_for, flash, request, Response, jsonify
 from flask_login import current_user, login_user, logout_user, login_required
-from ..main.forms import RegistrationForm, LoginForm, TransferForm, DepositForm
-from app.models import User, Role, Accounts, Transactions, TransactionType
-from datetime import datetime
-from .. import db
+from ..main.forms import RegistrationForm, LoginForm, TransferForm, DepositForm, OpenAccountForm, ScheduleForm, \
+    CancelScheduleForm, DUPLICATE_EMAIL
+from app.models import User, Role, Accounts, Transactions, TransactionType, ScheduledTransfer
+from datetime import datetime, time
+from .. import db, fragment_cache, analytics_cache, balance_cache, shard_router, recipient_directory, event_broker, email_filter
+from ..notifications import notify_deposit
+from ..emails import normalize_email
 from . import auth
 from werkzeug.urls import url_parse
+from sqlalchemy.exc import IntegrityError
+
+
+def open_account(user) -> Accounts:
+    """Opens an account for a user with its "New Account" transaction and lists it in the recipient directory
+
+    Returns:
+        Accounts: the new account
+    """
+    user_acc = shard_router.create_account(user)
+    
+    txn_type_id = db.session.query(TransactionType.id).filter_by(name="New Account").scalar()
+    txn = Transactions(receiver=user_acc.account_num, sender=user_acc.account_num, amount=0, date_time=datetime.utcnow(), 
+                       transaction_type_id=txn_type_id)
+    
+    acc_session = shard_router.session_for(user_acc)
+    acc_session.add_all([txn, *txn.postings()])
+    acc_session.commit()
+    recipient_directory.add(user_acc.account_num, user.first_name, user.last_name)
+    return user_acc
+
+
+def own_account_choices(field, accounts) -> None:
+    """Fills a SelectField with the user's accounts. A form posted without the field uses the first account,
+    which is what single-account clients send.
+    """
+    field.choices = [(account.account_num, 'Account {} (balance {})'.format(account.account_num, account.total_balance))
+                     for account in accounts]
+    if field.data is None and accounts:
+        field.data = accounts[0].account_num
 
 
 @auth.route('/register', methods=['GET', 'POST'])
@@ -13,7 +46,8 @@ def register() -> Response:
     """User registration route
     1.) If user is logged in, redirects to index page
     2.) Upon validating registration form, stores user password hash, creates a User model and pushes into database. Then redirects to login
-    3.) If form validation fails, redirects back to register page.
+    3.) If form validation fails, or the email was registered concurrently and the unique index rejects the insert,
+        redirects back to register page.
 
     Returns:
         Response: login page if registration is successful else register page. If user is logged in then redirects to index.
@@ -22,27 +56,37 @@ def register() -> Response:
         return redirect(url_for('main.index'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        user = User(first_name=form.first_name.data, last_name=form.last_name.data, email=form.email.data) # Defaults role to user role 
+        user = User(first_name=form.first_name.data, last_name=form.last_name.data, email=normalize_email(form.email.data)) # Defaults role to user role 
         user.set_password(form.password.data)
         db.session.add(user)
-        db.session.commit()
-        
-        
-        user_acc = Accounts(account_owner=user)
-        db.session.add(user_acc)
-        db.session.commit()
-        
-        txn_type = TransactionType.query.filter_by(name="New Account").first()
-        txn = Transactions(receiver_account=user_acc, sender_account=user_acc, amount=0, date_time=datetime.utcnow(), 
-                           transaction_type=txn_type)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            form.email.errors.append(DUPLICATE_EMAIL)
+            return render_template('auth/register.html', form=form)
+        email_filter.add(user.email)
         
-        db.session.add(txn)
-        db.session.commit()
+        open_account(user)
         flash('Congratulations, you are now a registered user! Please login')
         return redirect(url_for('auth.login'))
     return render_template('auth/register.html', form=form)
 
 
+@auth.route('/email-available')
+def email_available() -> Response:
+    """Live validation of the registration form's email field
+        - ?email= is checked against the in-process email filter, the users table is only queried when the filter
+          cannot rule the address out
+        - Advisory only, registration itself relies on the unique index
+
+    Returns:
+        Response: JSON with available, false for an address already registered
+    """
+    email = request.args.get('email', '').strip()
+    return jsonify(email=email, available=bool(email) and not email_filter.registered(email))
+
+
 @auth.route('/login', methods=['GET', 'POST'])
 def login() -> Response:
     """User login route
@@ -58,7 +102,7 @@ def login() -> Response:
         return redirect(url_for('main.index'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.query.filter(db.func.lower(User.email) == normalize_email(form.email.data)).first()
         if user is None or not user.check_password(form.password.data):
             flash('Invalid email or password', 'error')
             return redirect(url_for('auth.login'))
@@ -85,57 +129,149 @@ def logout() -> Response:
 @auth.route('/transfer',  methods=['GET', 'POST'])
 @login_required
 def transfer() -> Response:
-    """Sending money from own balance to other accounts in the same database
+    """Sending money from one of the user's accounts to another account, on the same or another account shard
 
     Returns:
         Response: index page
     """
     form = TransferForm()
+    accounts = {account.account_num: account for account in shard_router.find_accounts_by_owner(current_user.id)}
+    own_account_choices(form.from_account, list(accounts.values()))
     if form.validate_on_submit():
-        recipient_acc = Accounts.query.filter_by(account_num=form.recipient_acc_num.data).first()
-        # recipient_acc_num = recipient_acc.account_num
-        sender_acc = Accounts.query.filter_by(owner=current_user.id).first()
-        # sender_acc_num = sender_acc.account_num
+        recipient_acc = shard_router.get_account(form.recipient_acc_num.data)
+        sender_acc = accounts[form.from_account.data]
         if recipient_acc is None:
             flash('User not found', 'danger')
             return redirect(url_for('auth.transfer'))
-        elif sender_acc.balance < form.amount.data:
+        elif recipient_acc.account_num == sender_acc.account_num:
+            flash('Choose a different account to send to', 'danger')
+            return redirect(url_for('auth.transfer'))
+        elif sender_acc.total_balance < form.amount.data:
             flash('Insufficient account balance', 'danger')
             return redirect(url_for('auth.transfer'))
         else:
-            recipient_acc.update_balance(form.amount.data)
-            sender_acc.update_balance(-form.amount.data)
-            
-            txn_type = TransactionType.query.filter_by(name="Transfer").first()
-            txn = Transactions(receiver_account=recipient_acc, sender_account=sender_acc, amount=form.amount.data, date_time=datetime.utcnow(), transaction_type=txn_type)
-            db.session.add_all([recipient_acc, sender_acc, txn])
-            db.session.commit()
+            txn_type_id = db.session.query(TransactionType.id).filter_by(name="Transfer").scalar()
+            shard_router.transfer(sender_acc, recipient_acc, form.amount.data, txn_type_id, commit=False)
+            for session in {shard_router.session_for(sender_acc), shard_router.session_for(recipient_acc)}:
+                session.commit()
+            fragment_cache.invalidate(recipient_acc.account_num, sender_acc.account_num)
+            analytics_cache.invalidate(recipient_acc.account_num, sender_acc.account_num)
+            balance_cache.refresh(sender_acc.account_num, recipient_acc.account_num)
+            event_broker.wake()
             flash('Transfer Success!', 'success')
             return redirect(url_for('main.index'))
     return render_template('auth/transfer.html', title='Funds Transfer', form=form)
 
 
+@auth.route('/recipients')
+@login_required
+def recipients() -> Response:
+    """Recipient lookup for the transfer form
+        - ?q= returns the accounts whose owner's first name, last name, full name or account number starts with q
+        - ?account= returns the one account with that number, used to confirm the recipient before submitting
+
+    Returns:
+        Response: JSON list of {account_num, name} under results
+    """
+    account_num = request.args.get('account', type=int)
+    if account_num is not None:
+        recipient = recipient_directory.get(account_num)
+        return jsonify(results=[recipient] if recipient else [])
+    return jsonify(results=recipient_directory.search(request.args.get('q', '')))
+
+
 @auth.route('/deposit',  methods=['GET', 'POST'])
 @login_required
 def deposit() -> Response:
     """Deposit function mimicking cash deposit feature
-        - Upon form validation, adds amount into user account balance, creates a corresponding transaction
+        - Upon form validation, adds amount into the selected account's balance, creates a corresponding transaction
         and pushes into database
     Returns:
         Response: main.index.html if successful else auth/deposit.html
     """
     form = DepositForm()
+    accounts = {account.account_num: account for account in shard_router.find_accounts_by_owner(current_user.id)}
+    own_account_choices(form.account, list(accounts.values()))
     if form.validate_on_submit():
-        acc_owner = User.query.filter_by(email=current_user.email).first()
-        own_account = Accounts.query.filter_by(owner=acc_owner.id).first()
+        own_account = accounts[form.account.data]
         own_account.update_balance(form.amount.data)
         
-        txn_type = TransactionType.query.filter_by(name="Deposit").first()
-        txn = Transactions(receiver_account=own_account, sender_account=own_account, amount=form.amount.data, date_time=datetime.utcnow(), transaction_type=txn_type)
-        db.session.add_all([own_account, txn])
-        
-        db.session.commit()
+        txn_type_id = db.session.query(TransactionType.id).filter_by(name="Deposit").scalar()
+        txn = Transactions(receiver=own_account.account_num, sender=own_account.account_num, amount=form.amount.data, date_time=datetime.utcnow(), transaction_type_id=txn_type_id)
+        acc_session = shard_router.session_for(own_account)
+        acc_session.add_all([own_account, txn, *txn.postings()])
+        notify_deposit(own_account, form.amount.data)
+        acc_session.commit()
+        fragment_cache.invalidate(own_account.account_num)
+        analytics_cache.invalidate(own_account.account_num)
+        balance_cache.refresh(own_account.account_num)
+        event_broker.wake()
         flash('Deposit Success!', 'success')
         return redirect(url_for('main.index'))
     return render_template('auth/deposit.html', title='Deposit', form=form)
-        
\ No newline at end of file
+
+
+@auth.route('/open-account', methods=['GET', 'POST'])
+@login_required
+def open_additional_account() -> Response:
+    """Opens another account for the logged in user
+
+    Returns:
+        Response: main.index.html showing the new account if successful else auth/open_account.html
+    """
+    form = OpenAccountForm()
+    if form.validate_on_submit():
+        account = open_account(current_user)
+        flash('Account {} opened'.format(account.account_num), 'success')
+        return redirect(url_for('main.index', account=account.account_num))
+    return render_template('auth/open_account.html', title='Open Account', form=form)
+
+
+@auth.route('/schedules', methods=['GET', 'POST'])
+@login_required
+def schedules() -> Response:
+    """Standing orders of the logged in user
+        - Lists the active orders and sets up new ones, executed by the `flask run-schedules` worker
+        - The first run is due at the start of start_date (UTC)
+
+    Returns:
+        Response: auth/schedules.html
+    """
+    form = ScheduleForm()
+    accounts = shard_router.find_accounts_by_owner(current_user.id)
+    own_account_choices(form.from_account, accounts)
+    if form.validate_on_submit():
+        if shard_router.get_account(form.recipient_acc_num.data) is None:
+            flash('User not found', 'danger')
+        elif form.recipient_acc_num.data == form.from_account.data:
+            flash('Choose a different account to send to', 'danger')
+        elif form.start_date.data < datetime.utcnow().date():
+            flash('The first transfer cannot be in the past', 'danger')
+        else:
+            db.session.add(ScheduledTransfer(owner=current_user.id, sender=form.from_account.data,
+                                             receiver=form.recipient_acc_num.data, amount=form.amount.data,
+                                             interval_days=form.interval_days.data or None,
+                                             next_run_at=datetime.combine(form.start_date.data, time.min)))
+            db.session.commit()
+            flash('Transfer scheduled', 'success')
+            return redirect(url_for('auth.schedules'))
+    orders = ScheduledTransfer.query.filter_by(owner=current_user.id, active=True) \
+        .order_by(ScheduledTransfer.next_run_at).all()
+    return render_template('auth/schedules.html', title='Scheduled Transfers', form=form, orders=orders,
+                           cancel_form=CancelScheduleForm())
+
+
+@auth.route('/schedules/<int:schedule_id>/cancel', methods=['POST'])
+@login_required
+def cancel_schedule(schedule_id: int) -> Response:
+    """Cancels one of the logged in user's standing orders
+
+    Returns:
+        Response: auth/schedules.html
+    """
+    order = ScheduledTransfer.query.filter_by(id=schedule_id, owner=current_user.id).first_or_404()
+    if CancelScheduleForm().validate_on_submit():
+        order.active = False
+        db.session.commit()
+        flash('Scheduled transfer cancelled', 'success')
+    return redirect(url_for('auth.schedules'))
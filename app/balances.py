@@ -0,0 +1,193 @@
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import current_app
+
+BalanceEntry = namedtuple('BalanceEntry', ['version', 'balance', 'latest_posting_id', 'cached_at'])
+BalanceEntry.__doc__ = """Cached balance of an account
+    - version (int): id of the account's latest posting when the balance was read, 0 without postings. Every
+      transaction of the account adds a posting with a higher id, so a larger version is a later state.
+    - balance (float): Accounts.total_balance
+    - latest_posting_id (int): None without postings
+    - cached_at (float): time.time() when the entry was stored
+"""
+
+
+class MemoryBalanceBackend:
+    """In-process LRU of balance entries, every worker keeps its own
+        - put() keeps the cached entry when it has a higher version than the new one
+
+    Args:
+        max_entries (int): entries kept, least recently used ones are evicted beyond it
+    """
+
+    def __init__(self, max_entries: int = 100000) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, account_num: int) -> Optional[BalanceEntry]:
+        with self._lock:
+            entry = self._entries.get(account_num)
+            if entry is not None:
+                self._entries.move_to_end(account_num)
+            return entry
+
+    def put(self, account_num: int, entry: BalanceEntry) -> bool:
+        """Stores entry unless a newer version is cached
+
+        Returns:
+            bool: whether the entry was stored
+        """
+        with self._lock:
+            cached = self._entries.get(account_num)
+            if cached is not None and cached.version > entry.version:
+                return False
+            self._entries[account_num] = entry
+            self._entries.move_to_end(account_num)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedBalanceBackend:
+    """Balance entries in a store every worker reads and writes, so one worker's write-through is seen by all
+        - Served by a SQLite database, a local stand-in for a shared cache server: workers on one host share the
+          file given by BALANCE_CACHE_URL
+        - put() compares versions inside its single upsert, a worker holding an older balance cannot overwrite a
+          newer one stored concurrently by another worker
+
+    Args:
+        url (str): SQLAlchemy URL of the store, created on first use
+    """
+
+    def __init__(self, url: str) -> None:
+        self.engine = sa.create_engine(url)
+        self.table = sa.Table(
+            'balance_cache', sa.MetaData(),
+            sa.Column('account_num', sa.Integer, primary_key=True),
+            sa.Column('version', sa.Integer, nullable=False),
+            sa.Column('balance', sa.Float),
+            sa.Column('latest_posting_id', sa.Integer),
+            sa.Column('cached_at', sa.Float, nullable=False))
+        self.table.create(self.engine, checkfirst=True)
+
+    def get(self, account_num: int) -> Optional[BalanceEntry]:
+        with self.engine.connect() as connection:
+            row = connection.execute(sa.select(self.table.c.version, self.table.c.balance,
+                                               self.table.c.latest_posting_id, self.table.c.cached_at)
+                                     .where(self.table.c.account_num == account_num)).first()
+        return None if row is None else BalanceEntry(*row)
+
+    def put(self, account_num: int, entry: BalanceEntry) -> bool:
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(self.table).values(account_num=account_num, **entry._asdict())
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.table.c.account_num], set_=entry._asdict(),
+            where=self.table.c.version <= statement.excluded.version)
+        with self.engine.begin() as connection:
+            return connection.execute(statement).rowcount > 0
+
+    def clear(self) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(self.table.delete())
+
+
+BACKENDS = {
+    'memory': lambda config: MemoryBalanceBackend(config['BALANCE_CACHE_MAX_ENTRIES']),
+    'shared': lambda config: SharedBalanceBackend(config['BALANCE_CACHE_URL']),
+}
+
+
+class BalanceCache:
+    """Balances and latest posting ids of accounts, read for display without a query per request
+        - A miss reads the balance and the latest posting id in one statement from the primary, so the entry is
+          one committed state of the account, versioned by its latest posting id
+        - Writers call refresh() after their commit: the committed state is read back and stored unless a newer
+          version is already cached. A request that loaded an older state before the commit cannot overwrite it.
+        - Nothing is stored while a session holds flushed but uncommitted writes, a commit that then fails cannot
+          leave its balance in the cache
+        - Balances deciding a write, like the transfer funds check, are read from the database, not from here
+        - Config:
+            - BALANCE_CACHE_BACKEND (str): 'memory', 'shared' or None to read every balance from the database, from
+              the read replica in read-only views
+            - BALANCE_CACHE_MAX_ENTRIES (int): accounts kept by the memory backend
+            - BALANCE_CACHE_URL (str): database of the shared backend
+            - BALANCE_CACHE_TTL_SECONDS (float): age after which an entry is read again, it bounds how long a
+              memory backend misses writes made by other workers. 0 keeps entries until the next write.
+
+    """
+
+    def __init__(self) -> None:
+        self.backend = None
+
+    def init_app(self, app) -> None:
+        name = app.config.get('BALANCE_CACHE_BACKEND')
+        self.backend = BACKENDS[name](app.config) if name else None
+        app.extensions['balance_cache'] = self
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def get(self, account_num: int) -> Optional[BalanceEntry]:
+        """Balance of an account, from the cache when it holds a fresh entry
+
+        Returns:
+            Optional[BalanceEntry]: None when the account does not exist
+        """
+        if self.backend is not None:
+            entry = self.backend.get(account_num)
+            ttl = current_app.config['BALANCE_CACHE_TTL_SECONDS']
+            if entry is not None and (not ttl or time.time() - entry.cached_at < ttl):
+                return entry
+        return self._load(account_num)
+
+    def refresh(self, *account_nums: int) -> None:
+        """Stores the committed balances of accounts, called by writers after their commit"""
+        for account_num in account_nums:
+            self._load(account_num)
+
+    def _load(self, account_num: int) -> Optional[BalanceEntry]:
+        from . import shard_router
+        from .models import Accounts
+        from .ledger import latest_posting_query
+        shard = shard_router.shard_for(account_num)
+        if shard is None:
+            return None
+        session = shard_router.session(shard)
+        latest = latest_posting_query(account_num).scalar_subquery()
+        # Entries outlive the request, they are not filled from a replica that may lag behind
+        row = session.execute(sa.select(Accounts.total_balance, latest).where(Accounts.account_num == account_num)
+                              .execution_options(primary=self.backend is not None)).first()
+        if row is None:
+            return None
+        entry = BalanceEntry(row[1] or 0, row[0], row[1], time.time())
+        if self.backend is not None and not has_uncommitted_writes(session):
+            self.backend.put(account_num, entry)
+        return entry
+
+
+def has_uncommitted_writes(session) -> bool:
+    return bool(session.new or session.dirty or session.deleted or session.info.get('flushed_writes'))
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_flush')
+def _flushed(session, flush_context) -> None:
+    session.info['flushed_writes'] = True
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+@sa.event.listens_for(sa.orm.Session, 'after_rollback')
+def _ended(session) -> None:
+    session.info.pop('flushed_writes', None)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+
+class FragmentCache:
+    """In-process LRU cache for rendered HTML fragments
+        - One entry per account holding the rendered transaction history
+        - Entries are stamped with the account's latest transaction id, so a lookup with a newer id is a miss
+        - Least recently used entries are evicted once either the entry count or the memory cap is exceeded
+        - Config, under another prefix for a cache made with config_prefix:
+            - FRAGMENT_CACHE_MAX_ENTRIES (int): maximum number of cached fragments, 0 disables the cache
+            - FRAGMENT_CACHE_MAX_BYTES (int): maximum total size of the cached fragments in bytes
+
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024,
+                 config_prefix: str = 'FRAGMENT_CACHE') -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.config_prefix = config_prefix
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def init_app(self, app) -> None:
+        self.max_entries = app.config.get(self.config_prefix + '_MAX_ENTRIES', self.max_entries)
+        self.max_bytes = app.config.get(self.config_prefix + '_MAX_BYTES', self.max_bytes)
+        self.clear()
+        app.extensions[self.config_prefix.lower()] = self
+
+    def get(self, account_num: int, latest_txn_id: Optional[int]) -> Optional[str]:
+        """Returns the cached fragment of an account if it was rendered at the given latest transaction id
+
+        Args:
+            account_num (int): account number the fragment belongs to
+            latest_txn_id (int): id of the account's most recent transaction
+
+        Returns:
+            Optional[str]: rendered fragment, None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(account_num)
+            if entry is None or entry[0] != latest_txn_id:
+                return None
+            self._entries.move_to_end(account_num)
+            return entry[1]
+
+    def set(self, account_num: int, latest_txn_id: Optional[int], fragment: str) -> None:
+        """Stores a rendered fragment, evicting least recently used entries beyond the caps
+
+        Args:
+            account_num (int): account number the fragment belongs to
+            latest_txn_id (int): id of the account's most recent transaction when the fragment was rendered
+            fragment (str): rendered HTML
+        """
+        size = len(fragment.encode('utf-8'))
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(account_num)
+            self._entries[account_num] = (latest_txn_id, fragment, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def invalidate(self, *account_nums: int) -> None:
+        """Drops the cached fragments of the given accounts. Called after a write touches either side of a transaction.
+        """
+        with self._lock:
+            for account_num in account_nums:
+                self._discard(account_num)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _discard(self, account_num: int) -> None:
+        entry = self._entries.pop(account_num, None)
+        if entry is not None:
+            self._size -= entry[2]
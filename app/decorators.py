@@ -0,0 +1,17 @@
+from functools import wraps
+
+from flask import abort
+from flask_login import current_user, login_required
+
+
+def staff_required(view):
+    """Restricts a view to logged in staff, see User.is_staff. Anonymous users are sent to the login page, other
+    users get a 403.
+    """
+    @wraps(view)
+    @login_required
+    def decorated(*args, **kwargs):
+        if not current_user.is_staff:
+            abort(403)
+        return view(*args, **kwargs)
+    return decorated
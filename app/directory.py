@@ -0,0 +1,202 @@
+import time
+from array import array
+from bisect import bisect_left
+from threading import Lock, Thread
+from typing import List, Optional
+
+import sqlalchemy as sa
+from flask import current_app
+
+from . import db
+
+
+class RecipientDirectory:
+    """In-process prefix index of transfer recipients, searched by first name, last name, full name or account number
+        - Keys are kept in one sorted list with a parallel array of account numbers, so a lookup is a binary search
+          to the first key with the prefix followed by a scan of at most a few keys per result
+        - Loaded from the database on the first lookup, then refreshed incrementally: accounts numbered above the
+          last one indexed on each shard are added, which picks up users registered through other workers
+        - The registering worker adds its new account straight away with add()
+        - Lookups never wait for a refresh: a lookup finding the index due starts the refresh in a background
+          thread and searches the index as it is, only the very first load runs in the lookup itself
+        - Results only expose the first name and the initial of the last name
+        - Config:
+            - RECIPIENT_DIRECTORY_REFRESH_SECONDS (int): minimum interval between incremental refreshes
+            - RECIPIENT_DIRECTORY_MAX_RESULTS (int): results returned per lookup
+            - RECIPIENT_DIRECTORY_PRELOAD (bool): load the index in a background thread at startup instead of on
+              the first lookup, which takes tens of seconds at a million users
+
+    """
+
+    # Above this many new keys the lists are re-sorted in one go instead of inserting key by key
+    BULK_LOAD_KEYS = 1000
+    # Accounts this far below a shard's watermark are scanned again, catching inserts that committed out of order
+    WATERMARK_OVERLAP = 100
+    # Accounts read per round trip while loading, bounds the memory used on top of the index itself
+    LOAD_BATCH_SIZE = 20000
+    # Owner ids per IN query, keeps SQLite under its variable limit
+    IN_BATCH_SIZE = 900
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self.clear()
+
+    def init_app(self, app) -> None:
+        self.clear()
+        app.extensions['recipient_directory'] = self
+        if app.config.get('RECIPIENT_DIRECTORY_PRELOAD'):
+            Thread(target=self._preload, args=(app,), name='recipient-directory', daemon=True).start()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = []
+            self._accounts = array('q')
+            self._names = {}
+            self._watermarks = {}
+            self._refreshed_at = None
+            self._refresh_thread = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, account_num: int, first_name: str, last_name: str) -> None:
+        """Indexes one account, a no-op when it is already indexed
+        """
+        with self._lock:
+            self._insert([(account_num, first_name, last_name)])
+
+    def get(self, account_num: int) -> Optional[dict]:
+        """Exact lookup of an account, used to confirm a recipient before a transfer
+        """
+        self._refresh_if_due()
+        name = self._names.get(account_num)
+        return {'account_num': account_num, 'name': name} if name is not None else None
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[dict]:
+        """Accounts having a key that starts with the query, case insensitive
+
+        Args:
+            query (str): name or account number prefix
+            limit (int): maximum number of results, defaults to RECIPIENT_DIRECTORY_MAX_RESULTS
+
+        Returns:
+            List[dict]: account_num and display name of each match, shortest keys first
+        """
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return []
+        limit = limit or current_app.config['RECIPIENT_DIRECTORY_MAX_RESULTS']
+        self._refresh_if_due()
+        results = []
+        seen = set()
+        with self._lock:
+            index = bisect_left(self._keys, prefix)
+            while index < len(self._keys) and len(results) < limit and self._keys[index].startswith(prefix):
+                account_num = self._accounts[index]
+                if account_num not in seen:
+                    seen.add(account_num)
+                    results.append({'account_num': account_num, 'name': self._names[account_num]})
+                index += 1
+        return results
+
+    def refresh(self) -> int:
+        """Indexes the accounts opened since the last refresh on every shard
+
+        Returns:
+            int: number of accounts added
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        from .models import Accounts, User
+        shard_router = current_app.extensions['shard_router']
+        added = 0
+        for shard in shard_router.shards:
+            watermark = self._watermarks.get(shard.bind_key, 0)
+            result = shard_router.session(shard).execute(
+                sa.select(Accounts.account_num, Accounts.owner).where(Accounts.account_num > watermark - self.WATERMARK_OVERLAP)
+                .order_by(Accounts.account_num).execution_options(yield_per=self.LOAD_BATCH_SIZE))
+            entries = []
+            for accounts in result.partitions():
+                # The users table is on the default database, a shard's accounts cannot be joined to it
+                owners = sorted({owner for _, owner in accounts if owner is not None})
+                users = {}
+                for i in range(0, len(owners), self.IN_BATCH_SIZE):
+                    users.update((user.id, user) for user in db.session.execute(
+                        sa.select(User.id, User.first_name, User.last_name)
+                        .where(User.id.in_(owners[i:i + self.IN_BATCH_SIZE]))))
+                entries += [(account_num, users[owner].first_name, users[owner].last_name)
+                            for account_num, owner in accounts if owner in users]
+                watermark = max(watermark, accounts[-1].account_num)
+            with self._lock:
+                added += self._insert(entries)
+                self._watermarks[shard.bind_key] = max(self._watermarks.get(shard.bind_key, 0), watermark)
+        self._refreshed_at = time.monotonic()
+        return added
+
+    def _refresh_if_due(self) -> None:
+        interval = current_app.config['RECIPIENT_DIRECTORY_REFRESH_SECONDS']
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        if self._refreshed_at is None:
+            # Nothing to search yet, the first load runs in the lookup unless a preload thread holds the lock
+            try:
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+            return
+        try:
+            self._refresh_thread = Thread(target=self._background_refresh, args=(current_app._get_current_object(),),
+                                          name='recipient-directory', daemon=True)
+            self._refresh_thread.start()
+        except RuntimeError:
+            self._refresh_lock.release()
+            raise
+
+    def _background_refresh(self, app) -> None:
+        """Incremental refresh started by a lookup, which releases the refresh lock taken for it
+        """
+        try:
+            with app.app_context():
+                try:
+                    self._refresh()
+                except sa.exc.SQLAlchemyError:
+                    app.logger.exception('Recipient directory refresh failed')
+        finally:
+            self._refresh_lock.release()
+
+    def _preload(self, app) -> None:
+        with app.app_context():
+            try:
+                self.refresh()
+            except sa.exc.SQLAlchemyError:
+                app.logger.exception('Recipient directory preload failed')
+
+    def _insert(self, entries: list) -> int:
+        """Adds (account_num, first_name, last_name) entries, caller holds the lock
+        """
+        new = []
+        for account_num, first_name, last_name in entries:
+            if account_num in self._names:
+                continue
+            first_name, last_name = (first_name or '').strip(), (last_name or '').strip()
+            self._names[account_num] = '{} {}.'.format(first_name, last_name[:1]) if last_name else first_name
+            for key in {first_name.lower(), last_name.lower(), ' '.join([first_name, last_name]).lower(),
+                        str(account_num)}:
+                if key:
+                    new.append((key, account_num))
+        if len(new) > self.BULK_LOAD_KEYS:
+            # One sort instead of an O(n) list insert per key
+            pairs = sorted(list(zip(self._keys, self._accounts)) + new)
+            self._keys = [key for key, _ in pairs]
+            self._accounts = array('q', (account_num for _, account_num in pairs))
+        else:
+            for key, account_num in new:
+                index = bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._accounts.insert(index, account_num)
+        return len({account_num for _, account_num in new})
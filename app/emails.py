@@ -0,0 +1,175 @@
+import hashlib
+import math
+import time
+from threading import Lock, Thread
+from typing import Iterable
+
+import sqlalchemy as sa
+from flask import current_app
+
+from . import db
+
+
+def normalize_email(email: str) -> str:
+    """Form of an address that is stored and compared: surrounding spaces removed and lower-cased
+    """
+    return (email or '').strip().lower()
+
+
+class BloomFilter:
+    """Fixed-size probabilistic set: contains() never misses an added key, and wrongly reports an absent key with
+    probability error_rate while at most capacity keys were added
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing: two 64 bit halves of one digest generate every probe
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        """Sets the key's bits, count only goes up when one of them was unset so re-adding a key is free"""
+        new = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        self.count += new
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class EmailFilter:
+    """In-process Bloom filter over registered email addresses, answering most "is this email free" checks
+    without a query
+        - might_exist() returning False means the address is not registered, True means the users table has to
+          be asked, which happens for registered addresses and about EMAIL_FILTER_ERROR_RATE of the others
+        - Built from the users table on the first check, then refreshed incrementally: users with an id above the
+          last one loaded are added, which picks up registrations made by other workers
+        - The registering worker adds the new address straight away with add()
+        - Addresses are compared lower-cased, by the filter and by the users table query behind it, so a registered
+          address in another case is taken as well. Registration stores them lower-cased and the unique index on
+          lower(email) also covers addresses stored before.
+        - The unique index on lower(users.email) stays the authority: a registration racing another worker's is
+          rejected by the insert, not by the filter
+        - Config:
+            - EMAIL_FILTER_CAPACITY (int): addresses the filter is sized for, it is rebuilt twice as large once it
+              holds more
+            - EMAIL_FILTER_ERROR_RATE (float): share of unregistered addresses still checked against the table
+            - EMAIL_FILTER_REFRESH_SECONDS (int): minimum interval between incremental refreshes
+            - EMAIL_FILTER_PRELOAD (bool): build the filter in a background thread at startup
+
+    """
+
+    # Users this far below the watermark are read again, catching inserts that committed out of order
+    WATERMARK_OVERLAP = 100
+    # Users read per round trip while loading
+    LOAD_BATCH_SIZE = 20000
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self.clear()
+
+    def init_app(self, app) -> None:
+        self.clear()
+        app.extensions['email_filter'] = self
+        if app.config.get('EMAIL_FILTER_PRELOAD'):
+            Thread(target=self._preload, args=(app,), name='email-filter', daemon=True).start()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filter = None
+            self._watermark = 0
+            self._refreshed_at = None
+
+    def add(self, email: str) -> None:
+        """Records a registered address, a no-op until the filter is built, which then reads it from the table
+        """
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(normalize_email(email))
+
+    def might_exist(self, email: str) -> bool:
+        """False when the address is certainly not registered, True when it may be
+
+        Args:
+            email (str): address to check
+
+        Returns:
+            bool: whether the users table has to be queried
+        """
+        self._refresh_if_due()
+        bloom = self._filter
+        return bloom is None or normalize_email(email) in bloom
+
+    def registered(self, email: str) -> bool:
+        """Whether an address belongs to a user in any case, only queries the users table when the filter cannot
+        rule it out
+        """
+        from .models import User
+        if not self.might_exist(email):
+            return False
+        return db.session.execute(sa.select(User.id).where(sa.func.lower(User.email) == normalize_email(email))
+                                  .limit(1)).first() is not None
+
+    def refresh(self) -> int:
+        """Adds the users registered since the last refresh, building the filter on the first call
+
+        Returns:
+            int: number of addresses added
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        from .models import User
+        config = current_app.config
+        if self._filter is None or self._filter.count > self._filter.capacity:
+            total = db.session.execute(sa.select(sa.func.count(User.id))).scalar()
+            capacity = config['EMAIL_FILTER_CAPACITY']
+            bloom = BloomFilter(capacity if total <= capacity else 2 * total, config['EMAIL_FILTER_ERROR_RATE'])
+            watermark = 0
+        else:
+            bloom, watermark = self._filter, self._watermark
+        result = db.session.execute(
+            sa.select(User.id, User.email).where(User.id > watermark - self.WATERMARK_OVERLAP).order_by(User.id)
+            .execution_options(yield_per=self.LOAD_BATCH_SIZE))
+        added = 0
+        for users in result.partitions():
+            with self._lock:
+                for _, email in users:
+                    if email:
+                        bloom.add(normalize_email(email))
+                        added += 1
+            watermark = max(watermark, users[-1].id)
+        with self._lock:
+            self._filter, self._watermark = bloom, watermark
+        self._refreshed_at = time.monotonic()
+        return added
+
+    def _refresh_if_due(self) -> None:
+        interval = current_app.config['EMAIL_FILTER_REFRESH_SECONDS']
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < interval:
+            return
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+
+    def _preload(self, app) -> None:
+        with app.app_context():
+            try:
+                self.refresh()
+            except sa.exc.SQLAlchemyError:
+                app.logger.exception('Email filter preload failed')
@@ -0,0 +1,165 @@
+import queue
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, Optional, Set
+
+import sqlalchemy as sa
+from flask import current_app
+
+from . import db
+from .models import Accounts, Posting, TransactionType
+from .ledger import BALANCE_FORWARD
+
+
+class Subscription:
+    """Events of a set of accounts, read by one SSE stream"""
+
+    def __init__(self, account_nums: Iterable[int]) -> None:
+        self.account_nums = frozenset(account_nums)
+        self.events = queue.Queue()
+
+    def get(self, timeout: float) -> Optional[dict]:
+        """Next event, None when nothing arrived within timeout"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """In-process pub/sub of new postings, feeding the live dashboard's server-sent events
+        - Each open stream subscribes to its user's accounts and waits on its own queue, an idle stream costs a
+          blocked thread and no queries
+        - One watcher thread per process, running only while there are subscribers, notices commits made by any
+          worker: on SQLite it polls PRAGMA data_version, which changes when another connection commits, on other
+          databases the newest posting id. Only when something changed are the new postings of subscribed accounts
+          read, in one query per shard, and fanned out to the subscribers' queues.
+        - wake() makes the watcher check right away, called by the routes after committing so the writing worker's
+          own subscribers do not wait for the next poll
+        - Needs a database other connections can see: an in-memory SQLite database is private to its connection
+        - Config:
+            - EVENTS_POLL_SECONDS (float): interval between data_version polls
+            - EVENTS_KEEPALIVE_SECONDS (float): interval of the comments keeping idle streams open
+
+    """
+
+    def __init__(self, poll: float = 1.0) -> None:
+        self.poll = poll
+        self._lock = Lock()
+        self._wake = Event()
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._thread = None
+
+    def init_app(self, app) -> None:
+        self.poll = app.config.get('EVENTS_POLL_SECONDS', self.poll)
+        app.extensions['event_broker'] = self
+
+    def subscribe(self, account_nums: Iterable[int]) -> Subscription:
+        """Registers a subscription and starts the watcher if it is not running, needs an app context
+        """
+        subscription = Subscription(account_nums)
+        with self._lock:
+            for account_num in subscription.account_nums:
+                self._subscribers.setdefault(account_num, set()).add(subscription)
+            if self._thread is None:
+                ready = Event()
+                self._thread = Thread(target=self._watch, args=(current_app._get_current_object(), ready),
+                                      name='event-broker', daemon=True)
+                self._thread.start()
+                ready.wait(self.poll) # postings committed once subscribe() returned are not missed
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for account_num in subscription.account_nums:
+                subscribers = self._subscribers.get(account_num, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscribers.pop(account_num, None)
+
+    def publish(self, account_num: int, event: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscribers.get(account_num, ()))
+        for subscription in subscriptions:
+            subscription.events.put(event)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _watch(self, app, ready: Event) -> None:
+        from .api.serializers import serialize_posting, transaction_type_names
+        from . import shard_router
+        with app.app_context():
+            type_names = transaction_type_names(db.session.execute(sa.select(TransactionType.id, TransactionType.name)))
+            db.session.remove()
+            engines = {db.engines[shard.bind_key] for shard in shard_router.shards}
+            cursors = [_Cursor(engine) for engine in engines]
+            ready.set()
+            try:
+                while True:
+                    self._wake.wait(self.poll)
+                    self._wake.clear()
+                    with self._lock:
+                        if not self._subscribers:
+                            self._thread = None
+                            return
+                        account_nums = list(self._subscribers)
+                    for cursor in cursors:
+                        for row in cursor.new_postings(account_nums):
+                            self.publish(row.account_num, {'account_num': row.account_num, 'balance': row.balance,
+                                                           'transaction': serialize_posting(row, type_names)})
+            except Exception:
+                with self._lock:
+                    self._thread = None
+                app.logger.exception('Event broker watcher stopped')
+            finally:
+                for cursor in cursors:
+                    cursor.close()
+
+
+class _Cursor:
+    """Watcher position in one database: a dedicated connection, its last data_version and the newest posting id
+    already published. The connection never stays in a transaction, so every poll sees the latest commits.
+    """
+
+    def __init__(self, engine) -> None:
+        self.connection = engine.connect()
+        self.sqlite = engine.dialect.name == 'sqlite'
+        self.version = self._data_version() if self.sqlite else None
+        self.last_id = self._last_id()
+        self.connection.rollback()
+
+    def _data_version(self) -> int:
+        return self.connection.exec_driver_sql('PRAGMA data_version').scalar()
+
+    def _last_id(self) -> int:
+        return self.connection.execute(sa.select(sa.func.max(Posting.id))).scalar() or 0
+
+    def new_postings(self, account_nums: list) -> list:
+        """Postings of the accounts committed since the last call, with the account's balance
+            - SQLite: nothing is read unless data_version changed
+            - Other databases: the poll reads the newest posting id off the primary key index
+        """
+        try:
+            if self.sqlite:
+                version = self._data_version()
+                if version == self.version:
+                    return []
+                self.version = version
+            high = self._last_id()
+            if high <= self.last_id:
+                return []
+            rows = self.connection.execute(
+                sa.select(Posting.id, Posting.txn_id, Posting.account_num, Posting.counterparty, Posting.amount,
+                          Posting.posted_at, Posting.transaction_type_id, Accounts.total_balance.label('balance'))
+                .join(Accounts, Accounts.account_num == Posting.account_num)
+                .where(Posting.id > self.last_id, Posting.id <= high, Posting.account_num.in_(account_nums),
+                       Posting.txn_id != BALANCE_FORWARD)
+                .order_by(Posting.id)
+            ).all()
+            self.last_id = high
+            return rows
+        finally:
+            self.connection.rollback()
+
+    def close(self) -> None:
+        self.connection.close()
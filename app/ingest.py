@@ -0,0 +1,279 @@
+import csv
+import hashlib
+import math
+import os
+import random
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db, shard_router, balance_cache
+from .balances import SharedBalanceBackend
+from .models import Accounts, BalanceStripe, Transactions, TransactionType, IngestCheckpoint
+
+CSV_COLUMNS = ('account_num', 'amount') # required header columns, others are ignored
+FIXED_WIDTH_LAYOUT = (('account_num', 0, 10), ('amount', 10, 22)) # (field, start, end) character positions
+IN_BATCH_SIZE = 900 # account numbers per IN query, keeps SQLite under its variable limit
+
+DepositRow = namedtuple('DepositRow', ['offset', 'end', 'account_num', 'amount', 'error', 'line'])
+DepositRow.__doc__ = """One line of a deposit file
+    - offset, end (int): byte offsets of the start of the line and of the next line
+    - account_num (int), amount (float): None when the line is invalid
+    - error (str): why the line is rejected, None for a valid line
+    - line (str): the line as read, written to the rejects file
+"""
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file read in 1 MiB blocks, identifies a deposit file whatever its name"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_deposits(stream, fmt: str, start: int = 0) -> Iterator[DepositRow]:
+    """Streams the deposits of a file opened in binary mode, one line in memory at a time
+        - CSV files start with a header naming at least the CSV_COLUMNS, fields are split per line so quoted
+          values cannot span lines
+        - Fixed-width files have no header, fields are cut at the FIXED_WIDTH_LAYOUT positions
+        - Blank lines are skipped
+
+    Args:
+        stream: file opened with 'rb'
+        fmt (str): 'csv' or 'fixed'
+        start (int): byte offset to resume from, the CSV header is read first in any case
+
+    Yields:
+        DepositRow: one per non blank line from start
+
+    Raises:
+        ValueError: for a CSV header without the CSV_COLUMNS
+    """
+    columns = None
+    if fmt == 'csv':
+        header = next(csv.reader([stream.readline().decode('utf-8-sig')]), [])
+        names = [name.strip().lower() for name in header]
+        missing = [name for name in CSV_COLUMNS if name not in names]
+        if missing:
+            raise ValueError('CSV header lacks column(s) {}'.format(', '.join(missing)))
+        columns = [names.index(name) for name in CSV_COLUMNS]
+    stream.seek(max(start, stream.tell()))
+    while True:
+        offset = stream.tell()
+        raw = stream.readline()
+        if not raw:
+            return
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line.strip():
+            continue
+        if columns is not None:
+            fields = next(csv.reader([line]))
+            values = [fields[i] if i < len(fields) else '' for i in columns]
+        else:
+            values = [line[first:last] for _, first, last in FIXED_WIDTH_LAYOUT]
+        yield _validate(offset, stream.tell(), line, *values)
+
+
+def _validate(offset: int, end: int, line: str, account_num: str, amount: str) -> DepositRow:
+    try:
+        account_num = int(account_num.strip())
+    except ValueError:
+        return DepositRow(offset, end, None, None, 'invalid account number', line)
+    try:
+        amount = float(amount.strip())
+    except ValueError:
+        return DepositRow(offset, end, None, None, 'invalid amount', line)
+    if not math.isfinite(amount) or amount < 0.01:
+        return DepositRow(offset, end, None, None, 'amount must be at least 0.01', line)
+    return DepositRow(offset, end, account_num, amount, None, line)
+
+
+def _chunks(rows: Iterator[DepositRow], size: int) -> Iterator[List[DepositRow]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resolve_accounts(session, account_nums) -> Dict[int, int]:
+    """Looks up accounts with IN queries of IN_BATCH_SIZE numbers, on the primary
+
+    Returns:
+        Dict[int, int]: number of stripes per existing account
+    """
+    account_nums = sorted(account_nums)
+    found = {}
+    for i in range(0, len(account_nums), IN_BATCH_SIZE):
+        found.update(session.execute(
+            sa.select(Accounts.account_num, Accounts.stripes)
+            .where(Accounts.account_num.in_(account_nums[i:i + IN_BATCH_SIZE]))
+            .execution_options(primary=True)).all())
+    return found
+
+
+def apply_deposits(session, rows: List[DepositRow], stripes: Dict[int, int], txn_type_id: int) -> None:
+    """Credits deposits without committing: one UPDATE per account executed as a single executemany, plus a
+    Deposit transaction and its posting per row
+        - Balances are increased by the sum of the account's deposits in the UPDATE itself, no account is loaded
+        - A striped account's sum goes to one of its stripes chosen at random, like Accounts.update_balance
+    """
+    totals = defaultdict(float)
+    for row in rows:
+        totals[row.account_num] += row.amount
+    accounts, stripe_table = Accounts.__table__, BalanceStripe.__table__
+    plain = [{'b_account_num': num, 'b_amount': total} for num, total in totals.items() if not stripes[num]]
+    striped = [{'b_account_num': num, 'b_stripe': random.randrange(stripes[num]), 'b_amount': total}
+               for num, total in totals.items() if stripes[num]]
+    # Executed on the connection: an ORM UPDATE given parameter lists would be a bulk update by primary key
+    connection = session.connection(bind_arguments={'mapper': Accounts})
+    if plain:
+        connection.execute(accounts.update().where(accounts.c.account_num == sa.bindparam('b_account_num'))
+                           .values(balance=accounts.c.balance + sa.bindparam('b_amount')), plain)
+    if striped:
+        connection.execute(stripe_table.update().where(stripe_table.c.account_num == sa.bindparam('b_account_num'),
+                                                       stripe_table.c.stripe == sa.bindparam('b_stripe'))
+                           .values(balance=stripe_table.c.balance + sa.bindparam('b_amount')), striped)
+    now = datetime.utcnow()
+    for row in rows:
+        txn = Transactions(receiver=row.account_num, sender=row.account_num, amount=row.amount, date_time=now,
+                           transaction_type_id=txn_type_id)
+        session.add_all([txn, *txn.postings()])
+
+
+def ingest_deposits(path: str, fmt: Optional[str] = None, chunk_size: int = 5000,
+                    rejects: Optional[str] = None) -> dict:
+    """Credits the deposits of a partner file, resuming where an interrupted run of the same file stopped
+        - The file is streamed and applied chunk_size rows at a time. Each shard commits its share of a chunk
+          together with its IngestCheckpoint, the byte offset after the chunk, so a committed deposit is
+          never credited again and an uncommitted one is credited by the next run.
+        - A run starts at the lowest checkpoint of the shards and skips, per shard, the rows below that
+          shard's own checkpoint: a crash between two shard commits credits nothing twice
+        - The file is identified by its SHA-256, a file ingested to the end is not credited again under
+          another name, a corrected file with different content is a new ingest
+        - Invalid lines and unknown accounts are rejected, appended to the rejects CSV when given. A crash
+          may repeat the rejects of the chunk in flight.
+        - No deposit emails are queued. Dashboard and analytics caches are stamped by the latest posting and
+          pick the deposits up by themselves, a shared balance cache is refreshed after each chunk.
+
+    Args:
+        path (str): deposit file
+        fmt (str): 'csv' or 'fixed', from the file extension by default: .csv is CSV, anything else fixed-width
+        chunk_size (int): rows per commit
+        rejects (str): CSV file the rejected lines are appended to, with their byte offset and reason
+
+    Returns:
+        dict: deposits credited, amount, rejected lines, resume offset and whether the file was already ingested
+
+    Raises:
+        ValueError: for an unknown format or a CSV header without the CSV_COLUMNS
+    """
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'fixed')
+    if fmt not in ('csv', 'fixed'):
+        raise ValueError('Unknown deposit file format {}'.format(fmt))
+    digest = file_digest(path)
+    checkpoints = {}
+    for shard in shard_router.shards:
+        checkpoints[shard] = shard_router.session(shard).get(IngestCheckpoint, digest) or IngestCheckpoint(
+            digest=digest, name=os.path.basename(path), offset=0, deposits=0)
+    stats = {'deposits': 0, 'amount': 0.0, 'rejected': 0,
+             'resumed_at': min(checkpoint.offset for checkpoint in checkpoints.values()),
+             'already_ingested': all(checkpoint.finished_at for checkpoint in checkpoints.values())}
+    if stats['already_ingested']:
+        return stats
+    # Rejects below the highest checkpoint were written by the run that got there
+    rejected_upto = max(checkpoint.offset for checkpoint in checkpoints.values())
+    txn_type_id = db.session.query(TransactionType.id).filter_by(name="Deposit").scalar()
+    shared_cache = isinstance(balance_cache.backend, SharedBalanceBackend)
+
+    with open(path, 'rb') as stream, _rejects_writer(rejects) as write_reject:
+        for chunk in _chunks(read_deposits(stream, fmt, stats['resumed_at']), chunk_size):
+            by_shard, rejected = defaultdict(list), []
+            for row in chunk:
+                shard = shard_router.shard_for(row.account_num) if row.error is None else None
+                if shard is not None:
+                    by_shard[shard].append(row)
+                elif row.offset >= rejected_upto:
+                    rejected.append(row if row.error else row._replace(error='unknown account'))
+            credits = {}
+            for shard in shard_router.shards:
+                rows = [row for row in by_shard[shard] if row.offset >= checkpoints[shard].offset]
+                stripes = resolve_accounts(shard_router.session(shard), {row.account_num for row in rows})
+                credits[shard] = ([row for row in rows if row.account_num in stripes], stripes)
+                rejected += [row._replace(error='unknown account') for row in rows if row.account_num not in stripes]
+            for row in rejected:
+                write_reject(row)
+            stats['rejected'] += len(rejected)
+
+            for shard in shard_router.shards:
+                session = shard_router.session(shard)
+                rows, stripes = credits[shard]
+                checkpoint = checkpoints[shard]
+                if rows:
+                    apply_deposits(session, rows, stripes, txn_type_id)
+                checkpoint.offset = chunk[-1].end
+                checkpoint.deposits += len(rows)
+                session.add(checkpoint)
+                session.commit()
+                stats['deposits'] += len(rows)
+                stats['amount'] += sum(row.amount for row in rows)
+                if shared_cache and rows:
+                    balance_cache.refresh(*{row.account_num for row in rows})
+
+    for shard in shard_router.shards:
+        session = shard_router.session(shard)
+        checkpoints[shard].finished_at = datetime.utcnow()
+        session.add(checkpoints[shard])
+        session.commit()
+    return stats
+
+
+@contextmanager
+def _rejects_writer(path: Optional[str]):
+    """Yields a function appending a rejected row to a CSV file, a no-op without a file"""
+    if path is None:
+        yield lambda row: None
+        return
+    new = not os.path.exists(path) or not os.path.getsize(path)
+    with open(path, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new:
+            writer.writerow(['offset', 'reason', 'line'])
+
+        def write(row: DepositRow) -> None:
+            writer.writerow([row.offset, row.error, row.line])
+            file.flush()
+        yield write
+
+
+@click.command('ingest-deposits')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'fixed']), default=None,
+              help='File format, .csv files are CSV and others fixed-width by default.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per commit, defaults to INGEST_CHUNK_SIZE.')
+@click.option('--rejects', type=click.Path(dir_okay=False), default=None,
+              help='CSV file rejected lines are appended to.')
+@with_appcontext
+def ingest_deposits_command(path: str, fmt: Optional[str], chunk_size: Optional[int], rejects: Optional[str]) -> None:
+    """Credit the deposits of a partner file, resuming an interrupted run of the same file."""
+    try:
+        stats = ingest_deposits(path, fmt, chunk_size or current_app.config['INGEST_CHUNK_SIZE'], rejects)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    if stats['already_ingested']:
+        click.echo('{} was already ingested'.format(path))
+        return
+    if stats['resumed_at']:
+        click.echo('Resumed at byte {}'.format(stats['resumed_at']))
+    click.echo('Credited {deposits} deposit(s) totalling {amount:.2f}, rejected {rejected} line(s)'.format(**stats))
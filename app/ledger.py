@@ -0,0 +1,93 @@
+from typing import List, Optional
+
+import sqlalchemy as sa
+
+from .models import Posting, ArchivedPosting
+
+# txn_id of an account's balance forward posting, which stands in for its archived postings. Transaction ids start
+# at 1, so it never refers to a transaction.
+BALANCE_FORWARD = 0
+
+
+def history_query(account_num: int, model=Posting) -> sa.Select:
+    """Newest first select of an account's postings, a range scan of the (account_num, posted_at, id) index
+        - The balance forward posting is left out, the archived postings it sums are listed instead
+
+    Args:
+        account_num (int): account number
+        model: Posting, or ArchivedPosting for the archived history
+    """
+    query = sa.select(model).where(model.account_num == account_num)
+    if model is Posting:
+        query = query.where(Posting.txn_id != BALANCE_FORWARD)
+    return query.order_by(model.posted_at.desc(), model.id.desc())
+
+
+def latest_posting_query(account_num: int) -> sa.Select:
+    return sa.select(Posting.id).where(Posting.account_num == account_num).order_by(
+        Posting.posted_at.desc(), Posting.id.desc()).limit(1)
+
+
+def balance_forward_query(account_num: int) -> sa.Select:
+    """Select of the account's balance forward posting, which only exists once some of its postings were archived
+    """
+    return sa.select(Posting.id).where(Posting.account_num == account_num, Posting.txn_id == BALANCE_FORWARD).limit(1)
+
+
+def history_count_query(account_num: int) -> sa.Select:
+    return sa.select(sa.func.count(Posting.id)).where(Posting.account_num == account_num,
+                                                      Posting.txn_id != BALANCE_FORWARD)
+
+
+def archive_bind_arguments_for(account_num: int) -> Optional[dict]:
+    """bind_arguments of the account's archived postings: the ARCHIVE_BIND database for the default shard, the
+    shard's own database otherwise
+    """
+    from . import shard_router
+    from .archive import archive_bind_arguments
+    shard = shard_router.shard_for(account_num)
+    return archive_bind_arguments() if shard is None or shard.bind_key is None else None
+
+
+def account_history(session, account_num: int, page: int = 1, per_page: int = 25) -> List[Posting]:
+    """Page of an account's postings, newest first
+        - Read from postings_table first. Only a page running past its oldest posting, of an account with a balance
+          forward posting, continues into the archive, so recent pages never touch it.
+
+    Args:
+        session: session owning the account's rows, see ShardRouter.session_for
+        account_num (int): account number
+        page (int): 1-based page number
+        per_page (int): postings per page
+
+    Returns:
+        List[Posting]: postings of the page, ArchivedPosting rows past the archive horizon
+    """
+    offset = (page - 1) * per_page
+    postings = session.execute(history_query(account_num).offset(offset).limit(per_page)).scalars().all()
+    if len(postings) == per_page or session.execute(balance_forward_query(account_num)).first() is None:
+        return postings
+    hot_count = offset + len(postings) if postings else session.execute(history_count_query(account_num)).scalar()
+    archived = session.execute(
+        history_query(account_num, ArchivedPosting).offset(max(offset - hot_count, 0)).limit(per_page - len(postings)),
+        bind_arguments=archive_bind_arguments_for(account_num)).scalars().all()
+    return postings + archived
+
+
+def full_history(session, account_num: int, batch_size: int):
+    """Yields every posting of an account newest first, batch_size rows at a time, archived ones after the others
+
+    Yields:
+        List[Posting]: batch of postings
+    """
+    yield from session.execute(history_query(account_num).execution_options(yield_per=batch_size)).scalars().partitions()
+    if session.execute(balance_forward_query(account_num)).first() is not None:
+        yield from session.execute(history_query(account_num, ArchivedPosting).execution_options(yield_per=batch_size),
+                                   bind_arguments=archive_bind_arguments_for(account_num)).scalars().partitions()
+
+
+def latest_posting_id(session, account_num: int) -> Optional[int]:
+    """Id of the account's newest posting, None for an account without postings. Changes with every transaction
+    of the account, see FragmentCache
+    """
+    return session.execute(latest_posting_query(account_num)).scalar()
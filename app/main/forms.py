@@ -1,8 +1,11 @@
-from typing import Optional
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField, BooleanField, EmailField, DecimalField, IntegerField, FloatField
-from wtforms.validators import DataRequired, ValidationError, Email, EqualTo, NumberRange
-from app.models import User
+from wtforms import StringField, SubmitField, PasswordField, BooleanField, EmailField, DecimalField, IntegerField, FloatField, SelectField, DateField
+from wtforms.validators import DataRequired, ValidationError, Email, EqualTo, NumberRange, Optional
+from app import email_filter
+from app.search import TransactionFilter, validate_filter
+
+DUPLICATE_EMAIL = 'Please use a different email address.'
+
 
 class RegistrationForm(FlaskForm):
     """User registration form 
@@ -28,9 +31,9 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField('Submit')
     
     def validate_email(self, email: str) -> None:
-        user: Optional[str] = User.query.filter_by(email=email.data).first()
-        if user is not None:
-            raise ValidationError('Please use a different email address.')
+        # Fast path only, a concurrent registration of the same address is caught by the unique index on insert
+        if email_filter.registered(email.data):
+            raise ValidationError(DUPLICATE_EMAIL)
 
 
 class LoginForm(FlaskForm):
@@ -54,8 +57,10 @@ class TransferForm(FlaskForm):
     """Transfer funds form
         - User fund transfer. Login is required to access the form
         - User inputs recipient account number and desired transfer amount
+        - from_account choices are the user's own accounts, set by the route
     
     """
+    from_account = SelectField('From Account', coerce=int)
     recipient_acc_num = IntegerField('To Account', validators=[DataRequired()])
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     submit = SubmitField('Send')
@@ -66,8 +71,71 @@ class DepositForm(FlaskForm):
         - For the purposes of this application, this form mimics cash deposits 
         - User inputs the amount after logging in, to which the amount is added to the balance
         - A deposit transaction is also added
+        - account choices are the user's own accounts, set by the route
 
     """
+    account = SelectField('To Account', coerce=int)
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     submit = SubmitField('Send')
-    
\ No newline at end of file
+
+
+class OpenAccountForm(FlaskForm):
+    """Open an additional account for the logged in user
+    
+    """
+    submit = SubmitField('Open Account')
+
+
+class ScheduleForm(FlaskForm):
+    """Standing order form
+        - Transfers amount from one of the user's accounts to recipient_acc_num on start_date, then every
+          interval_days unless the order is a one-off (0)
+        - from_account choices are the user's own accounts, set by the route
+
+    """
+    from_account = SelectField('From Account', coerce=int)
+    recipient_acc_num = IntegerField('To Account', validators=[DataRequired()])
+    amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
+    interval_days = SelectField('Repeat', coerce=int, choices=[(0, 'Once'), (1, 'Daily'), (7, 'Weekly'), (30, 'Every 30 days')])
+    start_date = DateField('First Transfer On', validators=[DataRequired()])
+    submit = SubmitField('Schedule')
+
+
+class CancelScheduleForm(FlaskForm):
+    """Cancel button of a standing order, carries the CSRF token
+    
+    """
+    submit = SubmitField('Cancel')
+
+
+class SearchForm(FlaskForm):
+    """Support transaction search, submitted with GET so that result pages can be linked
+        - Every field is optional, type_id 0 is any type. The choices are set by the route.
+        - The criteria must leave the search an index to use, see app.search
+
+    """
+    class Meta:
+        csrf = False
+
+    date_from = DateField('From', validators=[Optional()])
+    date_to = DateField('To', validators=[Optional()])
+    type_id = SelectField('Type', coerce=int, default=0)
+    account = IntegerField('Account', validators=[Optional()])
+    amount_min = FloatField('Minimum Amount', validators=[Optional()])
+    amount_max = FloatField('Maximum Amount', validators=[Optional()])
+    submit = SubmitField('Search')
+
+    def filters(self) -> TransactionFilter:
+        return TransactionFilter(date_from=self.date_from.data, date_to=self.date_to.data,
+                                 type_id=self.type_id.data or None, account=self.account.data,
+                                 amount_min=self.amount_min.data, amount_max=self.amount_max.data)
+
+    def validate(self, extra_validators=None) -> bool:
+        if not super().validate(extra_validators):
+            return False
+        try:
+            validate_filter(self.filters())
+        except ValueError as error:
+            self.form_errors.append(str(error))
+            return False
+        return True
@@ -1,18 +1,31 @@
-from flask import render_template, session, Response 
+from datetime import datetime, timedelta
+from flask import render_template, session, request, current_app, Response
 from flask_login import current_user
-from app.models import Accounts, User, Transactions
-from app import db
+from markupsafe import Markup
+from app import db, fragment_cache, balance_cache, shard_router
+from app.models import TransactionType
+from app.replica import read_only
+from app.ledger import account_history
+from app.decorators import staff_required
+from app.search import search_transactions, cursor, encode_cursor, decode_cursor
+from .forms import SearchForm
 from . import main
 
 @main.route('/')
 @main.route('/index')
+@read_only
 def index() -> Response:
     """Index / Home route for the app. 
     If user is logged in:
         - queries for
             -user's first name
-            -user's account
-            -user's transaction
+            -balance and recent activity of each of the user's accounts, one grouped query
+            -transactions of the account selected with ?account=, the first account by default
+            -a user without accounts gets an empty portfolio and the link to open one
+        - the balance and latest posting id come from the balance cache
+        - the rendered transaction list is served from the fragment cache while the account's latest posting id is unchanged
+        - read-only: queries go to the read replica when one is configured
+        - the history is paginated with ?page= and read from the account's postings
     
     Returns:
         Response: index.html
@@ -21,10 +34,55 @@ def index() -> Response:
     first_name = session.get('first_name')
     transactions = []
     account = None
+    portfolio = []
+    transactions_html = None
     if current_user.is_authenticated:
-        user = User.query.filter_by(email=current_user.email).first()
-        account = Accounts.query.filter_by(owner=user.id).first()
-        balance = account.balance
-        transactions = Transactions.query.filter((Transactions.receiver_account == account) | 
-                                                 (Transactions.sender_account == account)).order_by(Transactions.date_time.desc()).all()
-    return render_template('index.html', first_name=first_name, balance=balance, account=account, transactions=transactions)
\ No newline at end of file
+        since = datetime.utcnow() - timedelta(days=current_app.config['RECENT_ACTIVITY_DAYS'])
+        portfolio = shard_router.portfolio(current_user.id, since)
+        account_nums = [row.account_num for row in portfolio]
+        account_num = request.args.get('account', type=int)
+        if account_nums:
+            account = shard_router.get_account(account_num if account_num in account_nums else account_nums[0])
+    if account is not None:
+        cached = balance_cache.get(account.account_num)
+        balance = cached.balance
+        acc_session = shard_router.session_for(account)
+        latest_posting = cached.latest_posting_id
+        page = request.args.get('page', 1, type=int)
+        per_page = current_app.config['TRANSACTIONS_PER_PAGE']
+        # Only the first page, by far the most viewed, is cached
+        transactions_html = fragment_cache.get(account.account_num, latest_posting) if page == 1 else None
+        if transactions_html is None:
+            transactions = account_history(acc_session, account.account_num, page, per_page)
+            transactions_html = render_template('_transactions.html', account=account, transactions=transactions,
+                                                page=page, per_page=per_page)
+            if page == 1:
+                fragment_cache.set(account.account_num, latest_posting, transactions_html)
+    else:
+        transactions_html = render_template('_transactions.html', account=account, transactions=transactions)
+    return render_template('index.html', first_name=first_name, balance=balance, account=account,
+                           portfolio=portfolio, transactions_html=Markup(transactions_html))
+
+
+@main.route('/search')
+@staff_required
+@read_only
+def search() -> Response:
+    """Support search over every account's transactions, staff only
+        - Criteria come from the query string, see SearchForm, and results are paged newest first with a
+          ?before= cursor instead of an offset, so every page is one index range scan
+
+    Returns:
+        Response: search.html
+    """
+    types = db.session.execute(db.select(TransactionType.id, TransactionType.name).order_by(TransactionType.id)).all()
+    form = SearchForm(formdata=request.args if request.args else None)
+    form.type_id.choices = [(0, 'Any')] + [(type_id, name) for type_id, name in types]
+    transactions, next_cursor = [], None
+    if request.args and form.validate():
+        per_page = current_app.config['TRANSACTIONS_PER_PAGE']
+        transactions = search_transactions(form.filters(), decode_cursor(request.args.get('before')), per_page)
+        if len(transactions) == per_page:
+            next_cursor = encode_cursor(cursor(transactions[-1]))
+    return render_template('search.html', form=form, transactions=transactions, type_names=dict(types),
+                           next_cursor=next_cursor)
@@ -1,8 +1,14 @@
+import random
 from app import db, login
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import object_session
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from . import login
 
+# Roles of the support staff
+STAFF_ROLES = ('Administrator', 'Moderator')
+
 @login.user_loader
 def load_user(id):
     return User.query.get(int(id))
@@ -27,16 +33,9 @@ class Role(db.Model):
     
     @staticmethod
     def insert_roles()->None:
-        # Static method to push roles into database.
-        roles = {'Administrator', 'Moderator', 'User'}
-        default_role = 'User'
-        for r in roles:
-            role = Role.query.filter_by(name=r).first()
-            if role is None:
-                role = Role(name=r)
-            role.default = (role.name == default_role)
-            db.session.add(role)
-        db.session.commit()
+        # Static method to push roles into database, see app.reference_data for the role list.
+        from .reference_data import sync_reference_data
+        sync_reference_data([Role])
         
     def __repr__(self):
         return '<Role %r>' % self.name
@@ -100,10 +99,20 @@ class User(UserMixin, db.Model):
         """
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def is_staff(self) -> bool:
+        """Administrators and moderators, who may search every account's transactions
+        """
+        return self.role is not None and self.role.name in STAFF_ROLES
+
     def __repr__(self):
         return '<User {} {}>'.format(self.first_name, self.last_name)
 
 
+# One user per address in any case, and case insensitive lookups of registered addresses, see EmailFilter
+db.Index('ix_users_table_email_lower', db.func.lower(User.email), unique=True)
+
+
 class TransactionType(db.Model):
     """Transaction Type SQlite ORM model
         Columns:
@@ -122,14 +131,9 @@ class TransactionType(db.Model):
     
     @staticmethod
     def insert_transaction_types()->None:
-        # Static method to push roles into database.
-        transaction_types = {'Deposit', 'Withdrawal', 'Transfer', 'New Account', 'Other'}
-        for type in transaction_types:
-            transaction_type = TransactionType.query.filter_by(name=type).first()
-            if transaction_type is None:
-                transaction_type = TransactionType(name=type)
-            db.session.add(transaction_type)
-        db.session.commit()
+        # Static method to push transaction types into database, see app.reference_data for the type list.
+        from .reference_data import sync_reference_data
+        sync_reference_data([TransactionType])
         
     def __repr__(self):
         return '<Transaction Types %r>' % self.name
@@ -145,10 +149,17 @@ class Transactions(db.Model):
         - amount (SQLite int): amount involved in the transaction
         - date_time (SQLite DateTime): date time of the transaction
         - transaction_type_id (SQLite int): id corresponding to the transaction types (e.g. Deposits, Transfer)
+
+    The (column, date_time, id) indexes serve the support search by account and by type, see app.search
     
     """
     
     __tablename__ = "transactions_table"
+    __table_args__ = (
+        db.Index('ix_transactions_table_sender_date_time', 'sender', 'date_time', 'id'),
+        db.Index('ix_transactions_table_receiver_date_time', 'receiver', 'date_time', 'id'),
+        db.Index('ix_transactions_table_type_date_time', 'transaction_type_id', 'date_time', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     receiver = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False)
@@ -157,24 +168,136 @@ class Transactions(db.Model):
     date_time = db.Column(db.DateTime, index=True)
     transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
     
+    def postings(self, withdrawal: bool = False) -> list:
+        """Journal lines of the transaction, to be added in the same commit
+            - A transaction between two accounts posts -amount to the sender and +amount to the receiver
+            - A transaction on a single account (deposit, new account, withdrawal) posts once, negative for a withdrawal
+
+        Args:
+            withdrawal (bool): the transaction takes money out of its single account
+
+        Returns:
+            List[Posting]: one posting per account involved
+        """
+        if self.sender == self.receiver:
+            return [Posting(transaction=self, account_num=self.receiver, counterparty=self.sender,
+                            amount=-self.amount if withdrawal else self.amount, posted_at=self.date_time,
+                            transaction_type_id=self.transaction_type_id)]
+        return [Posting(transaction=self, account_num=self.sender, counterparty=self.receiver, amount=-self.amount,
+                        posted_at=self.date_time, transaction_type_id=self.transaction_type_id),
+                Posting(transaction=self, account_num=self.receiver, counterparty=self.sender, amount=self.amount,
+                        posted_at=self.date_time, transaction_type_id=self.transaction_type_id)]
+
     def __repr__(self):
         return '< {} Txn {}: {} - {}, amount {}, type: {}>'.format(self.date_time, self.id, self.sender, self.receiver, self.amount, self.transaction_type_id)
 
 
+class Posting(db.Model):
+    """Journal line SQlite ORM model: one signed row per account per transaction
+        - Source of an account's history and balance. Reading them is a range scan of the
+          (account_num, posted_at, id, amount) index, which covers the balance sum.
+        - Postings older than the archive horizon are moved to ArchivedPosting, each account keeps one balance
+          forward posting (txn_id 0) carrying their sum, so balances still add up from postings_table alone.
+          txn_id is kept without a foreign key, the transaction may be archived too.
+
+    Columns:
+        - id (SQLite int): primary key
+        - txn_id (SQLite int): id of the transaction in transactions_table or its archive
+        - account_num (SQLite int): account the line is posted to
+        - counterparty (SQLite int): other account of the transaction, account_num itself for a deposit
+        - amount (SQLite int): signed amount, negative when money leaves the account
+        - posted_at (SQLite DateTime): date time of the transaction
+        - transaction_type_id (SQLite int): id corresponding to the transaction types (e.g. Deposits, Transfer)
+    """
+
+    __tablename__ = "postings_table"
+    __table_args__ = (db.Index('ix_postings_table_account_num_posted_at', 'account_num', 'posted_at', 'id', 'amount'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    txn_id = db.Column(db.Integer, nullable=False)
+    account_num = db.Column(db.Integer, nullable=False)
+    counterparty = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    posted_at = db.Column(db.DateTime, nullable=False)
+    transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
+    transaction = db.relationship("Transactions", primaryjoin="foreign(Posting.txn_id) == Transactions.id")
+    counterparty_account = db.relationship("Accounts", primaryjoin="foreign(Posting.counterparty) == Accounts.account_num",
+                                           viewonly=True)
+    transaction_type = db.relationship("TransactionType", viewonly=True)
+
+    def __repr__(self):
+        return '< {} Posting {}: account {}, amount {}, txn {}>'.format(self.posted_at, self.id, self.account_num, self.amount, self.txn_id)
+
+
+
+class ArchivedTransactions(db.Model):
+    """Archived transactions SQlite ORM model
+        - Cold partition of Transactions. Rows older than the archive horizon are moved here with their original id
+        by `flask archive-transactions`, the columns mirror Transactions
+        - Kept on each account shard next to its transactions, ids are only unique within a shard
+
+    """
+    
+    __tablename__ = "transactions_archive_table"
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    receiver = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False, index=True)
+    sender = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False, index=True)
+    amount = db.Column(db.Integer)
+    date_time = db.Column(db.DateTime, index=True)
+    transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
+    receiver_account = db.relationship("Accounts", foreign_keys=[receiver], viewonly=True)
+    sender_account = db.relationship("Accounts", foreign_keys=[sender], viewonly=True)
+    transaction_type = db.relationship("TransactionType", viewonly=True)
+    
+    def __repr__(self):
+        return '< {} Archived txn {}: {} - {}, amount {}, type: {}>'.format(self.date_time, self.id, self.sender, self.receiver, self.amount, self.transaction_type_id)
+
+
+class ArchivedPosting(db.Model):
+    """Archived postings SQlite ORM model
+        - Cold partition of Posting, moved here with their original id by `flask archive-transactions` and
+          replaced by the account's balance forward posting, the columns mirror Posting
+        - Read by the account history past the last posting of postings_table, see ledger.account_history
+        - Kept on each account shard like ArchivedTransactions
+
+    """
+
+    __tablename__ = "postings_archive_table"
+    __table_args__ = (db.Index('ix_postings_archive_table_account_num_posted_at', 'account_num', 'posted_at', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    txn_id = db.Column(db.Integer, nullable=False)
+    account_num = db.Column(db.Integer, nullable=False)
+    counterparty = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    posted_at = db.Column(db.DateTime, nullable=False)
+    transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
+    counterparty_account = db.relationship("Accounts", primaryjoin="foreign(ArchivedPosting.counterparty) == Accounts.account_num",
+                                           viewonly=True)
+    transaction_type = db.relationship("TransactionType", viewonly=True)
+
+    def __repr__(self):
+        return '< {} Archived posting {}: account {}, amount {}, txn {}>'.format(self.posted_at, self.id, self.account_num, self.amount, self.txn_id)
+
+
 class Accounts(db.Model):
     """Bank account SQlite ORM model
 
     Columns:
         account_num (SQLite int): bank account number
         owner (SQLite int): bank account owner, mapped to users_table id
-        balance (SQLite int): account balance, default 0 during account creation
+        balance (SQLite int): account balance, default 0 during account creation. For a striped account only the
+            consolidated part, see total_balance
+        stripes (SQLite int): number of BalanceStripe rows taking the account's credits, 0 for a plain account
     """
     
     __tablename__ = "accounts_table"
     
     account_num = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    owner = db.Column(db.Integer, db.ForeignKey('users_table.id'))
+    owner = db.Column(db.Integer, db.ForeignKey('users_table.id'), index=True)
     balance = db.Column(db.Float, default=0.00)
+    stripes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     receiver_acc = db.relationship("Transactions", foreign_keys="Transactions.receiver", backref="receiver_account", lazy="dynamic")
     sender_acc = db.relationship("Transactions", foreign_keys="Transactions.sender", backref="sender_account", lazy="dynamic")
     
@@ -187,11 +310,246 @@ class Accounts(db.Model):
     
     def update_balance(self, amount):
         """Updates Account balance
+            - A credit to a striped account is added to one of its stripes chosen at random, by an UPDATE that
+              neither reads nor locks the account row, so concurrent credits do not queue on it
+            - Debits always change balance, after the caller checked total_balance. On a striped account the
+              UPDATE adds to the stored value instead of writing the one loaded, keeping concurrent compactions.
 
         Args:
             amount (int): update amount. Negative for fund removal.
         """
-        self.balance += amount
+        if amount > 0 and self.stripes:
+            object_session(self).execute(
+                db.update(BalanceStripe)
+                .where(BalanceStripe.account_num == self.account_num, BalanceStripe.stripe == random.randrange(self.stripes))
+                .values(balance=BalanceStripe.balance + amount))
+        elif self.stripes:
+            self.balance = Accounts.balance + amount
+        else:
+            self.balance += amount
+
+    @hybrid_property
+    def total_balance(self):
+        """Balance including the credits still held in stripes, a correlated sum in queries"""
+        if not self.stripes:
+            return self.balance
+        held = object_session(self).execute(
+            db.select(db.func.sum(BalanceStripe.balance)).where(BalanceStripe.account_num == self.account_num)).scalar()
+        return self.balance + (held or 0)
+
+    @total_balance.expression
+    def total_balance(cls):
+        held = db.select(db.func.sum(BalanceStripe.balance)).where(BalanceStripe.account_num == cls.account_num)
+        return cls.balance + db.func.coalesce(held.scalar_subquery(), 0)
+    
+    def __repr__(self):
+        return '<Account no. {}, owner {}: {}>'.format(self.owner, self.account_num, self.balance)
+
+class BalanceStripe(db.Model):
+    """Part of a striped account's balance taking a share of its credits, see Accounts.update_balance
+        - Folded into Accounts.balance by `flask balances compact`, reads add the stripes not folded yet
+
+    Columns:
+        - account_num (SQLite int): striped account, lives on the account's shard
+        - stripe (SQLite int): stripe number, 0 to Accounts.stripes - 1
+        - balance (SQLite float): credits received since the last compaction
+    """
+
+    __tablename__ = "balance_stripes_table"
+
+    account_num = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), primary_key=True)
+    stripe = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return '<Balance stripe {} of account {}: {}>'.format(self.stripe, self.account_num, self.balance)
+
+
+class ShardTransfer(db.Model):
+    """Cross-shard transfer coordinator log, kept in the default database
+
+    Columns:
+        - id (SQLite int): primary key, referenced by the participants' ShardTransferLog rows
+        - sender (SQLite int): account number of sender
+        - receiver (SQLite int): account number of receiver
+        - amount (SQLite float): amount involved in the transfer
+        - state (SQLite str16): 'prepared', 'committed' or 'aborted'
+        - created_at (SQLite DateTime): date time the transfer was prepared
+    """
+
+    __tablename__ = "shard_transfers_table"
+
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.Integer, nullable=False)
+    receiver = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    state = db.Column(db.String(16), nullable=False, default='prepared', index=True)
+    created_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Shard transfer {}: {} - {}, amount {}, {}>'.format(self.id, self.sender, self.receiver, self.amount, self.state)
+
+
+class ShardTransferLog(db.Model):
+    """Participant side of a cross-shard transfer, written in the same commit as the balance change on that shard
+
+    Columns:
+        - transfer_id (SQLite int): id of the coordinating ShardTransfer
+        - account_num (SQLite int): account updated on this shard
+    """
+
+    __tablename__ = "shard_transfer_log_table"
+
+    transfer_id = db.Column(db.Integer, primary_key=True)
+    account_num = db.Column(db.Integer, primary_key=True)
+
+    def __repr__(self):
+        return '<Shard transfer log {}: account {}>'.format(self.transfer_id, self.account_num)
+
+
+class LedgerTotal(db.Model):
+    """Net flow of an account summed from its transactions by `flask reconcile`, compared with the stored balance
+
+    Columns:
+        - account_num (SQLite int): account number, lives on the account's shard
+        - net (SQLite float): sum of credits minus debits of the transactions reconciled so far
+    """
+
+    __tablename__ = "ledger_totals_table"
+
+    account_num = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    net = db.Column(db.Float, nullable=False, default=0.00)
+
+    def __repr__(self):
+        return '<Ledger total {}: {}>'.format(self.account_num, self.net)
+
+
+class ReconciliationCheckpoint(db.Model):
+    """Single row per shard recording how far `flask reconcile` got
+
+    Columns:
+        - id (SQLite int): primary key, always 1
+        - last_txn_id (SQLite int): highest transaction id summed into ledger_totals_table
+        - reconciled_at (SQLite DateTime): date time of the last run
+    """
+
+    __tablename__ = "reconciliation_checkpoint_table"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    last_txn_id = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Reconciliation checkpoint: txn {} at {}>'.format(self.last_txn_id, self.reconciled_at)
+
+
+class IngestCheckpoint(db.Model):
+    """How far `flask ingest-deposits` got through a deposit file on one shard, committed with the deposits
+
+    Columns:
+        - digest (SQLite str64): SHA-256 of the file, the same file under another name is the same ingest
+        - name (SQLite str255): file name of the first run
+        - offset (SQLite int): byte offset after the last row whose deposit is committed on this shard
+        - deposits (SQLite int): deposits committed on this shard
+        - finished_at (SQLite DateTime): date time the whole file was ingested, None while in progress
+    """
+
+    __tablename__ = "ingest_checkpoint_table"
+
+    digest = db.Column(db.String(64), primary_key=True)
+    name = db.Column(db.String(255))
+    offset = db.Column(db.Integer, nullable=False, default=0)
+    deposits = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Ingest checkpoint {}: offset {}, finished {}>'.format(self.name, self.offset, self.finished_at)
+
+
+class OutboxMessage(db.Model):
+    """Notification email waiting for `flask dispatch-outbox`, written in the same commit as the transaction it
+    reports, on the shard of the account involved
+
+    Columns:
+        - id (SQLite int): primary key
+        - recipient (SQLite str120): email address
+        - subject (SQLite str128): rendered subject
+        - body (SQLite text): rendered plain text body
+        - created_at (SQLite DateTime): date time the message was queued
+        - next_attempt_at (SQLite DateTime): when the message is next due, indexed for the dispatcher's due scan
+        - attempts (SQLite int): failed deliveries so far
+        - sent_at (SQLite DateTime): date time of delivery, None until sent
+        - last_error (SQLite str255): error of the last failed delivery
+        - claimed_by (SQLite str64): dispatcher currently delivering the message
+        - claimed_until (SQLite DateTime): end of the dispatcher's lease
+    """
+
+    __tablename__ = "outbox_table"
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(128), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+    claimed_by = db.Column(db.String(64))
+    claimed_until = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Outbox message {} to {}: {}>'.format(self.id, self.recipient, self.subject)
+
+
+class AppState(db.Model):
+    """Application state key-value SQlite ORM model
+        Columns:
+            - key (SQLite str64): primary key, e.g. 'reference_data_version'
+            - value (SQLite str128): stored value
+        
+    """
+    __tablename__ = "app_state_table"
+    
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(128))
+    
+    def __repr__(self):
+        return '<App state {}: {}>'.format(self.key, self.value)
+
+
+class ScheduledTransfer(db.Model):
+    """Standing order: a transfer executed by the `flask run-schedules` worker, once or every interval_days
+    
+    Columns:
+        - id (SQLite int): primary key
+        - owner (SQLite int): user who set up the order, mapped to users_table id
+        - sender (SQLite int): account number debited, one of the owner's accounts
+        - receiver (SQLite int): account number credited
+        - amount (SQLite float): amount transferred per run
+        - interval_days (SQLite int): days between runs, None for a one-off transfer
+        - next_run_at (SQLite DateTime): when the order is next due, indexed for the worker's due scan
+        - active (SQLite bool): False once cancelled or after a one-off ran
+        - claimed_by (SQLite str64): worker currently executing the order
+        - claimed_until (SQLite DateTime): end of the worker's lease, after which another worker may claim it
+        - last_run_at (SQLite DateTime): date time of the last execution
+        - last_status (SQLite str32): 'executed', 'insufficient_funds' or 'recipient_not_found'
+    """
+    
+    __tablename__ = "scheduled_transfers_table"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.Integer, db.ForeignKey('users_table.id'), index=True)
+    sender = db.Column(db.Integer, nullable=False)
+    receiver = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    interval_days = db.Column(db.Integer)
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    claimed_by = db.Column(db.String(64))
+    claimed_until = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(32))
     
     def __repr__(self):
-        return '<Account no. {}, owner {}: {}>'.format(self.owner, self.account_num, self.balance)
\ No newline at end of file
+        return '<Scheduled transfer {}: {} - {}, amount {}, next {}>'.format(self.id, self.sender, self.receiver, self.amount, self.next_run_at)
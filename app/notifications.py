@@ -0,0 +1,201 @@
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app, render_template
+from flask.cli import with_appcontext
+from flask_mail import Message
+
+from . import mail, shard_router
+from .models import OutboxMessage
+from .schedules import worker_id
+
+
+def queue_email(session, to: str, subject: str, template: str, **kwargs) -> OutboxMessage:
+    """Renders a notification email and adds it to the outbox of a session, it is sent once the session commits
+
+    Args:
+        session: session of the transaction the email reports, see ShardRouter.session_for
+        to (str): recipient address
+        subject (str): subject, prefixed with MAIL_SUBJECT_PREFIX
+        template (str): template under templates/ without the .txt extension
+        **kwargs: template context
+
+    Returns:
+        OutboxMessage: the queued message
+    """
+    now = datetime.utcnow()
+    message = OutboxMessage(recipient=to, subject=current_app.config['MAIL_SUBJECT_PREFIX'] + subject,
+                            body=render_template(template + '.txt', **kwargs), created_at=now, next_attempt_at=now)
+    session.add(message)
+    return message
+
+
+def notify_transfer(account, sender_num: int, receiver_num: int, amount: float) -> None:
+    """Queues the sent or received email of one account of a transfer in that account's session
+        - Called by ShardRouter.transfer and ShardRouter._apply before the session commits the account's side of the
+          transfer, so the email is part of that commit on the account's shard, cross-shard transfers included
+        - Accounts without an owner are not notified
+    """
+    if account.account_owner is None:
+        return
+    sent = account.account_num == sender_num
+    queue_email(shard_router.session_for(account), account.account_owner.email,
+                'Transfer sent' if sent else 'Transfer received', 'mail/transfer_sent' if sent else 'mail/transfer_received',
+                user=account.account_owner, sender_num=sender_num, receiver_num=receiver_num, amount=amount,
+                balance=account_balance(account))
+
+
+def notify_deposit(account, amount: float) -> None:
+    """Queues the deposit email in the account's session, call before committing the deposit
+    """
+    if account.account_owner is not None:
+        queue_email(shard_router.session_for(account), account.account_owner.email, 'Deposit received', 'mail/deposit',
+                    user=account.account_owner, account=account, amount=amount, balance=account_balance(account))
+
+
+def account_balance(account) -> float:
+    """Balance shown in an email: total_balance once the pending balance change is flushed
+        - A credit to a striped account is held in a stripe, Accounts.balance leaves it out
+        - A debit of a striped account assigns a SQL expression to Accounts.balance, only the flush evaluates it
+    """
+    shard_router.session_for(account).flush()
+    return account.total_balance
+
+
+def claim_due(session, worker: str, batch_size: int, lease: timedelta, now: Optional[datetime] = None) -> List[OutboxMessage]:
+    """Claims up to batch_size due messages of one shard for a dispatcher and commits the claim
+        - Same single UPDATE ... WHERE id IN (SELECT ...) claim as schedules.claim_due, concurrent dispatchers never
+          deliver the same message
+        - Sent and abandoned messages have no next_attempt_at and drop out of the due scan
+
+    Returns:
+        List[OutboxMessage]: claimed messages, oldest due first
+    """
+    now = now or datetime.utcnow()
+    table = OutboxMessage.__table__
+    due = sa.select(table.c.id).where(
+        table.c.next_attempt_at <= now,
+        sa.or_(table.c.claimed_until.is_(None), table.c.claimed_until < now),
+    ).order_by(table.c.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True)
+    claimed_until = now + lease
+    session.execute(table.update().where(table.c.id.in_(due)).values(claimed_by=worker, claimed_until=claimed_until))
+    session.commit()
+    return session.query(OutboxMessage).filter_by(claimed_by=worker, claimed_until=claimed_until) \
+        .order_by(OutboxMessage.next_attempt_at).all()
+
+
+def deliver(session, messages: List[OutboxMessage], max_attempts: int, retry: timedelta,
+            now: Optional[datetime] = None) -> dict:
+    """Sends claimed messages over one SMTP connection and records the outcome in one commit
+        - A failed message is retried after retry, doubled after every further failure, and abandoned after
+          max_attempts failures
+        - A connection failure counts as a failure of every message of the batch
+
+    Returns:
+        dict: number of messages sent, retried and abandoned
+    """
+    now = now or datetime.utcnow()
+    stats = {'sent': 0, 'retried': 0, 'abandoned': 0}
+    errors = {}
+    try:
+        with mail.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(Message(message.subject, recipients=[message.recipient], body=message.body))
+                except Exception as error:
+                    errors[message.id] = error
+    except Exception as error:
+        errors = {message.id: error for message in messages if message.id not in errors}
+    for message in messages:
+        message.claimed_by = None
+        message.claimed_until = None
+        if message.id not in errors:
+            message.sent_at = now
+            message.next_attempt_at = None
+            stats['sent'] += 1
+            continue
+        message.attempts += 1
+        message.last_error = repr(errors[message.id])[:255]
+        if message.attempts >= max_attempts:
+            message.next_attempt_at = None
+            stats['abandoned'] += 1
+        else:
+            message.next_attempt_at = now + retry * 2 ** (message.attempts - 1)
+            stats['retried'] += 1
+    session.commit()
+    return stats
+
+
+def dispatch_outbox(batch_size: int = 50, max_attempts: int = 5, retry: timedelta = timedelta(minutes=1),
+                    lease: timedelta = timedelta(minutes=2), once: bool = False, poll: float = 5,
+                    max_batches: Optional[int] = None, report=None) -> dict:
+    """Dispatcher loop: claims due messages batch by batch on every shard and delivers them
+        - Safe to run in several processes at once, see claim_due()
+        - Requests only write to the outbox, so SMTP latency and outages never reach them
+
+    Args:
+        batch_size (int): messages delivered per SMTP connection and commit
+        max_attempts (int): failed deliveries before a message is abandoned
+        retry (timedelta): delay before the first retry
+        lease (timedelta): claim duration, must exceed the time a batch takes
+        once (bool): return when nothing is due instead of polling
+        poll (float): seconds slept when nothing is due
+        max_batches (int): return after this many batches, None runs until interrupted or, with once, until idle
+        report (Callable[[str], None]): receives one line per batch
+
+    Returns:
+        dict: messages sent, retried and abandoned, and batches
+    """
+    worker = worker_id()
+    totals = {'sent': 0, 'retried': 0, 'abandoned': 0, 'batches': 0}
+    try:
+        while max_batches is None or totals['batches'] < max_batches:
+            idle = True
+            for shard in shard_router.shards:
+                session = shard_router.session(shard)
+                claimed = claim_due(session, worker, batch_size, lease)
+                if not claimed:
+                    continue
+                idle = False
+                totals['batches'] += 1
+                stats = deliver(session, claimed, max_attempts, retry)
+                for outcome, count in stats.items():
+                    totals[outcome] += count
+                if report is not None:
+                    report('Shard {}: {}'.format(shard.bind_key or 'default',
+                                                 ', '.join('{} {}'.format(count, outcome) for outcome, count in stats.items())))
+                if max_batches is not None and totals['batches'] >= max_batches:
+                    break
+            if idle:
+                if once:
+                    break
+                time.sleep(poll)
+    except KeyboardInterrupt:
+        pass
+    return totals
+
+
+@click.command('dispatch-outbox')
+@click.option('--batch-size', type=int, default=None, help='Messages per SMTP connection, defaults to OUTBOX_BATCH_SIZE.')
+@click.option('--once', is_flag=True, help='Exit when no message is due instead of polling.')
+@click.option('--poll', type=float, default=None, help='Seconds between polls when idle, defaults to OUTBOX_POLL_SECONDS.')
+@click.option('--max-batches', type=int, default=None, help='Exit after this many batches.')
+@with_appcontext
+def dispatch_outbox_command(batch_size: Optional[int], once: bool, poll: Optional[float], max_batches: Optional[int]) -> None:
+    """Deliver queued notification emails."""
+    config = current_app.config
+    totals = dispatch_outbox(
+        batch_size=batch_size or config['OUTBOX_BATCH_SIZE'],
+        max_attempts=config['OUTBOX_MAX_ATTEMPTS'],
+        retry=timedelta(seconds=config['OUTBOX_RETRY_SECONDS']),
+        lease=timedelta(seconds=config['OUTBOX_LEASE_SECONDS']),
+        once=once,
+        poll=poll if poll is not None else config['OUTBOX_POLL_SECONDS'],
+        max_batches=max_batches,
+        report=click.echo,
+    )
+    click.echo('{} sent, {} to retry, {} abandoned in {} batch(es)'.format(
+        totals['sent'], totals['retried'], totals['abandoned'], totals['batches']))
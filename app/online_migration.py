@@ -0,0 +1,223 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import sqlalchemy as sa
+
+
+class ShadowTableMigration:
+    """Changes a table's schema without rebuilding it under one long write lock, for Alembic revisions on large tables
+        - Batch mode ALTERs on SQLite copy the whole table in one transaction, blocking every writer until it is done.
+          Instead the new schema is built in a shadow table next to the live one:
+            1.) The shadow table is created without its indexes, and triggers on the live table log the primary key
+                of every row written from then on
+            2.) Existing rows up to the highest id at that point are copied in chunks of chunk_size rows, one
+                transaction each, sleeping pause seconds in between so the application's writes get through
+            3.) Rows logged by the triggers are copied again until fewer than chunk_size are left
+            4.) One short transaction copies the last logged rows, drops the triggers, swaps the two tables by
+                renaming them and builds the indexes on the new table
+        - Progress is checkpointed with every chunk, a run that was interrupted resumes where it stopped
+        - The live table needs a single integer primary key. Foreign keys of other tables keep referring to it by
+          name, so after the swap they refer to the new table.
+        - SQLite only, other databases change schemas online with their own ALTER TABLE
+
+    Usage in a revision, on the revision's engine so that chunks commit on their own connections:
+
+        def upgrade():
+            target = sa.Table('transactions_table', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True), ...)
+            ShadowTableMigration(op.get_bind().engine, target, columns={'amount': 'CAST(amount AS REAL)'}).run()
+
+    Args:
+        engine (Engine): database of the table
+        target (Table): new definition of the table, with its indexes, named like the live table
+        columns (dict): SQL expression over the live table's columns for each target column, columns not listed
+            are copied from the live column of the same name and left to their default when there is none
+        chunk_size (int): rows copied per transaction
+        pause (float): seconds slept between chunks
+        drop_old (bool): drop the previous table after the swap, otherwise it is kept as _<table>_old
+        on_chunk (Callable[[dict], None]): called with the progress after every committed chunk
+    """
+
+    # Bound parameters per IN list, below SQLite's 999 limit before 3.32
+    MAX_PARAMETERS = 900
+
+    def __init__(self, engine, target: sa.Table, columns: Optional[Dict[str, str]] = None, chunk_size: int = 5000,
+                 pause: float = 0.05, drop_old: bool = True, on_chunk: Optional[Callable[[dict], None]] = None) -> None:
+        if engine.dialect.name != 'sqlite':
+            raise ValueError('Shadow table migrations support SQLite, not {}'.format(engine.dialect.name))
+        primary_key = list(target.primary_key.columns)
+        if len(primary_key) != 1 or not isinstance(primary_key[0].type, sa.Integer):
+            raise ValueError('{} needs a single integer primary key'.format(target.name))
+        self.engine = engine
+        self.target = target
+        self.table = target.name
+        self.pk = primary_key[0].name
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.drop_old = drop_old
+        self.on_chunk = on_chunk
+        self.shadow = '_{}_new'.format(self.table)
+        self.changes = '_{}_changes'.format(self.table)
+        self.checkpoint = '_{}_checkpoint'.format(self.table)
+        self.old = '_{}_old'.format(self.table)
+        live = {column['name'] for column in sa.inspect(engine).get_columns(self.table)}
+        columns = columns or {}
+        self.columns = {column.name: columns.get(column.name, self._quote(column.name))
+                        for column in target.columns if column.name in columns or column.name in live}
+        self.progress = {'copied': 0, 'replayed': 0, 'chunks': 0}
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction taking SQLite's write lock up front. pysqlite does not BEGIN before DDL by itself, and a
+        read transaction that later writes fails with SQLITE_BUSY instead of waiting for the lock.
+        """
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+            yield connection
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _copy(self, where: str) -> str:
+        """INSERT ... SELECT of the live rows matching where into the shadow table"""
+        return 'INSERT INTO {} ({}) SELECT {} FROM {} WHERE {}'.format(
+            self._quote(self.shadow), ', '.join(self._quote(name) for name in self.columns),
+            ', '.join(self.columns.values()), self._quote(self.table), where)
+
+    def run(self) -> dict:
+        """Runs or resumes the migration up to the swap
+
+        Returns:
+            dict: rows copied by the backfill, rows copied again from the change log and chunks committed
+        """
+        state = self._resume() or self._start()
+        if state['phase'] == 'backfill':
+            self._backfill(state['last_id'], state['upto'])
+        self._catch_up()
+        self._swap()
+        return self.progress
+
+    def _resume(self) -> Optional[dict]:
+        if not sa.inspect(self.engine).has_table(self.checkpoint):
+            return None
+        with self.engine.connect() as connection:
+            row = connection.exec_driver_sql('SELECT phase, last_id, upto FROM {}'.format(self._quote(self.checkpoint))).one()
+        return dict(row._mapping)
+
+    def _start(self) -> dict:
+        """Creates the shadow table, the change log and its triggers, and the checkpoint, in one transaction"""
+        table, pk = self._quote(self.table), self._quote(self.pk)
+        with self._transaction() as connection:
+            self._drop_leftovers(connection)
+            # Tables the foreign keys refer to are reflected so that the copy's foreign keys resolve
+            metadata = sa.MetaData()
+            for name in {key.target_fullname.rsplit('.', 1)[0] for key in self.target.foreign_keys}:
+                sa.Table(name, metadata, autoload_with=connection)
+            shadow = self.target.to_metadata(metadata, name=self.shadow)
+            shadow.indexes.clear()
+            shadow.create(connection)
+            connection.exec_driver_sql('CREATE TABLE {} (seq INTEGER PRIMARY KEY AUTOINCREMENT, pk INTEGER NOT NULL)'
+                                       .format(self._quote(self.changes)))
+            for event, keys in (('INSERT', ['NEW']), ('UPDATE', ['OLD', 'NEW']), ('DELETE', ['OLD'])):
+                connection.exec_driver_sql('CREATE TRIGGER {} AFTER {} ON {} BEGIN {} END'.format(
+                    self._quote('{}_{}'.format(self.changes, event.lower())), event, table,
+                    ' '.join('INSERT INTO {} (pk) VALUES ({}.{});'.format(self._quote(self.changes), key, pk)
+                             for key in keys)))
+            upto = connection.exec_driver_sql('SELECT max({}) FROM {}'.format(pk, table)).scalar() or 0
+            connection.exec_driver_sql('CREATE TABLE {} (phase VARCHAR(16) NOT NULL, last_id INTEGER NOT NULL, '
+                                       'upto INTEGER NOT NULL)'.format(self._quote(self.checkpoint)))
+            connection.exec_driver_sql('INSERT INTO {} VALUES (?, ?, ?)'.format(self._quote(self.checkpoint)),
+                                       ('backfill', 0, upto))
+        return {'phase': 'backfill', 'last_id': 0, 'upto': upto}
+
+    def _drop_leftovers(self, connection) -> None:
+        for event in ('insert', 'update', 'delete'):
+            connection.exec_driver_sql('DROP TRIGGER IF EXISTS {}'.format(self._quote('{}_{}'.format(self.changes, event))))
+        for name in (self.shadow, self.changes, self.checkpoint):
+            connection.exec_driver_sql('DROP TABLE IF EXISTS {}'.format(self._quote(name)))
+
+    def _chunk_done(self) -> None:
+        self.progress['chunks'] += 1
+        if self.on_chunk is not None:
+            self.on_chunk(dict(self.progress))
+        if self.pause:
+            time.sleep(self.pause)
+
+    def _backfill(self, last_id: int, upto: int) -> None:
+        """Copies the rows that existed when the triggers were created, chunk by chunk"""
+        table, pk = self._quote(self.table), self._quote(self.pk)
+        while last_id < upto:
+            with self._transaction() as connection:
+                high = connection.exec_driver_sql(
+                    'SELECT {pk} FROM {table} WHERE {pk} > ? AND {pk} <= ? ORDER BY {pk} LIMIT 1 OFFSET ?'.format(
+                        pk=pk, table=table), (last_id, upto, self.chunk_size - 1)).scalar() or upto
+                copied = connection.exec_driver_sql(self._copy('{pk} > ? AND {pk} <= ?'.format(pk=pk)), (last_id, high))
+                self.progress['copied'] += copied.rowcount
+                phase = 'backfill' if high < upto else 'catchup'
+                connection.exec_driver_sql('UPDATE {} SET phase = ?, last_id = ?'.format(self._quote(self.checkpoint)),
+                                           (phase, high))
+            last_id = high
+            self._chunk_done()
+
+    def _replay(self, connection, limit: Optional[int]) -> int:
+        """Copies the logged rows again, deleting the ones gone from the live table, and clears their log entries
+
+        Returns:
+            int: log entries left
+        """
+        changes, pk = self._quote(self.changes), self._quote(self.pk)
+        query = 'SELECT seq, pk FROM {} ORDER BY seq'.format(changes) + (' LIMIT {:d}'.format(limit) if limit else '')
+        rows = connection.exec_driver_sql(query).all()
+        if rows:
+            keys = sorted({key for _, key in rows})
+            for start in range(0, len(keys), self.MAX_PARAMETERS):
+                batch = tuple(keys[start:start + self.MAX_PARAMETERS])
+                placeholders = ', '.join('?' for _ in batch)
+                connection.exec_driver_sql('DELETE FROM {} WHERE {} IN ({})'.format(self._quote(self.shadow), pk,
+                                                                                   placeholders), batch)
+                connection.exec_driver_sql(self._copy('{} IN ({})'.format(pk, placeholders)), batch)
+            connection.exec_driver_sql('DELETE FROM {} WHERE seq <= ?'.format(changes), (rows[-1][0],))
+            self.progress['replayed'] += len(keys)
+        return connection.exec_driver_sql('SELECT count(*) FROM {}'.format(changes)).scalar()
+
+    def _catch_up(self) -> None:
+        """Replays the change log chunk by chunk until one chunk would take the rest"""
+        while True:
+            with self._transaction() as connection:
+                left = self._replay(connection, self.chunk_size)
+            self._chunk_done()
+            if left <= self.chunk_size:
+                return
+
+    def _swap(self) -> None:
+        """Replays the last changes and swaps the tables in one transaction, the only time writers wait"""
+        inspector = sa.inspect(self.engine)
+        old_indexes = [index['name'] for index in inspector.get_indexes(self.table)]
+        with self.engine.connect() as connection:
+            # Set outside a transaction: renaming must not rewrite other tables' foreign keys to the old table
+            foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+            connection.commit()
+            try:
+                with connection.begin():
+                    connection.exec_driver_sql('BEGIN IMMEDIATE')
+                    self._replay(connection, None)
+                    for event in ('insert', 'update', 'delete'):
+                        connection.exec_driver_sql('DROP TRIGGER {}'.format(self._quote('{}_{}'.format(self.changes, event))))
+                    for name in (self.changes, self.checkpoint, self.old):
+                        connection.exec_driver_sql('DROP TABLE IF EXISTS {}'.format(self._quote(name)))
+                    connection.exec_driver_sql('ALTER TABLE {} RENAME TO {}'.format(self._quote(self.table), self._quote(self.old)))
+                    for name in old_indexes:
+                        connection.exec_driver_sql('DROP INDEX {}'.format(self._quote(name)))
+                    connection.exec_driver_sql('ALTER TABLE {} RENAME TO {}'.format(self._quote(self.shadow), self._quote(self.table)))
+                    for index in self.target.indexes:
+                        index.create(connection)
+                if self.drop_old:
+                    with connection.begin():
+                        connection.exec_driver_sql('BEGIN IMMEDIATE')
+                        connection.exec_driver_sql('DROP TABLE {}'.format(self._quote(self.old)))
+            finally:
+                connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+                connection.exec_driver_sql('PRAGMA foreign_keys = {:d}'.format(foreign_keys))
+                connection.commit()
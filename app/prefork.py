@@ -0,0 +1,102 @@
+import os
+import weakref
+from typing import List
+
+import sqlalchemy as sa
+from flask import current_app
+
+from . import db, balance_cache, recipient_directory, email_filter
+from .models import TransactionType
+from .reference_data import REFERENCE_DATA
+
+# Engines of the prepared apps, their pools are replaced in every forked child
+_engines = weakref.WeakSet()
+
+
+def prepare(app) -> None:
+    """Readies an app built in a pre-fork server's master, before the workers are forked from it
+        - Work done here is shared copy-on-write by every worker instead of repeated per worker: templates are
+          compiled, and with RECIPIENT_DIRECTORY_PRELOAD / EMAIL_FILTER_PRELOAD the recipient index and the email
+          filter are loaded synchronously, waiting for a preload thread already started by create_app()
+        - The engines' pools are emptied, no connection opened by the master is handed to the workers
+        - after_fork_in_child() is registered with os.register_at_fork, so any fork of this process starts
+          with new pools, also one made outside the server's hooks
+    """
+    with app.app_context():
+        for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+            app.jinja_env.get_template(name)
+        for index, enabled in ((recipient_directory, app.config.get('RECIPIENT_DIRECTORY_PRELOAD')),
+                               (email_filter, app.config.get('EMAIL_FILTER_PRELOAD'))):
+            if enabled:
+                try:
+                    index.refresh()
+                except sa.exc.SQLAlchemyError:
+                    app.logger.exception('Preloading %s before fork failed', type(index).__name__)
+        engines = list(db.engines.values())
+    if getattr(balance_cache.backend, 'engine', None) is not None:
+        engines.append(balance_cache.backend.engine)
+    for engine in engines:
+        engine.dispose()
+        _engines.add(engine)
+    _register_fork_hook()
+
+
+def after_fork_in_child() -> None:
+    """Gives the forked process new, empty connection pools
+        - dispose(close=False) drops the pools inherited from the parent without closing their connections,
+          which still belong to the parent: closing them here would end the parent's sessions as well
+        - Threads do not survive a fork, only the replica refresh thread may run in the master and it keeps
+          refreshing for all workers from there
+    """
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+_registered = False
+
+
+def _register_fork_hook() -> None:
+    global _registered
+    if not _registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_fork_in_child)
+        _registered = True
+
+
+def check_ready(app) -> List[str]:
+    """Checks that a worker can serve requests, run once per worker after it started
+        - Every database bind answers a query
+        - The default database is at the migration head
+        - The transaction types the routes look up by name exist
+
+    Returns:
+        List[str]: problems found, empty when the worker is ready
+    """
+    from alembic.script import ScriptDirectory
+    problems = []
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            try:
+                with engine.connect() as connection:
+                    connection.execute(sa.text('SELECT 1'))
+            except sa.exc.SQLAlchemyError as error:
+                problems.append('Database {} unreachable: {}'.format(bind_key or 'default', error))
+        if problems:
+            return problems
+
+        heads = set(ScriptDirectory(current_app.extensions['migrate'].directory).get_heads())
+        revisions = set()
+        if sa.inspect(db.engine).has_table('alembic_version'):
+            with db.engine.connect() as connection:
+                revisions = set(connection.execute(sa.text('SELECT version_num FROM alembic_version')).scalars())
+        if revisions != heads:
+            problems.append('Database at revision {}, migrations head is {}, run flask db upgrade'.format(
+                ', '.join(sorted(revisions)) or 'none', ', '.join(sorted(heads))))
+            return problems
+
+        names = {row['name'] for row in REFERENCE_DATA[TransactionType]}
+        missing = names - set(db.session.execute(sa.select(TransactionType.name)).scalars())
+        if missing:
+            problems.append('Transaction types missing: {}, run flask sync-reference-data'.format(
+                ', '.join(sorted(missing))))
+        db.session.remove()
+    return problems
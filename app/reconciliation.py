@@ -0,0 +1,222 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db, shard_router
+from .archive import archive_bind_arguments
+from .models import Accounts, Transactions, ArchivedTransactions, TransactionType, LedgerTotal, ReconciliationCheckpoint
+from .sharding import Shard
+
+UPSERT_BATCH_SIZE = 500 # ledger totals per INSERT ... ON CONFLICT statement, keeps SQLite under its variable limit
+IN_BATCH_SIZE = 900 # transaction ids per IN list, same limit
+
+
+def _owned(column, shard: Shard):
+    """Restricts an account number column to the shard's range, the other side of a cross-shard transfer is
+    reconciled on its own shard
+    """
+    if shard.last is None:
+        return column >= shard.first
+    return column.between(shard.first, shard.last)
+
+
+def net_flows(session, model, shard: Shard, after: int, upto: Optional[int], withdrawal_type_id: Optional[int],
+              bind_arguments: Optional[dict] = None, ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """Net flow per account of the transactions with after < id <= upto, from two GROUP BY queries
+        - Credits grouped by receiver. A row whose sender is its receiver is a deposit or a withdrawal, it only
+          counts once: positive, negative for the Withdrawal type.
+        - Debits grouped by sender, for rows between two different accounts
+        - Both scans walk the primary key range, only rows added since the checkpoint are read
+
+    Args:
+        session: session of the shard, see ShardRouter.session
+        model: Transactions or ArchivedTransactions
+        shard (Shard): shard whose accounts are summed
+        after (int): exclusive lower transaction id
+        upto (int): inclusive upper transaction id, None for no bound
+        withdrawal_type_id (int): id of the Withdrawal transaction type
+        bind_arguments (dict): bind for the query, see archive_bind_arguments()
+        ids (List[int]): only sum these transactions of the range
+
+    Returns:
+        Dict[int, float]: net flow per account number, accounts without rows are missing
+    """
+    in_range = [model.id > after] if upto is None else [model.id > after, model.id <= upto]
+    if ids is not None:
+        in_range.append(model.id.in_(ids))
+    withdrawal = model.transaction_type_id == withdrawal_type_id if withdrawal_type_id is not None else sa.false()
+    credit = sa.case((sa.and_(model.sender == model.receiver, withdrawal), -model.amount), else_=model.amount)
+    credits = sa.select(model.receiver, sa.func.sum(credit)).where(
+        *in_range, _owned(model.receiver, shard)).group_by(model.receiver)
+    debits = sa.select(model.sender, sa.func.sum(model.amount)).where(
+        *in_range, model.sender != model.receiver, _owned(model.sender, shard)).group_by(model.sender)
+    flows = defaultdict(float)
+    for account_num, amount in session.execute(credits, bind_arguments=bind_arguments):
+        flows[account_num] += amount or 0
+    for account_num, amount in session.execute(debits, bind_arguments=bind_arguments):
+        flows[account_num] -= amount or 0
+    return dict(flows)
+
+
+def _add_to_totals(session, flows: Dict[int, float]) -> None:
+    """Adds net flows to ledger_totals_table with INSERT ... ON CONFLICT (account_num) DO UPDATE SET net = net + excluded.net
+    """
+    table = LedgerTotal.__table__
+    dialect = session.get_bind(mapper=LedgerTotal).dialect.name
+    if dialect == 'sqlite':
+        insert = sqlite.insert
+    elif dialect == 'postgresql':
+        insert = postgresql.insert
+    else:
+        raise ValueError('Reconciliation supports SQLite and PostgreSQL, not {}'.format(dialect))
+    rows = [{'account_num': account_num, 'net': net} for account_num, net in flows.items()]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        statement = insert(table).values(rows[start:start + UPSERT_BATCH_SIZE])
+        session.execute(statement.on_conflict_do_update(index_elements=['account_num'],
+                                                        set_={'net': table.c.net + statement.excluded.net}))
+
+
+def _archived_while_hot(session, after: int, upto: int, bind_arguments: Optional[dict]) -> List[int]:
+    """Ids of the range found in both the archive and transactions_table
+        - With ARCHIVE_BIND the archive job commits a chunk to the archive database before deleting it from
+          transactions_table, a run landing in between sees the chunk twice. These rows are counted from
+          transactions_table only.
+        - transactions_table is read before the archive: a row it no longer has was already in the archive
+    """
+    archived = session.execute(sa.select(ArchivedTransactions.id).where(
+        ArchivedTransactions.id > after, ArchivedTransactions.id <= upto), bind_arguments=bind_arguments).scalars().all()
+    hot = []
+    for start in range(0, len(archived), IN_BATCH_SIZE):
+        hot += session.execute(sa.select(Transactions.id).where(
+            Transactions.id.in_(archived[start:start + IN_BATCH_SIZE]))).scalars().all()
+    return hot
+
+
+def _max_id(session, model, bind_arguments: Optional[dict] = None) -> int:
+    return session.execute(sa.select(sa.func.max(model.id)), bind_arguments=bind_arguments).scalar() or 0
+
+
+def reconcile_shard(shard: Shard, full: bool = False, tolerance: float = 0.005, batch_size: int = 100000) -> dict:
+    """Sums the transactions added since the shard's checkpoint into ledger_totals_table, then compares every
+    balance with its ledger total
+        - Transactions are summed batch_size ids per commit, the totals and the checkpoint move in the same commit so
+          an interrupted run resumes from the last batch
+        - The shard's archive is summed as well, rows are archived with their id. Shards archive into their own
+          database, a shard that never archived may not have the table yet. Rows still in transactions_table
+          while the archive job moves them are only counted once, see _archived_while_hot().
+        - Transactions committed after the run started are added back for drifted accounts before reporting them,
+          so concurrent transfers are not reported as drift
+        - Assumes transactions are append-only with increasing ids. Use full after correcting rows in place.
+
+    Args:
+        shard (Shard): shard to reconcile
+        full (bool): discard the totals and the checkpoint and sum the whole history
+        tolerance (float): largest difference between a balance and its total that is not drift
+        batch_size (int): transaction ids summed per commit
+
+    Returns:
+        dict: last_txn_id reconciled, processed transactions, accounts updated and drift, a list of
+            (account_num, balance, ledger net) tuples
+    """
+    session = shard_router.session(shard)
+    withdrawal_type_id = db.session.query(TransactionType.id).filter_by(name='Withdrawal').scalar()
+    models = [(Transactions, None)]
+    if shard.bind_key is None:
+        models.append((ArchivedTransactions, archive_bind_arguments()))
+    elif sa.inspect(session.get_bind(mapper=ArchivedTransactions)).has_table(ArchivedTransactions.__tablename__):
+        models.append((ArchivedTransactions, None))
+
+    if full:
+        session.execute(sa.delete(LedgerTotal))
+        session.execute(sa.delete(ReconciliationCheckpoint))
+    checkpoint = session.get(ReconciliationCheckpoint, 1) or ReconciliationCheckpoint(id=1, last_txn_id=0)
+    after = checkpoint.last_txn_id
+    high = max(_max_id(session, model, bind_arguments) for model, bind_arguments in models)
+    processed = 0
+    updated = set()
+    while after < high:
+        upto = min(after + batch_size, high)
+        flows = defaultdict(float)
+        for model, bind_arguments in models:
+            processed += session.execute(sa.select(sa.func.count(model.id)).where(model.id > after, model.id <= upto),
+                                         bind_arguments=bind_arguments).scalar()
+            for account_num, net in net_flows(session, model, shard, after, upto, withdrawal_type_id,
+                                              bind_arguments).items():
+                flows[account_num] += net
+            if model is ArchivedTransactions:
+                duplicated = _archived_while_hot(session, after, upto, bind_arguments)
+                processed -= len(duplicated)
+                for start in range(0, len(duplicated), IN_BATCH_SIZE):
+                    for account_num, net in net_flows(session, model, shard, after, upto, withdrawal_type_id,
+                                                      bind_arguments, duplicated[start:start + IN_BATCH_SIZE]).items():
+                        flows[account_num] -= net
+        _add_to_totals(session, flows)
+        updated.update(flows)
+        checkpoint.last_txn_id = after = upto
+        checkpoint.reconciled_at = datetime.utcnow()
+        session.add(checkpoint)
+        session.commit()
+
+    net = sa.func.coalesce(LedgerTotal.net, 0)
+    balance = sa.func.coalesce(Accounts.total_balance, 0)
+    drifted = session.execute(
+        sa.select(Accounts.account_num, balance, net)
+        .outerjoin(LedgerTotal, LedgerTotal.account_num == Accounts.account_num)
+        .where(sa.func.abs(balance - net) > tolerance)
+        .order_by(Accounts.account_num)
+    ).all()
+    drift = []
+    if drifted:
+        later = net_flows(session, Transactions, shard, high, None, withdrawal_type_id)
+        drift = [(account_num, balance, total) for account_num, balance, total in drifted
+                 if abs(balance - total - later.get(account_num, 0)) > tolerance]
+    session.commit()
+    return {'last_txn_id': high, 'processed': processed, 'accounts': len(updated),
+            'drift': drift}
+
+
+def reconcile(full: bool = False, tolerance: float = 0.005, batch_size: int = 100000) -> List[dict]:
+    """Reconciles every shard, see reconcile_shard()
+
+    Returns:
+        List[dict]: one report per shard, in shard order, with the shard's bind_key added
+    """
+    reports = []
+    for shard in shard_router.shards:
+        report = reconcile_shard(shard, full, tolerance, batch_size)
+        report['bind_key'] = shard.bind_key
+        reports.append(report)
+    return reports
+
+
+@click.command('reconcile')
+@click.option('--full', is_flag=True, help='Recompute the ledger totals from the whole history.')
+@click.option('--tolerance', type=float, default=None, help='Allowed difference, defaults to RECONCILE_TOLERANCE.')
+@click.option('--batch-size', type=int, default=None, help='Transaction ids per commit, defaults to RECONCILE_BATCH_SIZE.')
+@with_appcontext
+@click.pass_context
+def reconcile_command(ctx, full: bool, tolerance: Optional[float], batch_size: Optional[int]) -> None:
+    """Compare account balances with the transaction ledger, exits with status 1 on drift."""
+    reports = reconcile(
+        full=full,
+        tolerance=tolerance if tolerance is not None else current_app.config['RECONCILE_TOLERANCE'],
+        batch_size=batch_size or current_app.config['RECONCILE_BATCH_SIZE'],
+    )
+    drift = 0
+    for report in reports:
+        click.echo('Shard {}: {} transaction(s) reconciled up to id {}, {} account(s) updated'.format(
+            report['bind_key'] or 'default', report['processed'], report['last_txn_id'], report['accounts']))
+        for account_num, balance, net in report['drift']:
+            click.echo('Drift on account {}: balance {:.2f}, ledger {:.2f}, difference {:.2f}'.format(
+                account_num, balance, net, balance - net))
+        drift += len(report['drift'])
+    if drift:
+        click.echo('{} account(s) drifted'.format(drift))
+        ctx.exit(1)
+    click.echo('No drift')
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from typing import Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+from .models import Role, TransactionType, AppState
+
+# Declarative reference data: rows keyed by their unique name. Other columns are kept in sync on every run.
+REFERENCE_DATA = {
+    Role: [
+        {'name': 'Administrator', 'default': False},
+        {'name': 'Moderator', 'default': False},
+        {'name': 'User', 'default': True},
+    ],
+    TransactionType: [
+        {'name': 'Deposit'},
+        {'name': 'Withdrawal'},
+        {'name': 'Transfer'},
+        {'name': 'New Account'},
+        {'name': 'Other'},
+    ],
+}
+
+VERSION_KEY = 'reference_data_version'
+
+
+def _upsert(model, rows: list) -> sa.sql.Executable:
+    """One INSERT ... ON CONFLICT (name) statement for all rows of a table
+        - DO NOTHING when the rows only carry the name, DO UPDATE of the other columns otherwise
+    """
+    table = model.__table__
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(table).values(rows)
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(table).values(rows)
+    else:
+        raise ValueError('Reference data sync supports SQLite and PostgreSQL, not {}'.format(dialect))
+    updated = [column for column in rows[0] if column != 'name']
+    if not updated:
+        return statement.on_conflict_do_nothing(index_elements=['name'])
+    return statement.on_conflict_do_update(index_elements=['name'],
+                                           set_={column: statement.excluded[column] for column in updated})
+
+
+def sync_reference_data(models: Optional[Iterable] = None) -> None:
+    """Inserts missing reference rows and updates changed ones with one statement per table, then commits
+
+    Args:
+        models (Iterable): models to sync, defaults to every model in REFERENCE_DATA
+    """
+    for model in models or REFERENCE_DATA:
+        db.session.execute(_upsert(model, REFERENCE_DATA[model]))
+    db.session.commit()
+
+
+def reference_data_version() -> str:
+    """Digest of the reference data and of the alembic revision the database is at, so that a migration also
+    triggers a sync
+    """
+    revision = None
+    if sa.inspect(db.session.connection()).has_table('alembic_version'):
+        revision = db.session.execute(sa.text('SELECT version_num FROM alembic_version')).scalar()
+    data = {model.__tablename__: rows for model, rows in REFERENCE_DATA.items()}
+    payload = json.dumps({'revision': revision, 'data': data}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def sync_reference_data_if_changed() -> bool:
+    """Runs the sync only when the stored version differs from the current one, and records the new version
+
+    Returns:
+        bool: True when the sync ran
+    """
+    version = reference_data_version()
+    state = db.session.get(AppState, VERSION_KEY)
+    if state is not None and state.value == version:
+        return False
+    sync_reference_data()
+    _record_version(version)
+    return True
+
+
+def _record_version(version: str) -> None:
+    db.session.merge(AppState(key=VERSION_KEY, value=version))
+    db.session.commit()
+
+
+def init_app(app) -> None:
+    """Startup hook: with SYNC_REFERENCE_DATA_ON_STARTUP the reference data is synced when its version changed.
+    A database without the schema yet is left alone.
+    """
+    app.cli.add_command(sync_reference_data_command)
+    if not app.config.get('SYNC_REFERENCE_DATA_ON_STARTUP'):
+        return
+    with app.app_context():
+        if not sa.inspect(db.engine).has_table(AppState.__tablename__):
+            app.logger.warning('Reference data not synced: schema not created yet')
+            return
+        sync_reference_data_if_changed()
+
+
+@click.command('sync-reference-data')
+@click.option('--if-changed', is_flag=True, help='Skip when the stored reference data version is current.')
+@with_appcontext
+def sync_reference_data_command(if_changed: bool) -> None:
+    """Insert or update roles and transaction types."""
+    if if_changed:
+        synced = sync_reference_data_if_changed()
+    else:
+        sync_reference_data()
+        _record_version(reference_data_version())
+        synced = True
+    click.echo('Reference data synced' if synced else 'Reference data is up to date')
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import click
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+
+
+def read_only(view):
+    """View decorator marking a request as read-only, so its SELECTs may be served by the read replica
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def recently_written() -> bool:
+    """True while the current user is inside the read-your-writes window that follows their last write
+    """
+    return within_write_window(session.get('last_write_at'), current_app.config.get('READ_YOUR_WRITES_SECONDS', 0))
+
+
+def within_write_window(last_write_at, window: float) -> bool:
+    return last_write_at is not None and time.time() - last_write_at < window
+
+
+class RoutingSession(Session):
+    """db.session class sending the reads of read-only requests to the replica bind
+        - Only plain reads are routed: flushes, sessions holding pending changes and requests that already wrote
+          stay on the primary
+        - Requests by a user who wrote within READ_YOUR_WRITES_SECONDS also stay on the primary, so users always
+          see their own transfers and deposits
+        - A commit that flushed changes stamps the user's session with the write time
+        - Statements with execution_options(primary=True) stay on the primary, for reads that must not lag
+
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            return self._db.engines[current_app.config['READ_REPLICA_BIND']]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def flush(self, objects=None) -> None:
+        if self.new or self.dirty or self.deleted:
+            self.info['wrote'] = True
+        super().flush(objects)
+
+    def commit(self) -> None:
+        super().commit()
+        if self.info.pop('wrote', False) and has_request_context():
+            g.wrote_primary = True
+            session['last_write_at'] = time.time()
+
+    def rollback(self) -> None:
+        self.info.pop('wrote', None)
+        super().rollback()
+
+    def _use_replica(self, clause) -> bool:
+        if not has_request_context() or not g.get('read_only') or g.get('wrote_primary'):
+            return False
+        if not current_app.config.get('READ_REPLICA_BIND') or self._flushing or self.info.get('wrote'):
+            return False
+        if clause is not None and (not getattr(clause, 'is_select', False)
+                                   or clause.get_execution_options().get('primary')):
+            return False
+        return not recently_written()
+
+
+class ReadReplica:
+    """Read replica configuration and the local replica stand-in
+        - Config:
+            - READ_REPLICA_BIND (str): key in SQLALCHEMY_BINDS of the replica, None disables routing
+            - READ_YOUR_WRITES_SECONDS (int): how long a user's reads stay on the primary after their own write
+            - READ_REPLICA_REFRESH_SECONDS (int): when set with a SQLite replica, a background thread copies the
+              primary into the replica with SQLite's backup API at this interval
+        - refresh() copies the primary once, `flask replica refresh` does the same from the command line
+
+    """
+
+    def __init__(self) -> None:
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app) -> None:
+        app.extensions['read_replica'] = self
+        app.cli.add_command(replica_cli)
+        interval = app.config.get('READ_REPLICA_REFRESH_SECONDS')
+        if app.config.get('READ_REPLICA_BIND') and interval:
+            self.start(app, interval)
+
+    def refresh(self) -> None:
+        """Copies the primary SQLite database into the replica bind with the online backup API
+        """
+        db = current_app.extensions['sqlalchemy']
+        primary = db.engines[None]
+        replica = db.engines[current_app.config['READ_REPLICA_BIND']]
+        if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+            raise RuntimeError('The replica stand-in only copies SQLite databases')
+        source = primary.raw_connection()
+        target = replica.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            target.close()
+            source.close()
+
+    def start(self, app, interval: float) -> None:
+        """Starts the daemon thread refreshing the replica every interval seconds
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                with app.app_context():
+                    try:
+                        self.refresh()
+                    except (sa.exc.SQLAlchemyError, sqlite3.Error):
+                        app.logger.exception('Read replica refresh failed')
+
+        self._thread = threading.Thread(target=run, name='replica-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+replica_cli = AppGroup('replica', help='Read replica stand-in maintenance.')
+
+
+@replica_cli.command('refresh')
+def refresh_replica() -> None:
+    """Copy the primary database into the read replica."""
+    current_app.extensions['read_replica'].refresh()
+    click.echo('Replica refreshed')
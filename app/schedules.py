@@ -0,0 +1,187 @@
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db, fragment_cache, analytics_cache, balance_cache, shard_router
+from .models import ScheduledTransfer, TransactionType
+
+STATUSES = ['executed', 'insufficient_funds', 'recipient_not_found']
+
+
+def worker_id() -> str:
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def claim_due(worker: str, batch_size: int, lease: timedelta, now: Optional[datetime] = None) -> List[ScheduledTransfer]:
+    """Claims up to batch_size due schedules for a worker and commits the claim
+        - A single UPDATE ... WHERE id IN (SELECT ... ORDER BY next_run_at LIMIT n): the due scan walks the
+          next_run_at index and the claim is atomic, so concurrent workers never claim the same schedule.
+          On PostgreSQL the subquery takes FOR UPDATE SKIP LOCKED, workers skip each other's rows instead of waiting.
+        - A claim expires with its lease, so schedules held by a crashed worker are claimed again
+
+    Args:
+        worker (str): id of the claiming worker, see worker_id()
+        batch_size (int): maximum number of schedules claimed
+        lease (timedelta): how long the claim holds
+        now (datetime): current time, defaults to utcnow
+
+    Returns:
+        List[ScheduledTransfer]: claimed schedules, earliest due first
+    """
+    now = now or datetime.utcnow()
+    table = ScheduledTransfer.__table__
+    due = sa.select(table.c.id).where(
+        table.c.next_run_at <= now,
+        table.c.active.is_(True),
+        sa.or_(table.c.claimed_until.is_(None), table.c.claimed_until < now),
+    ).order_by(table.c.next_run_at).limit(batch_size).with_for_update(skip_locked=True)
+    claimed_until = now + lease
+    db.session.execute(table.update().where(table.c.id.in_(due)).values(claimed_by=worker, claimed_until=claimed_until))
+    db.session.commit()
+    return db.session.query(ScheduledTransfer).filter_by(claimed_by=worker, claimed_until=claimed_until) \
+        .order_by(ScheduledTransfer.next_run_at).all()
+
+
+def advance(schedule: ScheduledTransfer, status: str, now: datetime) -> None:
+    """Records a run and releases the claim
+        - One-off schedules are deactivated
+        - Recurring ones move to their first occurrence after now: runs missed while no worker was running are
+          skipped, not executed back to back
+    """
+    schedule.last_run_at = now
+    schedule.last_status = status
+    schedule.claimed_by = None
+    schedule.claimed_until = None
+    if not schedule.interval_days:
+        schedule.active = False
+        return
+    step = timedelta(days=schedule.interval_days)
+    if schedule.next_run_at <= now:
+        schedule.next_run_at += step * ((now - schedule.next_run_at) // step + 1)
+
+
+def execute_batch(schedules: List[ScheduledTransfer], now: Optional[datetime] = None) -> dict:
+    """Executes claimed schedules and advances them in one transaction
+        - Balances are checked against the batch's own earlier transfers, the accounts are shared in the session
+        - Accounts in the default database: transfers and schedule updates are one commit, a schedule runs exactly
+          once. Accounts on other shards commit before the schedules, a crash in between runs those transfers
+          again once the lease expires.
+        - Each executed transfer queues its notification emails in the same commit, see ShardRouter.transfer()
+
+    Returns:
+        dict: number of schedules per status
+    """
+    now = now or datetime.utcnow()
+    stats = dict.fromkeys(STATUSES, 0)
+    txn_type_id = db.session.query(TransactionType.id).filter_by(name="Transfer").scalar()
+    sessions = []
+    touched = set()
+    try:
+        for schedule in schedules:
+            sender = shard_router.get_account(schedule.sender)
+            recipient = shard_router.get_account(schedule.receiver)
+            if sender is None or recipient is None:
+                status = 'recipient_not_found'
+            elif sender.total_balance < schedule.amount:
+                status = 'insufficient_funds'
+            else:
+                shard_router.transfer(sender, recipient, schedule.amount, txn_type_id, commit=False)
+                for session in (shard_router.session_for(sender), shard_router.session_for(recipient)):
+                    if session is not db.session and session not in sessions:
+                        sessions.append(session)
+                touched.update([sender.account_num, recipient.account_num])
+                status = 'executed'
+            advance(schedule, status, now)
+            stats[status] += 1
+        for session in sessions:
+            session.commit()
+        db.session.commit()
+    except Exception:
+        for session in sessions:
+            session.rollback()
+        db.session.rollback()
+        raise
+    fragment_cache.invalidate(*touched)
+    analytics_cache.invalidate(*touched)
+    balance_cache.refresh(*touched)
+    return stats
+
+
+def run_schedules(batch_size: int = 100, lease: timedelta = timedelta(minutes=5), once: bool = False,
+                  poll: float = 30, max_batches: Optional[int] = None, report=None) -> dict:
+    """Worker loop: claims due schedules batch by batch and executes them
+        - Safe to run in several processes at once, see claim_due()
+        - A failing batch is rolled back and logged, its schedules are retried when their claim expires
+
+    Args:
+        batch_size (int): schedules claimed and executed per transaction
+        lease (timedelta): claim duration, must exceed the time a batch takes
+        once (bool): return when nothing is due instead of polling
+        poll (float): seconds slept when nothing is due
+        max_batches (int): return after this many batches, None runs until interrupted or, with once, until idle
+        report (Callable[[str], None]): receives one metrics line per batch
+
+    Returns:
+        dict: schedules per status, batches, failed_batches, seconds and throughput (schedules per second)
+    """
+    worker = worker_id()
+    totals = dict.fromkeys(STATUSES, 0)
+    totals.update(batches=0, failed_batches=0)
+    start = time.perf_counter()
+    try:
+        while max_batches is None or totals['batches'] < max_batches:
+            claimed = claim_due(worker, batch_size, lease)
+            if not claimed:
+                if once:
+                    break
+                time.sleep(poll)
+                continue
+            batch_start = time.perf_counter()
+            totals['batches'] += 1
+            try:
+                stats = execute_batch(claimed)
+            except Exception:
+                totals['failed_batches'] += 1
+                current_app.logger.exception('Scheduled transfer batch failed')
+                continue
+            for status, count in stats.items():
+                totals[status] += count
+            if report is not None:
+                elapsed = time.perf_counter() - batch_start
+                report('Batch of {} in {:.0f} ms ({:.0f}/s): {}'.format(
+                    len(claimed), elapsed * 1000, len(claimed) / elapsed if elapsed else 0,
+                    ', '.join('{} {}'.format(count, status) for status, count in stats.items())))
+    except KeyboardInterrupt:
+        pass
+    totals['seconds'] = time.perf_counter() - start
+    processed = sum(totals[status] for status in STATUSES)
+    totals['throughput'] = processed / totals['seconds'] if totals['seconds'] else 0
+    return totals
+
+
+@click.command('run-schedules')
+@click.option('--batch-size', type=int, default=None, help='Schedules per transaction, defaults to SCHEDULE_BATCH_SIZE.')
+@click.option('--once', is_flag=True, help='Exit when no schedule is due instead of polling.')
+@click.option('--poll', type=float, default=None, help='Seconds between polls when idle, defaults to SCHEDULE_POLL_SECONDS.')
+@click.option('--max-batches', type=int, default=None, help='Exit after this many batches.')
+@with_appcontext
+def run_schedules_command(batch_size: Optional[int], once: bool, poll: Optional[float], max_batches: Optional[int]) -> None:
+    """Execute due scheduled transfers."""
+    totals = run_schedules(
+        batch_size=batch_size or current_app.config['SCHEDULE_BATCH_SIZE'],
+        lease=timedelta(seconds=current_app.config['SCHEDULE_LEASE_SECONDS']),
+        once=once,
+        poll=poll if poll is not None else current_app.config['SCHEDULE_POLL_SECONDS'],
+        max_batches=max_batches,
+        report=click.echo,
+    )
+    click.echo('Ran {} schedule(s) in {} batch(es), {} failed, {:.1f} s, {:.1f} schedules/s ({})'.format(
+        sum(totals[status] for status in STATUSES), totals['batches'], totals['failed_batches'], totals['seconds'],
+        totals['throughput'], ', '.join('{} {}'.format(totals[status], status) for status in STATUSES)))
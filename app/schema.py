@@ -0,0 +1,38 @@
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_migrate import stamp
+
+from . import db, shard_router
+from .reference_data import sync_reference_data, reference_data_version, _record_version
+
+
+def bootstrap_schema() -> None:
+    """Creates the current schema on an empty database without replaying migrations
+        - CREATE TABLE straight from the models on the default database and on every shard, then stamps
+          alembic_version at the migration head so that later `flask db upgrade` runs continue from there
+        - Syncs the reference data, as the reference data sync after an upgrade would
+
+    Raises:
+        ValueError: when the default database already has tables, use `flask db upgrade` there
+    """
+    tables = sa.inspect(db.engine).get_table_names()
+    if tables:
+        raise ValueError('Database already has {} table(s), use flask db upgrade'.format(len(tables)))
+    db.create_all()
+    shard_router.create_all()
+    stamp(directory=current_app.extensions['migrate'].directory)
+    sync_reference_data()
+    _record_version(reference_data_version())
+
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap_command() -> None:
+    """Create the current schema on an empty database and stamp it."""
+    try:
+        bootstrap_schema()
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo('Schema created and stamped at the migration head')
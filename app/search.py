@@ -0,0 +1,144 @@
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import sqlalchemy as sa
+
+from .models import Transactions
+from .sharding import Shard
+
+TransactionFilter = namedtuple('TransactionFilter', ['date_from', 'date_to', 'type_id', 'account', 'amount_min',
+                                                     'amount_max'], defaults=(None,) * 6)
+TransactionFilter.__doc__ = """Support search criteria, None leaves a criterion out
+    - date_from, date_to (date): inclusive day range
+    - type_id (int): transaction type
+    - account (int): sender or receiver
+    - amount_min, amount_max (float): inclusive amount range
+"""
+
+# Position in the newest first order, the keyset of the next page: (date_time, shard index, id). Ids are only unique
+# within a shard, the shard index orders rows of different shards with the same date_time and id.
+Cursor = Tuple[datetime, int, int]
+
+
+def validate_filter(filters: TransactionFilter) -> None:
+    """Rejects criteria the search cannot serve from an index
+        - An amount range is checked row by row on top of an index range, it cannot drive the search on its own
+
+    Raises:
+        ValueError: with a message for the search form
+    """
+    if (filters.amount_min is not None or filters.amount_max is not None) and all(
+            value is None for value in (filters.account, filters.type_id, filters.date_from, filters.date_to)):
+        raise ValueError('An amount range needs an account, a type or a date range')
+    for low, high in ((filters.date_from, filters.date_to), (filters.amount_min, filters.amount_max)):
+        if low is not None and high is not None and low > high:
+            raise ValueError('Range ends before it starts')
+
+
+def _predicates(filters: TransactionFilter, before: Optional[Cursor], shard_index: int) -> list:
+    """Predicates comparing bare columns to constants, so each one is a range of an index
+        - Whole days become a half-open date_time range instead of a DATE() of the column
+        - The cursor continues the (date_time, id) index range: on the cursor's shard with a row value comparison,
+          on the shards ordered before it up to and including its date_time, after it strictly before
+    """
+    predicates = []
+    if filters.date_from is not None:
+        predicates.append(Transactions.date_time >= datetime.combine(filters.date_from, datetime.min.time()))
+    if filters.date_to is not None:
+        predicates.append(Transactions.date_time < datetime.combine(filters.date_to + timedelta(days=1), datetime.min.time()))
+    if filters.type_id is not None:
+        predicates.append(Transactions.transaction_type_id == filters.type_id)
+    if filters.amount_min is not None:
+        predicates.append(Transactions.amount >= filters.amount_min)
+    if filters.amount_max is not None:
+        predicates.append(Transactions.amount <= filters.amount_max)
+    if before is not None:
+        date_time, before_shard, txn_id = before
+        if shard_index == before_shard:
+            predicates.append(sa.tuple_(Transactions.date_time, Transactions.id) < sa.tuple_(date_time, txn_id))
+        elif shard_index < before_shard:
+            predicates.append(Transactions.date_time <= date_time)
+        else:
+            predicates.append(Transactions.date_time < date_time)
+    return predicates
+
+
+def search_query(filters: TransactionFilter, before: Optional[Cursor] = None, limit: int = 25,
+                 shard: Optional[Shard] = None, shard_index: int = 0) -> sa.Select:
+    """Newest first page of the transactions matching filters on one database
+        - Every plan is a range scan of one index in (date_time, id) order, stopping after limit rows:
+            - account: (sender, date_time, id) and (receiver, date_time, id), one branch each, instead of an OR
+              that no single index serves. The receiver branch leaves out deposits, already found as sender.
+            - type: (transaction_type_id, date_time, id)
+            - otherwise: date_time
+        - With a shard, transactions whose sender the shard does not own are left out: a cross-shard transfer is
+          stored on both shards and is listed from the sender's
+
+    Args:
+        filters (TransactionFilter): search criteria
+        before (Cursor): cursor of the last row of the previous page
+        limit (int): page size
+        shard (Shard): shard the query runs on when the accounts are sharded
+        shard_index (int): position of the shard in the router's list, compared with the cursor's
+
+    Raises:
+        ValueError: for criteria without an index to drive the search, see validate_filter()
+
+    Returns:
+        sa.Select: select of Transactions
+    """
+    validate_filter(filters)
+    predicates = _predicates(filters, before, shard_index)
+    if shard is not None:
+        predicates.append(Transactions.sender.between(shard.first, shard.last) if shard.last is not None
+                          else Transactions.sender >= shard.first)
+    order = (Transactions.date_time.desc(), Transactions.id.desc())
+    if filters.account is None:
+        return sa.select(Transactions).where(*predicates).order_by(*order).limit(limit)
+    branches = [
+        sa.select(Transactions.id).where(Transactions.sender == filters.account, *predicates),
+        sa.select(Transactions.id).where(Transactions.receiver == filters.account,
+                                         Transactions.sender != filters.account, *predicates),
+    ]
+    ids = sa.union_all(*(sa.select(branch.order_by(*order).limit(limit).subquery()) for branch in branches)).subquery()
+    return sa.select(Transactions).where(Transactions.id.in_(sa.select(ids.c.id))).order_by(*order).limit(limit)
+
+
+def search_transactions(filters: TransactionFilter, before: Optional[Cursor] = None, limit: int = 25) -> List[Transactions]:
+    """Page of matching transactions over every shard, newest first, merged in cursor order
+        - Only transactions_table is searched, transactions older than the archive horizon are not found. Their
+          postings stay in the account history, see ledger.account_history.
+
+    Returns:
+        List[Transactions]: at most limit transactions, the last one's cursor() continues the search
+    """
+    from . import shard_router
+    pages = []
+    for index, shard in enumerate(shard_router.shards):
+        query = search_query(filters, before, limit, shard if shard_router.enabled else None, index)
+        pages.append(shard_router.session(shard).execute(query).scalars().all())
+    return list(heapq.merge(*pages, key=cursor, reverse=True))[:limit]
+
+
+def cursor(transaction) -> Cursor:
+    """Cursor of a transaction found by search_transactions(), which lists it from its sender's shard
+    """
+    from . import shard_router
+    shard_index = shard_router.shards.index(shard_router.shard_for(transaction.sender)) if shard_router.enabled else 0
+    return transaction.date_time, shard_index, transaction.id
+
+
+def encode_cursor(value: Cursor) -> str:
+    return '{}_{}_{}'.format(value[0].isoformat(), value[1], value[2])
+
+
+def decode_cursor(text: Optional[str]) -> Optional[Cursor]:
+    """Parses a cursor from encode_cursor(), None for a missing or malformed one
+    """
+    try:
+        date_time, shard_index, txn_id = text.rsplit('_', 2)
+        return datetime.fromisoformat(date_time), int(shard_index), int(txn_id)
+    except (AttributeError, ValueError):
+        return None
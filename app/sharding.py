@@ -0,0 +1,312 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app, g
+from flask.cli import AppGroup
+
+from . import db
+
+Shard = namedtuple('Shard', ['bind_key', 'first', 'last'])
+Shard.__doc__ = """Account number range [first, last] stored in the database of bind_key. A last of None leaves the range open"""
+
+
+class ShardRouter:
+    """Routes Accounts and Transactions operations to the database that owns the account number
+        - Shards are configured with ACCOUNT_SHARDS, a list of (bind_key, first_account_num, last_account_num)
+          tuples. The bind keys refer to SQLALCHEMY_BINDS, None is the default database.
+        - Users, roles and transaction types always live in the default database
+        - Without ACCOUNT_SHARDS there is a single open ended shard on the default database and every call
+          resolves to db.session, so the app behaves exactly as an unsharded one
+        - Transfers between accounts on different shards go through a two-phase protocol, see transfer()
+
+    """
+
+    # Tries at the next account number of a shard, each lost to a concurrent registration reads it again
+    ACCOUNT_NUMBER_ATTEMPTS = 5
+
+    def init_app(self, app) -> None:
+        shards = app.config.get('ACCOUNT_SHARDS')
+        app.extensions['account_shards'] = [Shard(*shard) for shard in shards] if shards else [Shard(None, 1, None)]
+        app.extensions['shard_router'] = self
+        app.teardown_appcontext(self._close_sessions)
+        app.cli.add_command(shards_cli)
+
+    @property
+    def shards(self) -> List[Shard]:
+        return current_app.extensions['account_shards']
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.shards) > 1
+
+    def shard_for(self, account_num: int) -> Optional[Shard]:
+        """Returns the shard whose range contains the account number, None if no shard owns it
+        """
+        for shard in self.shards:
+            if shard.first <= account_num and (shard.last is None or account_num <= shard.last):
+                return shard
+        return None
+
+    def session(self, shard: Shard):
+        """Returns the session for a shard. The default database uses db.session, other binds get a session per
+        app context where the sharded models are bound to the shard's engine and every other model to the default
+        engine.
+        """
+        if shard.bind_key is None:
+            return db.session
+        sessions = g.setdefault('_shard_sessions', {})
+        if shard.bind_key not in sessions:
+            engine = db.engines[shard.bind_key]
+            sessions[shard.bind_key] = sa.orm.Session(bind=db.engine, binds={
+                model: engine for model in self.sharded_models()})
+        return sessions[shard.bind_key]
+
+    @staticmethod
+    def sharded_models() -> list:
+        """Models stored on the shard that owns the account: accounts, their balance stripes, transactions and
+        postings with their archives, the cross-shard transfer log, the reconciliation and deposit ingest state and
+        the notification outbox
+        """
+        from .models import Accounts, BalanceStripe, Transactions, ArchivedTransactions, Posting, ArchivedPosting, \
+            ShardTransferLog, LedgerTotal, ReconciliationCheckpoint, IngestCheckpoint, OutboxMessage
+        return [Accounts, BalanceStripe, Transactions, ArchivedTransactions, Posting, ArchivedPosting, ShardTransferLog,
+                LedgerTotal, ReconciliationCheckpoint, IngestCheckpoint, OutboxMessage]
+
+    def session_for(self, account):
+        """Returns the session owning an account's rows
+        """
+        return self.session(self.shard_for(account.account_num))
+
+    def get_account(self, account_num: int):
+        """Looks up an account on the shard owning its number
+
+        Returns:
+            Optional[Accounts]: None when the account does not exist
+        """
+        shard = self.shard_for(account_num)
+        if shard is None:
+            return None
+        from .models import Accounts
+        return self.session(shard).query(Accounts).filter_by(account_num=account_num).first()
+
+    def find_accounts_by_owner(self, owner_id: int) -> List:
+        """Looks up all of a user's accounts on every shard
+
+        Returns:
+            List[Accounts]: accounts ordered by account number
+        """
+        from .models import Accounts
+        accounts = []
+        for shard in self.shards:
+            accounts += self.session(shard).query(Accounts).filter_by(owner=owner_id).all()
+        return sorted(accounts, key=lambda account: account.account_num)
+
+    def portfolio(self, owner_id: int, since: datetime) -> List:
+        """Balance and recent activity of each of a user's accounts, one grouped query per shard
+            - Read from the postings index: the balance is the sum of the account's postings and a transfer
+              between two accounts of the same user counts for both
+
+        Args:
+            owner_id (int): user id
+            since (datetime): start of the recent activity window
+
+        Returns:
+            List[Row]: account_num, balance, recent_count and last_activity per account, ordered by account number
+        """
+        from .models import Accounts, Posting
+        from .ledger import BALANCE_FORWARD
+        recent = sa.and_(Posting.posted_at >= since, Posting.txn_id != BALANCE_FORWARD)
+        query = sa.select(
+            Accounts.account_num,
+            sa.func.coalesce(sa.func.sum(Posting.amount), 0).label('balance'),
+            sa.func.count(sa.case((recent, Posting.id))).label('recent_count'),
+            sa.func.max(sa.case((recent, Posting.posted_at))).label('last_activity'),
+        ).outerjoin(Posting, Posting.account_num == Accounts.account_num) \
+            .where(Accounts.owner == owner_id).group_by(Accounts.account_num)
+        rows = []
+        for shard in self.shards:
+            rows += self.session(shard).execute(query).all()
+        return sorted(rows, key=lambda row: row.account_num)
+
+    def create_account(self, user):
+        """Opens an account for a user and commits it
+            - Unsharded, the account number comes from the database autoincrement
+            - Sharded, the shard is picked from the user id and the account gets the next number of that shard's range.
+              Two registrations reading the same maximum collide on the primary key, the loser reads it again and
+              retries, up to ACCOUNT_NUMBER_ATTEMPTS times.
+
+        Raises:
+            RuntimeError: every shard range is exhausted, or the attempts ran out on a busy shard
+        """
+        from .models import Accounts
+        if not self.enabled:
+            account = Accounts(owner=user.id)
+            db.session.add(account)
+            db.session.commit()
+            return account
+        for offset in range(len(self.shards)):
+            shard = self.shards[(user.id + offset) % len(self.shards)]
+            session = self.session(shard)
+            for _ in range(self.ACCOUNT_NUMBER_ATTEMPTS):
+                last_num = session.query(sa.func.max(Accounts.account_num)).filter(
+                    Accounts.account_num >= shard.first).scalar()
+                account_num = shard.first if last_num is None else last_num + 1
+                if shard.last is not None and account_num > shard.last:
+                    break
+                account = Accounts(account_num=account_num, owner=user.id)
+                session.add(account)
+                try:
+                    session.commit()
+                except sa.exc.IntegrityError:
+                    # A concurrent registration took the number, read the new maximum
+                    session.rollback()
+                    continue
+                return account
+            else:
+                raise RuntimeError('No account number allocated on shard {} after {} attempts'.format(
+                    shard.bind_key or 'default', self.ACCOUNT_NUMBER_ATTEMPTS))
+        raise RuntimeError('No account numbers left on any shard')
+
+    def transfer(self, sender, recipient, amount: float, txn_type_id: int, commit: bool = True) -> None:
+        """Moves funds between two accounts and records the transaction
+            - Both accounts on one shard: a single local commit
+            - Accounts on different shards: two-phase protocol
+                1.) a 'prepared' ShardTransfer is committed to the coordinator log in the default database
+                2.) prepare: each shard applies its balance change, a Transactions row and a ShardTransferLog marker,
+                    then flushes, which takes the shard's write lock and checks constraints.
+                    Any failure rolls every shard back and marks the transfer 'aborted'
+                3.) commit: the shards commit in order and the transfer is marked 'committed'
+              A crash during phase 3 leaves a 'prepared' transfer with some markers present, which
+              recover() rolls forward.
+            - The sent and received emails are queued in the outbox of the session committing each account's side,
+              see notify_transfer()
+
+        Args:
+            sender (Accounts): account debited
+            recipient (Accounts): account credited
+            amount (float): amount transferred
+            txn_type_id (int): transaction type recorded on the Transactions rows
+            commit (bool): False leaves a same-shard transfer pending in the session, for callers batching several
+                transfers in one commit. Cross-shard transfers always commit.
+        """
+        from .notifications import notify_transfer
+        sender_session = self.session_for(sender)
+        recipient_session = self.session_for(recipient)
+        now = datetime.utcnow()
+        if sender_session is recipient_session:
+            from .models import Transactions
+            recipient.update_balance(amount)
+            sender.update_balance(-amount)
+            txn = Transactions(receiver=recipient.account_num, sender=sender.account_num, amount=amount,
+                               date_time=now, transaction_type_id=txn_type_id)
+            sender_session.add_all([recipient, sender, txn, *txn.postings()])
+            for account in (sender, recipient):
+                notify_transfer(account, sender.account_num, recipient.account_num, amount)
+            if commit:
+                sender_session.commit()
+            return
+
+        from .models import ShardTransfer
+        coordinator = ShardTransfer(sender=sender.account_num, receiver=recipient.account_num, amount=amount,
+                                    state='prepared', created_at=now)
+        db.session.add(coordinator)
+        db.session.commit()
+        participants = [(sender_session, sender, -amount), (recipient_session, recipient, amount)]
+        try:
+            for session, account, delta in participants:
+                self._apply(session, coordinator, account, delta, txn_type_id)
+                session.flush()
+        except Exception:
+            for session, _, _ in participants:
+                session.rollback()
+            coordinator.state = 'aborted'
+            db.session.commit()
+            raise
+        for session, _, _ in participants:
+            session.commit()
+        coordinator.state = 'committed'
+        db.session.commit()
+
+    def recover(self, older_than: timedelta = timedelta(minutes=5)) -> dict:
+        """Resolves cross-shard transfers left 'prepared' by a crashed coordinator
+            - No shard applied the transfer: marked 'aborted'
+            - Some shards applied it: the missing sides are applied and the transfer is marked 'committed'
+
+        Args:
+            older_than (timedelta): only transfers prepared at least this long ago are touched, so in-flight ones are left alone
+
+        Returns:
+            dict: number of transfers 'committed' and 'aborted'
+        """
+        from .models import ShardTransfer, ShardTransferLog, TransactionType
+        txn_type_id = db.session.query(TransactionType.id).filter_by(name="Transfer").scalar()
+        cutoff = datetime.utcnow() - older_than
+        outcome = {'committed': 0, 'aborted': 0}
+        pending = ShardTransfer.query.filter(ShardTransfer.state == 'prepared', ShardTransfer.created_at < cutoff).all()
+        for transfer in pending:
+            sides = [(transfer.sender, -transfer.amount), (transfer.receiver, transfer.amount)]
+            missing = []
+            for account_num, delta in sides:
+                session = self.session(self.shard_for(account_num))
+                if session.get(ShardTransferLog, (transfer.id, account_num)) is None:
+                    missing.append((session, account_num, delta))
+            if len(missing) == len(sides):
+                transfer.state = 'aborted'
+            else:
+                for session, account_num, delta in missing:
+                    self._apply(session, transfer, self.get_account(account_num), delta, txn_type_id)
+                    session.commit()
+                transfer.state = 'committed'
+            db.session.commit()
+            outcome[transfer.state] += 1
+        return outcome
+
+    def create_all(self) -> None:
+        """Creates the sharded tables on every shard database that is not the default one
+        """
+        tables = [model.__table__ for model in self.sharded_models()]
+        for shard in self.shards:
+            if shard.bind_key is not None:
+                db.metadata.create_all(db.engines[shard.bind_key], tables=tables)
+
+    @staticmethod
+    def _apply(session, transfer, account, delta: float, txn_type_id: int) -> None:
+        """One shard's side of a cross-shard transfer: balance change, transaction, posting, log marker and the
+        account's notification email, all committed together by the caller
+        """
+        from .models import Transactions, ShardTransferLog
+        from .notifications import notify_transfer
+        account.update_balance(delta)
+        txn = Transactions(receiver=transfer.receiver, sender=transfer.sender, amount=transfer.amount,
+                           date_time=transfer.created_at, transaction_type_id=txn_type_id)
+        postings = [posting for posting in txn.postings() if posting.account_num == account.account_num]
+        session.add_all([account, txn, *postings, ShardTransferLog(transfer_id=transfer.id, account_num=account.account_num)])
+        notify_transfer(account, transfer.sender, transfer.receiver, transfer.amount)
+
+    @staticmethod
+    def _close_sessions(exc) -> None:
+        for session in g.pop('_shard_sessions', {}).values():
+            session.close()
+
+
+shards_cli = AppGroup('shards', help='Account shard maintenance.')
+
+
+@shards_cli.command('create')
+def create_shards() -> None:
+    """Create the accounts and transactions tables on every shard database."""
+    from . import shard_router
+    shard_router.create_all()
+    click.echo('Created sharded tables on {} shard(s)'.format(len(shard_router.shards)))
+
+
+@shards_cli.command('recover')
+@click.option('--older-than', default=300, show_default=True, help='Seconds a transfer must have been prepared for.')
+def recover_transfers(older_than: int) -> None:
+    """Resolve cross-shard transfers left prepared by a crash."""
+    from . import shard_router
+    outcome = shard_router.recover(timedelta(seconds=older_than))
+    click.echo('Committed {committed}, aborted {aborted} transfer(s)'.format(**outcome))
@@ -0,0 +1,135 @@
+import time
+from typing import Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+
+from . import shard_router
+from .models import Accounts, BalanceStripe
+
+
+def stripe_account(account_num: int, stripes: int) -> None:
+    """Spreads an account's future credits over stripes BalanceStripe rows, for accounts receiving many
+    concurrent transfers. Changing the number of stripes of a striped account compacts it first.
+
+    Raises:
+        ValueError: for an unknown account or fewer than 2 stripes, use unstripe_account() to go back
+    """
+    if stripes < 2:
+        raise ValueError('A striped account needs at least 2 stripes')
+    session, account = _account(account_num)
+    if account.stripes:
+        compact_account(session, account_num)
+        session.execute(sa.delete(BalanceStripe).where(BalanceStripe.account_num == account_num))
+    session.add_all([BalanceStripe(account_num=account_num, stripe=stripe, balance=0) for stripe in range(stripes)])
+    account.stripes = stripes
+    session.commit()
+
+
+def unstripe_account(account_num: int) -> None:
+    """Folds the stripes into the balance and credits the account directly again
+
+    Raises:
+        ValueError: for an unknown account
+    """
+    session, account = _account(account_num)
+    compact_account(session, account_num)
+    session.execute(sa.delete(BalanceStripe).where(BalanceStripe.account_num == account_num))
+    account.stripes = 0
+    session.commit()
+
+
+def _account(account_num: int):
+    account = shard_router.get_account(account_num)
+    if account is None:
+        raise ValueError('Account {} does not exist'.format(account_num))
+    return shard_router.session_for(account), account
+
+
+def compact_account(session, account_num: int) -> float:
+    """Moves the credits held in an account's stripes into Accounts.balance, without committing
+        - Each stripe is decreased by the amount read from it rather than set to 0, so a credit committed by
+          another connection between the read and the update is kept on databases that do not serialize writers
+
+    Returns:
+        float: amount moved
+    """
+    held = session.execute(sa.select(BalanceStripe.stripe, BalanceStripe.balance)
+                           .where(BalanceStripe.account_num == account_num, BalanceStripe.balance != 0)).all()
+    for stripe, amount in held:
+        session.execute(sa.update(BalanceStripe)
+                        .where(BalanceStripe.account_num == account_num, BalanceStripe.stripe == stripe)
+                        .values(balance=BalanceStripe.balance - amount))
+    moved = sum(amount for _, amount in held)
+    if moved:
+        session.execute(sa.update(Accounts).where(Accounts.account_num == account_num)
+                        .values(balance=Accounts.balance + moved))
+    return moved
+
+
+def compact_stripes(account_nums: Optional[Iterable[int]] = None) -> dict:
+    """Compacts striped accounts, one commit per account so credits wait on a single short transaction
+
+    Args:
+        account_nums (Iterable[int]): accounts to compact, every striped account on every shard by default
+
+    Returns:
+        dict: accounts compacted and amount moved
+    """
+    stats = {'accounts': 0, 'moved': 0.0}
+    for shard in shard_router.shards:
+        session = shard_router.session(shard)
+        query = sa.select(Accounts.account_num).where(
+            Accounts.stripes > 0, Accounts.account_num.between(shard.first, shard.last) if shard.last is not None
+            else Accounts.account_num >= shard.first)
+        if account_nums is not None:
+            query = query.where(Accounts.account_num.in_(list(account_nums)))
+        for account_num in session.execute(query).scalars().all():
+            moved = compact_account(session, account_num)
+            session.commit()
+            stats['accounts'] += 1
+            stats['moved'] += moved
+    return stats
+
+
+balances_cli = AppGroup('balances', help='Striped balance maintenance.')
+
+
+@balances_cli.command('stripe')
+@click.argument('account_num', type=int)
+@click.option('--stripes', type=int, default=None, help='Stripes taking the credits, defaults to BALANCE_STRIPES.')
+def stripe_command(account_num: int, stripes: Optional[int]) -> None:
+    """Spread an account's credits over stripe rows."""
+    stripes = stripes or current_app.config['BALANCE_STRIPES']
+    try:
+        stripe_account(account_num, stripes)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo('Account {} credits go to {} stripes'.format(account_num, stripes))
+
+
+@balances_cli.command('unstripe')
+@click.argument('account_num', type=int)
+def unstripe_command(account_num: int) -> None:
+    """Fold an account's stripes back into its balance."""
+    try:
+        unstripe_account(account_num)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo('Account {} is credited directly'.format(account_num))
+
+
+@balances_cli.command('compact')
+@click.option('--loop', is_flag=True, help='Keep compacting every --poll seconds.')
+@click.option('--poll', type=float, default=None, help='Seconds between runs, defaults to BALANCE_COMPACT_SECONDS.')
+def compact_command(loop: bool, poll: Optional[float]) -> None:
+    """Fold the credits held in stripes into the account balances."""
+    poll = poll or current_app.config['BALANCE_COMPACT_SECONDS']
+    while True:
+        stats = compact_stripes()
+        click.echo('Compacted {accounts} account(s), moved {moved}'.format(**stats))
+        if not loop:
+            return
+        time.sleep(poll)
@@ -0,0 +1,5 @@
+import os
+from app.asgi import create_asgi_app
+
+# Read-only API served with async sessions: uvicorn asgi:app. Every other route stays with webapp.py.
+app = create_asgi_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -0,0 +1,182 @@
+"""Read concurrency benchmark: WSGI (thread per request) against ASGI (async sessions) on the read-only API
+
+Seeds a SQLite database with one user and their transactions, starts each server in its own process on the same
+database, then opens --connections keep-alive connections at once, each issuing --requests GET requests, and
+reports throughput and latency percentiles per mode.
+
+    python benchmarks/read_concurrency.py --connections 500 --requests 20 --path /api/history
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WSGI_SERVER = 'from werkzeug.serving import run_simple; from webapp import app; ' \
+              'run_simple("127.0.0.1", {port}, app, threaded=True)'
+
+
+def seed(transactions: int) -> str:
+    """Creates the schema, one user with an account and its transaction history
+
+    Returns:
+        str: session cookie of the user, signed with the app's SECRET_KEY
+    """
+    from app import create_app, db
+    from app.models import User, Role, Accounts, Transactions, TransactionType
+    app = create_app('development')
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        user = User(first_name='bench', last_name='user', email='bench@email.com')
+        account = Accounts(account_owner=user, balance=transactions)
+        db.session.add_all([user, account])
+        db.session.flush()
+        deposit = db.session.query(TransactionType.id).filter_by(name='Deposit').scalar()
+        now = datetime.utcnow()
+        txns = [Transactions(receiver=account.account_num, sender=account.account_num, amount=1,
+                             date_time=now - timedelta(minutes=i), transaction_type_id=deposit)
+                for i in range(transactions)]
+        db.session.add_all(txns + [posting for txn in txns for posting in txn.postings()])
+        db.session.commit()
+        serializer = app.session_interface.get_signing_serializer(app)
+        return serializer.dumps({'_user_id': str(user.id), '_fresh': True})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Server on port {} did not start'.format(port))
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple:
+    """Reads one HTTP/1.1 response, sized by Content-Length or chunked
+
+    Returns:
+        tuple: status code and whether the server keeps the connection open
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def load(port: int, path: str, cookie: str, connections: int, requests: int, timeout: float = 60) -> dict:
+    """Runs the clients concurrently. A client reconnects when the server closes the connection, as the threaded
+    development server does after every response.
+    """
+    request = ('GET {} HTTP/1.1\r\nHost: 127.0.0.1:{}\r\nCookie: session={}\r\n\r\n'
+               .format(path, port, cookie)).encode('latin-1')
+    latencies = []
+    errors = 0
+
+    async def client() -> None:
+        nonlocal errors
+        writer = None
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                errors += 1
+                status, keep_alive = None, False
+            else:
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(connections)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float('nan')
+
+    return {'requests': len(latencies), 'errors': errors, 'seconds': elapsed,
+            'throughput': len(latencies) / elapsed, 'p50': percentile(0.5), 'p90': percentile(0.9),
+            'p99': percentile(0.99)}
+
+
+def run_mode(name: str, command: list, port: int, args, cookie: str, env: dict) -> dict:
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        asyncio.run(load(port, args.path, cookie, min(10, args.connections), 2)) # warm up
+        result = asyncio.run(load(port, args.path, cookie, args.connections, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+    result['mode'] = name
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=200, help='concurrent keep-alive connections')
+    parser.add_argument('--requests', type=int, default=20, help='requests per connection')
+    parser.add_argument('--path', default='/api/history', help='read endpoint to load')
+    parser.add_argument('--transactions', type=int, default=500, help='transactions seeded for the user')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, FLASK_CONFIG='development',
+                   DEV_DATABASE_URL='sqlite:///' + os.path.join(tmpdir, 'bench.sqlite'),
+                   JINJA_BYTECODE_CACHE_DIR=os.path.join(tmpdir, 'jinja'))
+        os.environ.update(env)
+        cookie = seed(args.transactions)
+        wsgi_port, asgi_port = free_port(), free_port()
+        results = [
+            run_mode('wsgi', [sys.executable, '-c', WSGI_SERVER.format(port=wsgi_port)], wsgi_port, args, cookie, env),
+            run_mode('asgi', [sys.executable, '-m', 'uvicorn', '--port', str(asgi_port), '--log-level', 'warning',
+                              'asgi:app'], asgi_port, args, cookie, env),
+        ]
+
+    print('{} connections x {} requests on {}'.format(args.connections, args.requests, args.path))
+    print('{:<6}{:>10}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('mode', 'requests', 'errors', 'req/s', 'p50 ms', 'p90 ms',
+                                                          'p99 ms'))
+    for result in results:
+        print('{mode:<6}{requests:>10}{errors:>8}{throughput:>10.1f}{p50:>10.1f}{p90:>10.1f}{p99:>10.1f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Recipient lookup benchmark: loads the directory index from a database of --users users and times prefix lookups
+
+    python benchmarks/recipient_lookup.py --users 1000000 --lookups 10000
+"""
+import argparse
+import os
+import random
+import resource
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def random_name(rng: random.Random) -> str:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+
+def seed(users: int, rng: random.Random) -> None:
+    from app import db
+    from app.models import User, Accounts
+    batch = 50000
+    for start in range(1, users + 1, batch):
+        ids = range(start, min(start + batch, users + 1))
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'first_name': random_name(rng), 'last_name': random_name(rng), 'email': 'u{}@email.com'.format(i)}
+            for i in ids])
+        db.session.execute(Accounts.__table__.insert(), [{'account_num': i, 'owner': i, 'balance': 0} for i in ids])
+    db.session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['DEV_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+        os.environ['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(tmpdir, 'jinja')
+        from app import create_app, db, recipient_directory
+        app = create_app('development')
+        with app.app_context():
+            db.create_all()
+            seed(args.users, rng)
+
+            start = time.perf_counter()
+            recipient_directory.refresh()
+            load_seconds = time.perf_counter() - start
+
+            queries = [random_name(rng)[:rng.randint(1, 4)] for _ in range(args.lookups // 2)]
+            queries += [str(rng.randint(1, args.users))[:rng.randint(1, 7)] for _ in range(args.lookups - len(queries))]
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                recipient_directory.search(query)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KiB on Linux
+    print('{} users indexed in {:.1f} s, peak RSS {:.0f} MB'.format(len(recipient_directory), load_seconds, max_rss / 1024))
+    print('{} lookups: p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+        len(latencies), latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+        latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Hot account contention benchmark: --workers threads credit one account --credits times each, first as a plain
+account then split into --stripes stripes with a compactor running, and report throughput, lock waits and lost credits
+
+    python benchmarks/striped_balance.py --workers 16 --credits 500 --stripes 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy as sa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MERCHANT = 1
+
+
+def credit_worker(app, credits: int, stats: dict, start: threading.Barrier) -> None:
+    """Credits the merchant one unit per transaction through Accounts.update_balance, retrying on a locked database"""
+    from app import db
+    from app.models import Accounts
+    with app.app_context():
+        start.wait()
+        for _ in range(credits):
+            while True:
+                started = time.perf_counter()
+                try:
+                    account = db.session.get(Accounts, MERCHANT)
+                    account.update_balance(1)
+                    db.session.commit()
+                    break
+                except sa.exc.OperationalError:
+                    db.session.rollback()
+                    stats['retries'] += 1
+                finally:
+                    stats['wait'] += time.perf_counter() - started
+                    db.session.expunge_all()
+
+
+def compactor(app, done: threading.Event, stats: dict) -> None:
+    """Folds the stripes every 10 ms while the workers credit them, like `flask balances compact --loop`"""
+    from app.stripes import compact_stripes
+    with app.app_context():
+        while not done.wait(0.01):
+            try:
+                stats['compactions'] += compact_stripes()['accounts']
+            except sa.exc.OperationalError:
+                pass
+
+
+def run(app, workers: int, credits: int, compact: bool) -> dict:
+    stats = {'retries': 0, 'wait': 0.0, 'compactions': 0}
+    start = threading.Barrier(workers + 1)
+    threads = [threading.Thread(target=credit_worker, args=(app, credits, stats, start)) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    done = threading.Event()
+    folding = threading.Thread(target=compactor, args=(app, done, stats))
+    start.wait()
+    started = time.perf_counter()
+    if compact:
+        folding.start()
+    for thread in threads:
+        thread.join()
+    stats['seconds'] = time.perf_counter() - started
+    done.set()
+    if compact:
+        folding.join()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--credits', type=int, default=500)
+    parser.add_argument('--stripes', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['DEV_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+        os.environ['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(tmpdir, 'jinja')
+        from app import create_app, db
+        from app.models import Accounts
+        from app.stripes import stripe_account, compact_stripes
+        app = create_app('development')
+        with app.app_context():
+            db.create_all()
+            db.session.add(Accounts(account_num=MERCHANT, balance=0))
+            db.session.commit()
+
+        expected = args.workers * args.credits
+        for mode in ('plain', 'striped'):
+            with app.app_context():
+                db.session.execute(sa.update(Accounts).values(balance=0))
+                db.session.commit()
+                if mode == 'striped':
+                    stripe_account(MERCHANT, args.stripes)
+            stats = run(app, args.workers, args.credits, compact=mode == 'striped')
+            with app.app_context():
+                compact_stripes()
+                total = db.session.get(Accounts, MERCHANT).total_balance
+            print('{:<8} {:>7.0f} credits/s, {:>5} lock retries, mean wait {:.2f} ms, {:>4} compactions, '
+                  '{} of {} credits lost'.format(mode, expected / stats['seconds'], stats['retries'],
+                                                 stats['wait'] / expected * 1000, stats['compactions'],
+                                                 expected - int(total), expected))
+
+
+if __name__ == '__main__':
+    main()
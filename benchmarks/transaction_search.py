@@ -0,0 +1,94 @@
+"""Transaction search benchmark: seeds --transactions transactions over --accounts accounts and times first and
+next pages of the support search for each kind of criteria
+
+    python benchmarks/transaction_search.py --transactions 10000000 --searches 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(transactions: int, accounts: int, rng: random.Random) -> datetime:
+    """Inserts accounts and transactions spread over a year, one per minute or so
+
+    Returns:
+        datetime: date time of the oldest transaction
+    """
+    from app import db
+    from app.models import Accounts, Transactions
+    db.session.execute(Accounts.__table__.insert(), [{'account_num': i, 'balance': 0} for i in range(1, accounts + 1)])
+    start = datetime(2023, 1, 1)
+    step = 365 * 24 * 3600 / transactions
+    batch = 100000
+    for first in range(0, transactions, batch):
+        rows = []
+        for i in range(first, min(first + batch, transactions)):
+            sender = rng.randint(1, accounts)
+            transfer = rng.random() < 0.7
+            rows.append({'sender': sender, 'receiver': rng.randint(1, accounts) if transfer else sender,
+                         'amount': rng.randint(1, 5000), 'date_time': start + timedelta(seconds=i * step),
+                         'transaction_type_id': 3 if transfer else rng.choice((1, 2))})
+        db.session.execute(Transactions.__table__.insert(), rows)
+    db.session.commit()
+    return start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--accounts', type=int, default=100000)
+    parser.add_argument('--searches', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['DEV_DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.sqlite')
+        os.environ['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(tmpdir, 'jinja')
+        from app import create_app, db
+        from app.models import TransactionType
+        from app.search import TransactionFilter, search_transactions, cursor
+        app = create_app('development')
+        with app.app_context():
+            db.create_all()
+            TransactionType.insert_transaction_types()
+            started = time.perf_counter()
+            first_day = seed(args.transactions, args.accounts, rng).date()
+            print('{} transactions seeded in {:.0f} s'.format(args.transactions, time.perf_counter() - started))
+
+            def criteria() -> dict:
+                day = first_day + timedelta(days=rng.randint(0, 330))
+                return {
+                    'account': TransactionFilter(account=rng.randint(1, args.accounts)),
+                    'account + dates + amount': TransactionFilter(account=rng.randint(1, args.accounts), date_from=day,
+                                                                  date_to=day + timedelta(days=30), amount_min=100,
+                                                                  amount_max=2000),
+                    'type + dates': TransactionFilter(type_id=rng.choice((1, 2, 3)), date_from=day,
+                                                      date_to=day + timedelta(days=7)),
+                    'dates + amount': TransactionFilter(date_from=day, date_to=day, amount_min=4900),
+                }
+
+            latencies = {}
+            for _ in range(args.searches):
+                for name, filters in criteria().items():
+                    started = time.perf_counter()
+                    page = search_transactions(filters, limit=25)
+                    if page:
+                        search_transactions(filters, cursor(page[-1]), limit=25)
+                    latencies.setdefault(name, []).append((time.perf_counter() - started) / 2)
+                    db.session.rollback()
+
+    for name, values in latencies.items():
+        values.sort()
+        print('{:<26} p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms'.format(
+            name, values[len(values) // 2] * 1000, values[int(len(values) * 0.99)] * 1000, values[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,58 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess sting' # used as an encrpyption or signing key. Flask uses this key in its mechanism for csrf protection
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES') or 1024) # rendered transaction lists kept in memory
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES') or 8 * 1024 * 1024)
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES') or 1024) # spending summaries kept in memory
+    ANALYTICS_CACHE_MAX_BYTES = int(os.environ.get('ANALYTICS_CACHE_MAX_BYTES') or 16 * 1024 * 1024)
+    ANALYTICS_MOVING_AVERAGE_MONTHS = 3
+    ANALYTICS_TOP_COUNTERPARTIES = 10
+    BALANCE_CACHE_BACKEND = os.environ.get('BALANCE_CACHE_BACKEND', 'memory') # 'memory' per worker, 'shared' across workers, '' reads every balance from the database
+    BALANCE_CACHE_MAX_ENTRIES = 100000
+    BALANCE_CACHE_URL = os.environ.get('BALANCE_CACHE_URL') or 'sqlite:///' + os.path.join(basedir, 'balance-cache.sqlite')
+    BALANCE_STRIPES = 8 # default stripe rows of an account designated with `flask balances stripe`
+    BALANCE_COMPACT_SECONDS = 10 # interval of `flask balances compact --loop`
+    BALANCE_CACHE_TTL_SECONDS = float(os.environ.get('BALANCE_CACHE_TTL_SECONDS') or 5) # bounds how long a worker's memory cache misses other workers' writes
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(basedir, '.jinja_cache')
+    READ_REPLICA_BIND = os.environ.get('READ_REPLICA_BIND') # SQLALCHEMY_BINDS key serving reads of read-only views
+    READ_YOUR_WRITES_SECONDS = 5 # a user's reads stay on the primary this long after their own write
+    READ_REPLICA_REFRESH_SECONDS = int(os.environ.get('READ_REPLICA_REFRESH_SECONDS') or 0) # SQLite replica stand-in copy interval, 0 disables
+    TRANSACTIONS_PER_PAGE = 25
+    RECENT_ACTIVITY_DAYS = 30 # window of the per-account activity shown on the dashboard
+    ARCHIVE_HORIZON_DAYS = int(os.environ.get('ARCHIVE_HORIZON_DAYS') or 365) # transactions older than this are moved to the archive
+    ARCHIVE_CHUNK_SIZE = 1000
+    ARCHIVE_BIND = os.environ.get('ARCHIVE_BIND') # SQLALCHEMY_BINDS key of a separate archive database, None keeps the archive table in the default database
+    SYNC_REFERENCE_DATA_ON_STARTUP = bool(os.environ.get('SYNC_REFERENCE_DATA_ON_STARTUP')) # sync roles and transaction types at startup when their version changed
+    RECIPIENT_DIRECTORY_REFRESH_SECONDS = 30 # how often the recipient lookup index picks up accounts opened by other workers
+    RECIPIENT_DIRECTORY_MAX_RESULTS = 10
+    RECIPIENT_DIRECTORY_PRELOAD = bool(os.environ.get('RECIPIENT_DIRECTORY_PRELOAD')) # load the lookup index in the background at startup
+    EMAIL_FILTER_CAPACITY = int(os.environ.get('EMAIL_FILTER_CAPACITY') or 1000000) # registered emails the Bloom filter is sized for
+    EMAIL_FILTER_ERROR_RATE = 0.01
+    EMAIL_FILTER_REFRESH_SECONDS = 30
+    EMAIL_FILTER_PRELOAD = bool(os.environ.get('EMAIL_FILTER_PRELOAD'))
+    SCHEDULE_BATCH_SIZE = 100 # scheduled transfers executed per transaction by `flask run-schedules`
+    SCHEDULE_LEASE_SECONDS = 300 # how long a worker's claim on a batch holds before another worker may take it over
+    SCHEDULE_POLL_SECONDS = 30
+    RECONCILE_BATCH_SIZE = 100000 # transaction ids summed per commit by `flask reconcile`
+    RECONCILE_TOLERANCE = 0.005 # largest difference between a balance and its ledger total not reported as drift
+    INGEST_CHUNK_SIZE = 5000 # deposit file rows applied per commit by `flask ingest-deposits`
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
+    MAIL_USE_TLS = bool(os.environ.get('MAIL_USE_TLS'))
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_SENDER') or 'Bank <noreply@bank.local>'
+    MAIL_SUBJECT_PREFIX = '[Bank] '
+    OUTBOX_BATCH_SIZE = 50 # notification emails delivered per SMTP connection by `flask dispatch-outbox`
+    OUTBOX_MAX_ATTEMPTS = 5 # failed deliveries before a message is given up
+    OUTBOX_RETRY_SECONDS = 60 # delay before the first retry, doubled after every further failure
+    OUTBOX_LEASE_SECONDS = 120
+    OUTBOX_POLL_SECONDS = 5
+    EVENTS_POLL_SECONDS = 1.0 # how often the live update watcher checks the database for commits by other workers
+    EVENTS_KEEPALIVE_SECONDS = 15
+    ASSET_FINGERPRINTING = True # serve static files under content-hashed names with immutable caching
+    ASSET_MAX_AGE = 365 * 24 * 3600
+    ACCOUNT_SHARDS = None # [(bind_key, first_account_num, last_account_num), ...] over SQLALCHEMY_BINDS, None is the default database
     
     @staticmethod
     def init_app(app):
@@ -13,16 +65,21 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    ASSET_FINGERPRINTING = False # the manifest is built at startup, edited files would keep their old names
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
 
 class TestingConfig(Config):
     TESTING = True
     WTF_CSRF_ENABLED = False
+    JINJA_BYTECODE_CACHE_DIR = None
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
 
 class ProductionConfig(Config):
+    SYNC_REFERENCE_DATA_ON_STARTUP = True
+    RECIPIENT_DIRECTORY_PRELOAD = True
+    EMAIL_FILTER_PRELOAD = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
     'sqlite:///' + os.path.join(basedir, 'data.sqlite')
 
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+import sys
+
+# Production server: FLASK_CONFIG=production gunicorn -c gunicorn.conf.py
+# The app is built once in the master (preload_app) and the workers are forked from it, see app.prefork.
+
+wsgi_app = 'webapp:app'
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:8000'
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+# Threaded workers: every open dashboard holds one thread for its /api/events stream, which never ends. A sync
+# worker would be taken whole by one stream and killed at the timeout. Workers x threads bounds the open streams
+# plus the requests in flight, raise GUNICORN_THREADS for more dashboards; the timeout only applies to a worker's
+# heartbeat, not to the streams.
+threads = int(os.environ.get('GUNICORN_THREADS') or 32)
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 30)
+preload_app = True
+accesslog = '-'
+
+WORKER_BOOT_ERROR = 3 # exit status making the master stop instead of forking replacement workers
+
+
+def on_starting(server):
+    # With preload_app the app is already loaded here, before the first fork
+    from app.prefork import prepare
+    prepare(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from app.prefork import check_ready
+    problems = check_ready(worker.wsgi)
+    for problem in problems:
+        worker.log.error('Worker not ready: %s', problem)
+    if problems:
+        sys.exit(WORKER_BOOT_ERROR)
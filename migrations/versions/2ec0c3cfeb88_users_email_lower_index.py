@@ -0,0 +1,28 @@
+"""users email lower index
+
+Revision ID: 2ec0c3cfeb88
+Revises: a141b3cc5b24
+Create Date: 2026-10-19 09:29:47.166422
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2ec0c3cfeb88'
+down_revision = 'a141b3cc5b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Expression index, written by hand: autogenerate cannot reflect these on SQLite. Fails on a database holding
+    # the same address in two cases, merge those users first.
+    with op.batch_alter_table('users_table', schema=None) as batch_op:
+        batch_op.create_index('ix_users_table_email_lower', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('users_table', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_table_email_lower')
@@ -0,0 +1,81 @@
+"""repair legacy account tables
+
+Revision ID: e6499abdb536
+Revises: 98da3a03f1e6
+Create Date: 2026-10-19 09:52:08.671985
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6499abdb536'
+down_revision = '98da3a03f1e6'
+branch_labels = None
+depends_on = None
+
+
+# A database upgraded through migrations/legacy reaches 927438ec0990 with the foreign keys between accounts_table
+# and transactions_table pointing the wrong way and nullable transactions_table.receiver/sender. Both tables are
+# rebuilt to the shape the squashed baseline creates. Databases created by the baseline already have it and are
+# left alone.
+def _accounts_table(metadata):
+    return sa.Table(
+        'accounts_table', metadata,
+        sa.Column('account_num', sa.Integer(), nullable=False),
+        sa.Column('owner', sa.Integer(), nullable=True),
+        sa.Column('balance', sa.Float(), nullable=True),
+        sa.Column('stripes', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['owner'], ['users_table.id'], name='fk_accounts_table_owner_users_table'),
+        sa.PrimaryKeyConstraint('account_num', name='pk_accounts_table'),
+        sa.Index('ix_accounts_table_owner', 'owner'),
+    )
+
+
+def _transactions_table(metadata):
+    return sa.Table(
+        'transactions_table', metadata,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('receiver', sa.Integer(), nullable=False),
+        sa.Column('sender', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=True),
+        sa.Column('date_time', sa.DateTime(), nullable=True),
+        sa.Column('transaction_type_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['receiver'], ['accounts_table.account_num'],
+                                name='fk_transactions_table_receiver_accounts_table'),
+        sa.ForeignKeyConstraint(['sender'], ['accounts_table.account_num'],
+                                name='fk_transactions_table_sender_accounts_table'),
+        sa.ForeignKeyConstraint(['transaction_type_id'], ['transaction_type_table.id'],
+                                name='fk_transactions_table_transaction_type_id_transaction_type_table'),
+        sa.PrimaryKeyConstraint('id', name='pk_transactions_table'),
+        sa.Index('ix_transactions_table_date_time', 'date_time'),
+        sa.Index('ix_transactions_table_receiver_date_time', 'receiver', 'date_time', 'id'),
+        sa.Index('ix_transactions_table_sender_date_time', 'sender', 'date_time', 'id'),
+        sa.Index('ix_transactions_table_type_date_time', 'transaction_type_id', 'date_time', 'id'),
+    )
+
+
+def _has_legacy_shape(bind) -> bool:
+    inspector = sa.inspect(bind)
+    referred = {key['referred_table'] for key in inspector.get_foreign_keys('accounts_table')}
+    nullable = {column['name']: column['nullable'] for column in inspector.get_columns('transactions_table')}
+    return 'transactions_table' in referred or nullable['receiver'] or nullable['sender']
+
+
+def upgrade():
+    if not _has_legacy_shape(op.get_bind()):
+        return
+    metadata = sa.MetaData()
+    # recreate='always' copies the rows into a table built from copy_from instead of reflecting the old one, so the
+    # unnamed legacy foreign keys are dropped without having to name them. Fails on a transaction without a
+    # receiver or sender, which the models never wrote.
+    with op.batch_alter_table('accounts_table', recreate='always', copy_from=_accounts_table(metadata)):
+        pass
+    with op.batch_alter_table('transactions_table', recreate='always', copy_from=_transactions_table(metadata)):
+        pass
+
+
+def downgrade():
+    # The repaired shape is the one of 98da3a03f1e6 on a database created by the baseline, nothing to undo
+    pass
@@ -0,0 +1,14 @@
+import os
+
+
+def pytest_configure(config):
+    """
+    Under pytest-xdist every worker gets its own database: a TEST_DATABASE_URL is suffixed with the worker id
+    (e.g. sqlite:////tmp/bank-test.sqlite_gw0) before the app config reads it. The default in-memory database
+    is already private to each worker process.
+    """
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    url = os.environ.get('TEST_DATABASE_URL')
+    if worker and url:
+        os.environ['TEST_DATABASE_URL'] = '{}_{}'.format(url, worker)
+
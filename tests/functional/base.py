@@ -0,0 +1,94 @@
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import create_app, db, fragment_cache, analytics_cache, balance_cache, recipient_directory, email_filter
+from app.models import Role, TransactionType
+from app.replica import RoutingSession
+
+_template_app = None
+
+
+class SavepointSession(RoutingSession):
+    """db.session used inside a test: everything runs on the test's connection, commits only release a SAVEPOINT
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+def enable_sqlite_savepoints(engine) -> None:
+    """pysqlite opens transactions lazily and breaks SAVEPOINT, so let SQLAlchemy emit BEGIN itself.
+    See https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+
+def template_app():
+    """
+    Testing app whose schema and reference data are built once per process and shared by every test.
+    Each pytest-xdist worker is its own process, so with the default in-memory database every worker gets its own copy.
+    """
+    global _template_app
+    if _template_app is None:
+        app = create_app('testing')
+        with app.app_context():
+            enable_sqlite_savepoints(db.engine)
+            db.drop_all()
+            db.create_all()
+            Role.insert_roles()
+            TransactionType.insert_transaction_types()
+        _template_app = app
+    return _template_app
+
+
+@contextmanager
+def savepoint_session(app):
+    """
+    Pushes an app context and swaps db.session for one bound to a connection inside an outer transaction.
+    Commits made by the code under test only release SAVEPOINTs, the outer transaction is rolled back on exit.
+    """
+    app_context = app.app_context()
+    app_context.push()
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    session = db.session
+    db.session = db._make_scoped_session({'class_': SavepointSession, 'bind': connection,
+                                          'join_transaction_mode': 'create_savepoint'})
+    fragment_cache.clear() # rolled back ids are reused, cached fragments would belong to another test
+    analytics_cache.clear()
+    balance_cache.clear()
+    recipient_directory.clear()
+    email_filter.clear()
+    try:
+        yield db.session
+    finally:
+        db.session.remove()
+        db.session = session
+        transaction.rollback()
+        connection.close()
+        app_context.pop()
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    TestCase running on the shared template app, each test inside a transaction that is rolled back.
+    Provides self.app, self.session and self.client.
+    """
+
+    def setUp(self) -> None:
+        self.app = template_app()
+        self._savepoint = savepoint_session(self.app)
+        self.session = self._savepoint.__enter__()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        self._savepoint.__exit__(None, None, None)
@@ -0,0 +1,237 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+from app import db
+from app.archive import archive_transactions
+from app.analytics import account_columns
+from app.models import Role, TransactionType, User, Accounts
+from config import config, TestingConfig
+from .base import DatabaseTestCase
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+def register_and_login(client) -> None:
+    client.post('/auth/register', data={
+        'first_name': 'devone',
+        'last_name': 'doe',
+        'email': 'devonedoe@email.com',
+        'password': 'testpassword',
+        'password2': 'testpassword'
+    })
+    client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+
+
+class ApiTestCase(DatabaseTestCase):
+    """WSGI routes of the api blueprint"""
+
+    def test_read_endpoints(self) -> None:
+        """
+        GIVEN a logged in user who deposited 10
+        WHEN the balance, history and export endpoints are requested
+        THEN the balance is 10, the history lists the deposit then the account opening and the CSV holds both rows
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        balance = self.client.get('/api/balance').get_json()
+        self.assertEqual(balance['balance'], 10)
+        history = self.client.get('/api/history').get_json()
+        self.assertEqual([txn['type'] for txn in history['transactions']], ['Deposit', 'New Account'])
+        self.assertEqual(history['transactions'][0]['amount'], 10)
+        response = self.client.get('/api/export.csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['type'] for row in rows], ['Deposit', 'New Account'])
+
+    def test_account_selection(self) -> None:
+        """
+        GIVEN a logged in user with a second account, and another user's account
+        WHEN the balance, history and export endpoints are requested with and without ?account=
+        THEN the first account is the default, the second one is served when asked for and the other user's is not found
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/open-account', data={})
+        first, second = [account.account_num for account in self.session.query(Accounts).order_by(Accounts.account_num)]
+        self.session.add(Accounts(account_owner=User(first_name='devtwo', last_name='roe', email='devtworoe@email.com')))
+        self.session.commit()
+        other = self.session.query(Accounts).order_by(Accounts.account_num.desc()).first().account_num
+
+        self.assertEqual(self.client.get('/api/balance').get_json()['account_num'], first)
+        balance = self.client.get('/api/balance?account={}'.format(second)).get_json()
+        self.assertEqual((balance['account_num'], balance['balance']), (second, 0))
+        history = self.client.get('/api/history?account={}'.format(second)).get_json()
+        self.assertEqual([txn['type'] for txn in history['transactions']], ['New Account'])
+        response = self.client.get('/api/export.csv?account={}'.format(second))
+        self.assertIn('transactions-{}.csv'.format(second), response.headers['Content-Disposition'])
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 2)
+        for path in ('/api/balance', '/api/history', '/api/export.csv'):
+            with self.client.get('{}?account={}'.format(path, other)) as response:
+                self.assertEqual(response.status_code, 404)
+
+    def test_login_required(self) -> None:
+        """
+        GIVEN an anonymous client
+        WHEN the balance endpoint is requested
+        THEN it is redirected to the login page
+        """
+        response = self.client.get('/api/balance')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/auth/login', response.location)
+
+    def test_analytics_cached_until_next_write(self) -> None:
+        """
+        GIVEN a logged in user who deposited 10
+        WHEN the analytics are requested twice, then again after depositing 5, and for another user's account
+        THEN the postings are read on the first and third requests only, and the other account is not found
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        with mock.patch('app.analytics.account_columns', wraps=account_columns) as read:
+            first = self.client.get('/api/analytics').get_json()
+            self.assertEqual(self.client.get('/api/analytics').get_json(), first)
+            self.assertEqual(read.call_count, 1)
+            self.client.post('/auth/deposit', data={'amount': 5})
+            second = self.client.get('/api/analytics').get_json()
+            self.assertEqual(read.call_count, 2)
+        self.assertEqual(first['received'], [10])
+        self.assertEqual(second['received'], [15])
+        self.assertEqual(second['spent'], [0])
+        self.assertEqual(self.client.get('/api/analytics?account={}'.format(first['account_num'] + 1)).status_code, 404)
+
+
+@unittest.skipIf(aiosqlite is None, 'aiosqlite is not installed')
+class AsgiTestCase(unittest.TestCase):
+    """The ASGI app is driven directly with scope, receive and send, over a SQLite file shared with the WSGI app"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        config['asgi_testing'] = type('AsgiTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'bank.sqlite'),
+        })
+        from app.asgi import create_asgi_app
+        self.asgi_app = create_asgi_app('asgi_testing')
+        self.app = self.asgi_app.flask_app
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        with self.app.app_context():
+            db.drop_all()
+        del config['asgi_testing']
+        shutil.rmtree(self.tmpdir)
+
+    def requests(self, *paths, cookie=None) -> list:
+        """Runs GET requests through the ASGI app in one event loop
+
+        Returns:
+            list: (status, headers, body) per path
+        """
+        async def get(path: str):
+            path, _, query = path.partition('?')
+            headers = [(b'cookie', 'session={}'.format(cookie).encode())] if cookie else []
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': headers}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await self.asgi_app(scope, receive, send)
+            body = b''.join(message.get('body', b'') for message in messages[1:])
+            return messages[0]['status'], dict(messages[0]['headers']), body
+
+        async def run():
+            try:
+                return [await get(path) for path in paths]
+            finally:
+                await self.asgi_app.dispose()
+
+        return asyncio.run(run())
+
+    def test_matches_wsgi_routes(self) -> None:
+        """
+        GIVEN a user who registered, logged in and deposited 10 through the WSGI app
+        WHEN the ASGI app serves balance, history and export with the same session cookie
+        THEN the JSON and CSV bodies are identical to the WSGI ones
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        cookie = self.client.get_cookie('session').value
+        paths = ['/api/balance', '/api/history?page=1', '/api/export.csv']
+        responses = self.requests(*paths, cookie=cookie)
+        for path, (status, headers, body) in zip(paths, responses):
+            self.assertEqual(status, 200)
+            expected = self.client.get(path)
+            if path.endswith('.csv'):
+                self.assertEqual(headers[b'content-type'], b'text/csv; charset=utf-8')
+                self.assertEqual(body.decode(), expected.get_data(as_text=True))
+            else:
+                self.assertEqual(json.loads(body), expected.get_json())
+
+    def test_account_selection_matches_wsgi_routes(self) -> None:
+        """
+        GIVEN a user with two accounts and another user's account, made through the WSGI app
+        WHEN the ASGI app serves balance and history without ?account=, with the second account and with the other one
+        THEN the first two match the WSGI responses and the other user's account is not found
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/open-account', data={})
+        with self.app.app_context():
+            db.session.add(Accounts(account_owner=User(first_name='devtwo', last_name='roe', email='devtworoe@email.com')))
+            db.session.commit()
+            first, second, other = db.session.execute(
+                db.select(Accounts.account_num).order_by(Accounts.account_num)).scalars().all()
+        cookie = self.client.get_cookie('session').value
+        paths = ['/api/balance', '/api/balance?account={}'.format(second), '/api/history?account={}'.format(second)]
+        responses = self.requests(*paths, '/api/history?account={}'.format(other), cookie=cookie)
+        for path, (status, headers, body) in zip(paths, responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body), self.client.get(path).get_json())
+        self.assertEqual(json.loads(responses[0][2])['account_num'], first)
+        self.assertEqual(responses[-1][0], 404)
+
+    def test_archived_history_matches_wsgi_routes(self) -> None:
+        """
+        GIVEN a user whose postings were all moved to the archive
+        WHEN the ASGI app serves history and export
+        THEN both list the archived deposit and account opening, identically to the WSGI routes
+        """
+        register_and_login(self.client)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        with self.app.app_context():
+            archive_transactions(timedelta(days=-1))
+        cookie = self.client.get_cookie('session').value
+        paths = ['/api/history', '/api/export.csv']
+        responses = self.requests(*paths, cookie=cookie)
+        history = json.loads(responses[0][2])
+        self.assertEqual([txn['type'] for txn in history['transactions']], ['Deposit', 'New Account'])
+        self.assertEqual(history, self.client.get(paths[0]).get_json())
+        self.assertEqual(responses[1][2].decode(), self.client.get(paths[1]).get_data(as_text=True))
+
+    def test_rejects_missing_or_forged_session(self) -> None:
+        """
+        GIVEN no session cookie, a forged one and an unknown path
+        WHEN they are requested from the ASGI app
+        THEN the first two get a 401 and the unknown path a 404
+        """
+        responses = self.requests('/api/balance')
+        responses += self.requests('/api/balance', cookie='forged.cookie.value')
+        responses += self.requests('/auth/login')
+        self.assertEqual([status for status, headers, body in responses], [401, 401, 404])
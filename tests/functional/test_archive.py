@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from app import create_app, db
+from app.archive import archive_transactions, archive_bind_arguments
+from app.ledger import account_history, full_history, BALANCE_FORWARD
+from app.models import User, Role, Accounts, Transactions, ArchivedTransactions, TransactionType, Posting
+from config import config, TestingConfig
+
+
+class ArchiveTestCase(unittest.TestCase):
+    config_name = 'testing'
+
+    def setUp(self) -> None:
+        self.app = create_app(self.config_name)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        user = User(first_name='devone', last_name='doe', email='devonedoe@email.com')
+        self.account = Accounts(account_owner=user, balance=60)
+        deposit = TransactionType.query.filter_by(name="Deposit").first()
+        now = datetime.utcnow()
+        # Six deposits of 10, one per 20 days: four are older than 30 days
+        self.txns = [Transactions(receiver_account=self.account, sender_account=self.account, amount=10,
+                                  date_time=now - timedelta(days=20 * age), transaction_type=deposit)
+                     for age in range(6)]
+        db.session.add_all([user, self.account] + self.txns)
+        db.session.flush()
+        db.session.add_all([Posting(txn_id=txn.id, account_num=self.account.account_num,
+                                    counterparty=self.account.account_num, amount=txn.amount, posted_at=txn.date_time,
+                                    transaction_type_id=deposit.id) for txn in self.txns])
+        db.session.commit()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def archived_count(self) -> int:
+        return db.session.execute(sa.select(sa.func.count()).select_from(ArchivedTransactions),
+                                  bind_arguments=archive_bind_arguments()).scalar()
+
+    def test_archive_moves_old_rows_in_chunks(self) -> None:
+        """
+        GIVEN six transactions, four of them older than 30 days
+        WHEN the archive job runs with a 30 day horizon and chunks of 3
+        THEN the four old rows move to the archive with their ids, the two recent ones stay and the balance is unchanged
+        """
+        moved = archive_transactions(timedelta(days=30), chunk_size=3)
+        self.assertEqual(moved, 4)
+        self.assertEqual(Transactions.query.count(), 2)
+        self.assertEqual(self.archived_count(), 4)
+        self.assertEqual(db.session.get(Accounts, self.account.account_num).balance, 60)
+        self.assertEqual(archive_transactions(timedelta(days=30)), 0)
+
+    def test_postings_move_behind_a_balance_forward(self) -> None:
+        """
+        GIVEN the six postings of the deposits
+        WHEN the archive job runs with a 30 day horizon, then with a 10 day one
+        THEN postings_table keeps the recent postings and one balance forward carrying the archived amounts, the
+            postings still add up to the balance, and the history lists every deposit newest first across the archive
+        """
+        num = self.account.account_num
+        dates = [txn.date_time for txn in self.txns]
+        archive_transactions(timedelta(days=30))
+        forward = db.session.query(Posting).filter_by(txn_id=BALANCE_FORWARD).one()
+        self.assertEqual((forward.account_num, forward.amount), (num, 40))
+        self.assertEqual(db.session.query(Posting).count(), 3)
+        self.assertEqual(db.session.query(db.func.sum(Posting.amount)).scalar(), 60)
+
+        pages = [[posting.posted_at for posting in account_history(db.session, num, page, 4)] for page in (1, 2, 3)]
+        self.assertEqual(pages, [dates[:4], dates[4:], []])
+        self.assertEqual([posting.posted_at for posting in account_history(db.session, num, 3, 2)], dates[4:])
+        self.assertEqual([posting.posted_at for batch in full_history(db.session, num, 4) for posting in batch], dates)
+
+        archive_transactions(timedelta(days=10))
+        self.assertEqual(db.session.query(Posting.amount).filter_by(txn_id=BALANCE_FORWARD).scalar(), 50)
+        self.assertEqual(db.session.query(Posting).count(), 2)
+        self.assertEqual([posting.posted_at for posting in account_history(db.session, num, 1, 6)], dates)
+
+    def test_cli(self) -> None:
+        """
+        GIVEN the archive-transactions command
+        WHEN it is run with a 30 day horizon
+        THEN it reports the four archived rows
+        """
+        result = self.app.test_cli_runner().invoke(args=['archive-transactions', '--days', '30'])
+        self.assertIn('Archived 4 transaction(s)', result.output)
+
+
+class ArchiveDatabaseTestCase(ArchiveTestCase):
+    """Same scenarios with the archive table in its own database"""
+    config_name = 'archive_testing'
+
+    def setUp(self) -> None:
+        config['archive_testing'] = type('ArchiveTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_BINDS': {'archive': 'sqlite://'},
+            'ARCHIVE_BIND': 'archive',
+        })
+        super().setUp()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        del config['archive_testing']
+        db.metadatas.pop('archive', None) # registered by init_app, would leak into other apps' create_all()
@@ -0,0 +1,65 @@
+import gzip
+import os
+from flask import url_for
+from .base import DatabaseTestCase
+
+
+class AssetsCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        with open(os.path.join(self.app.static_folder, 'styles.css'), 'rb') as f:
+            self.content = f.read()
+        with self.app.test_request_context():
+            self.url = url_for('static', filename='styles.css')
+
+    def test_url_is_fingerprinted(self) -> None:
+        """
+        GIVEN the testing app with asset fingerprinting
+        WHEN a logged in user loads the dashboard
+        THEN the stylesheet link carries the content hash and the file is served with immutable caching
+        """
+        self.assertRegex(self.url, r'^/static/styles\.[0-9a-f]{12}\.css$')
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.assertIn(self.url, self.client.get('/').get_data(as_text=True))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.content)
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_precompressed_and_conditional(self) -> None:
+        """
+        GIVEN a fingerprinted stylesheet
+        WHEN it is requested with Accept-Encoding: gzip, then again with the returned ETag
+        THEN the first response is the precompressed gzip body, the second a 304
+        """
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), self.content)
+
+        etag = response.headers['ETag']
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_plain_and_unknown_names(self) -> None:
+        """
+        GIVEN the fingerprinting static view
+        WHEN the unhashed name and a stale hash are requested
+        THEN the unhashed name is served without immutable caching and the stale hash is not found
+        """
+        response = self.client.get('/static/styles.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        response.close()
+        self.assertEqual(self.client.get('/static/styles.000000000000.css').status_code, 404)
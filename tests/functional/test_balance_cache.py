@@ -0,0 +1,63 @@
+from app import balance_cache
+from app.models import Accounts
+from .base import DatabaseTestCase
+
+
+class BalanceCacheCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.account = self.session.query(Accounts).one()
+
+    def set_balance_behind_cache(self, balance: float) -> None:
+        self.session.query(Accounts).filter_by(account_num=self.account.account_num).update({'balance': balance})
+        self.session.commit()
+
+    def test_balance_served_from_cache_until_write(self) -> None:
+        """
+        GIVEN a balance read once through the API
+        WHEN the stored balance changes without a write through the app, then the user deposits 10
+        THEN the API keeps serving the cached balance, then the committed balance after the deposit
+        """
+        self.assertEqual(self.client.get('/api/balance').get_json()['balance'], 0)
+        self.set_balance_behind_cache(100)
+        self.assertEqual(self.client.get('/api/balance').get_json()['balance'], 0)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.assertEqual(self.client.get('/api/balance').get_json()['balance'], 110)
+        self.assertIn(b'Balance: 110', self.client.get('/index').data)
+
+    def test_older_state_cannot_replace_a_refresh(self) -> None:
+        """
+        GIVEN an entry read before a deposit
+        WHEN the deposit refreshes the cache and the earlier reader then stores what it read
+        THEN the refreshed entry stays
+        """
+        before = balance_cache.get(self.account.account_num)
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.assertFalse(balance_cache.backend.put(self.account.account_num, before))
+        after = balance_cache.get(self.account.account_num)
+        self.assertGreater(after.version, before.version)
+        self.assertEqual(after.balance, 10)
+
+    def test_uncommitted_write_is_not_cached(self) -> None:
+        """
+        GIVEN a session holding a flushed but uncommitted balance change
+        WHEN the balance is read, then the change is rolled back
+        THEN the read sees the change without caching it, and the next read returns the committed balance
+        """
+        account = self.session.get(Accounts, self.account.account_num)
+        account.balance = 500
+        self.session.flush()
+        self.assertEqual(balance_cache.get(account.account_num).balance, 500)
+        self.assertEqual(len(balance_cache.backend), 0)
+        self.session.rollback()
+        self.assertEqual(balance_cache.get(account.account_num).balance, 0)
+        self.assertEqual(len(balance_cache.backend), 1)
@@ -0,0 +1,88 @@
+from sqlalchemy import event
+from app import db, email_filter
+from app.models import User
+from .base import DatabaseTestCase
+
+
+class EmailFilterCase(DatabaseTestCase):
+
+    def register(self, email: str):
+        return self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': email,
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+
+    def user_queries(self, url: str) -> list:
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return response.get_json(), [statement for statement in statements if 'users_table' in statement]
+
+    def test_email_available_skips_database(self) -> None:
+        """
+        GIVEN a registered user and a built email filter
+        WHEN the live validation endpoint checks a new address, the registered one and the registered one in another case
+        THEN the new address is available without querying the users table, the registered one is not available and
+            the other case is checked against the table and not available either
+        """
+        self.register('devonedoe@email.com')
+        email_filter.refresh()
+        available, queries = self.user_queries('/auth/email-available?email=newdoe@email.com')
+        self.assertEqual(available, {'email': 'newdoe@email.com', 'available': True})
+        self.assertEqual(queries, [])
+        taken, _ = self.user_queries('/auth/email-available?email=devonedoe@email.com')
+        self.assertFalse(taken['available'])
+        other_case, queries = self.user_queries('/auth/email-available?email=DevOneDoe@email.com')
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(other_case['available'])
+
+    def test_registration_updates_filter(self) -> None:
+        """
+        GIVEN a built email filter
+        WHEN a user registers and the same address registers again
+        THEN the filter knows the address right away and the second registration is rejected by the form
+        """
+        email_filter.refresh()
+        self.register('devonedoe@email.com')
+        self.assertTrue(email_filter.might_exist('devonedoe@email.com'))
+        response = self.register('devonedoe@email.com')
+        self.assertIn(b'Please use a different email address.', response.data)
+        self.assertEqual(self.session.query(User).count(), 1)
+
+    def test_concurrent_registration_hits_unique_index(self) -> None:
+        """
+        GIVEN an address registered by another worker after this worker's filter was built
+        WHEN the same address registers here before the next refresh
+        THEN the form passes, the unique index rejects the insert and the form is shown again with the error
+        """
+        email_filter.refresh()
+        self.session.add(User(first_name='other', last_name='worker', email='devonedoe@email.com'))
+        self.session.commit()
+        self.assertFalse(email_filter.might_exist('devonedoe@email.com'))
+
+        response = self.register('devonedoe@email.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Please use a different email address.', response.data)
+        self.assertEqual(self.session.query(User).filter_by(email='devonedoe@email.com').count(), 1)
+
+    def test_concurrent_registration_in_another_case_hits_unique_index(self) -> None:
+        """
+        GIVEN an address registered in upper case by another worker, stored as entered before registration lower-cased
+            addresses, after this worker's filter was built
+        WHEN the same address registers here in lower case before the next refresh
+        THEN the unique index on lower(email) rejects the insert and the form is shown again with the error
+        """
+        email_filter.refresh()
+        self.session.add(User(first_name='other', last_name='worker', email='DevOneDoe@email.com'))
+        self.session.commit()
+
+        response = self.register('devonedoe@email.com')
+        self.assertIn(b'Please use a different email address.', response.data)
+        self.assertEqual(self.session.query(User).count(), 1)
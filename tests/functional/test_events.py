@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+from app import create_app, db, event_broker
+from app.models import Role, Accounts, Transactions, TransactionType
+from config import config, TestingConfig
+
+
+class EventsTestCase(unittest.TestCase):
+    """Live updates over a SQLite file, which the watcher's own connection sees committed to"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        config['events_testing'] = type('EventsTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'bank.sqlite'),
+            'EVENTS_POLL_SECONDS': 0.05,
+        })
+        self.app = create_app('events_testing')
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        with self.app.app_context():
+            self.account_num = db.session.query(Accounts.account_num).scalar()
+
+    def tearDown(self) -> None:
+        thread = event_broker._thread
+        if thread is not None:
+            event_broker.wake()
+            thread.join(5)
+        with self.app.app_context():
+            db.drop_all()
+        del config['events_testing']
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream_pushes_deposit(self) -> None:
+        """
+        GIVEN a logged in user with an open event stream
+        WHEN they deposit 10
+        THEN the stream delivers a transaction event with the deposit and the new balance, and closing the stream
+            removes the subscription
+        """
+        response = self.client.get('/api/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b'retry: 5000\n\n')
+        self.client.post('/auth/deposit', data={'amount': 10})
+        chunk = next(stream).decode()
+        self.assertTrue(chunk.startswith('event: transaction\ndata: '))
+        data = json.loads(chunk.split('data: ', 1)[1])
+        self.assertEqual((data['account_num'], data['balance']), (self.account_num, 10))
+        self.assertEqual((data['transaction']['type'], data['transaction']['amount']), ('Deposit', 10))
+        response.close()
+        self.assertEqual(event_broker._subscribers, {})
+
+    def test_commit_from_another_worker_without_wake(self) -> None:
+        """
+        GIVEN a subscription to an account
+        WHEN another app with its own connection pool commits a deposit, without waking the broker
+        THEN the watcher notices the new data_version and delivers the event
+        """
+        with self.app.app_context():
+            subscription = event_broker.subscribe([self.account_num])
+        other = create_app('events_testing')
+        with other.app_context():
+            account = db.session.get(Accounts, self.account_num)
+            account.update_balance(7)
+            deposit = db.session.query(TransactionType.id).filter_by(name='Deposit').scalar()
+            txn = Transactions(receiver=self.account_num, sender=self.account_num, amount=7,
+                               date_time=datetime.utcnow(), transaction_type_id=deposit)
+            db.session.add_all([account, txn, *txn.postings()])
+            db.session.commit()
+        received = subscription.get(timeout=5)
+        event_broker.unsubscribe(subscription)
+        self.assertEqual((received['balance'], received['transaction']['amount']), (7, 7))
+
+    def test_idle_watcher_only_polls_data_version(self) -> None:
+        """
+        GIVEN a subscription and no new transactions
+        WHEN the watcher polls for a while
+        THEN every statement it runs is PRAGMA data_version
+        """
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            subscription = event_broker.subscribe([self.account_num])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                time.sleep(0.3)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        event_broker.unsubscribe(subscription)
+        self.assertGreater(len(statements), 2)
+        self.assertEqual(set(statements), {'PRAGMA data_version'})
@@ -0,0 +1,111 @@
+import csv
+import os
+import tempfile
+from unittest import mock
+
+from app import ingest
+from app.models import Accounts, Transactions, IngestCheckpoint
+from .base import DatabaseTestCase
+
+
+class IngestDepositsCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'devtwo'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+            self.client.get('/auth/logout')
+        self.first, self.second = [account.account_num for account in
+                                   self.session.query(Accounts).order_by(Accounts.account_num)]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.runner = self.app.test_cli_runner()
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', newline='') as file:
+            file.write(text)
+        return path
+
+    def balances(self):
+        self.session.expire_all()
+        return [account.balance for account in self.session.query(Accounts).order_by(Accounts.account_num)]
+
+    def deposits(self) -> int:
+        return self.session.query(Transactions).filter(Transactions.amount > 0).count()
+
+    def test_csv_and_fixed_width_files_are_credited_once(self) -> None:
+        """
+        GIVEN a CSV file and a fixed-width file of deposits for two accounts
+        WHEN both are ingested, then the CSV file is ingested again under another name
+        THEN every deposit is credited with its own transaction, the ledger reconciles, and the copy is
+            reported as already ingested
+        """
+        rows = ''.join('{},{}\n'.format(self.first if i % 2 else self.second, 10) for i in range(7))
+        text = 'account_num,amount,reference\n' + rows
+        path = self.write('deposits.csv', text)
+        result = self.runner.invoke(args=['ingest-deposits', path, '--chunk-size', '3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Credited 7 deposit(s) totalling 70.00', result.output)
+
+        fixed = self.write('deposits.dat', '{:>10}{:>12}\n{:>10}{:>12}\n'.format(self.first, '5.50', self.second, '4.50'))
+        self.assertEqual(self.runner.invoke(args=['ingest-deposits', fixed]).exit_code, 0)
+        self.assertEqual(self.balances(), [35.5, 44.5])
+        self.assertEqual(self.deposits(), 9)
+        self.assertEqual(self.runner.invoke(args=['reconcile']).exit_code, 0)
+
+        copy = self.write('renamed.csv', text)
+        result = self.runner.invoke(args=['ingest-deposits', copy])
+        self.assertIn('already ingested', result.output)
+        self.assertEqual(self.balances(), [35.5, 44.5])
+
+    def test_crashed_run_resumes_without_double_credit(self) -> None:
+        """
+        GIVEN a file of 5 deposits ingested 2 rows per commit, and a run crashing while applying the second chunk
+        WHEN the command is run again
+        THEN it resumes after the first chunk and every deposit is credited exactly once
+        """
+        path = self.write('deposits.csv', 'account_num,amount\n' + '{},1\n'.format(self.first) * 5)
+        apply_deposits, calls = ingest.apply_deposits, []
+
+        def crash_on_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            apply_deposits(*args)
+
+        with mock.patch.object(ingest, 'apply_deposits', side_effect=crash_on_second_chunk):
+            result = self.runner.invoke(args=['ingest-deposits', path, '--chunk-size', '2'])
+        self.assertIsInstance(result.exception, RuntimeError)
+        self.session.rollback()
+        self.assertEqual(self.balances()[0], 2)
+        self.assertEqual(self.session.get(IngestCheckpoint, ingest.file_digest(path)).deposits, 2)
+
+        result = self.runner.invoke(args=['ingest-deposits', path, '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Resumed at byte', result.output)
+        self.assertIn('Credited 3 deposit(s)', result.output)
+        self.assertEqual(self.balances()[0], 5)
+        self.assertEqual(self.deposits(), 5)
+
+    def test_invalid_lines_and_unknown_accounts_are_rejected(self) -> None:
+        """
+        GIVEN a file with a valid deposit, an unknown account, a negative amount and a non numeric account
+        WHEN it is ingested with a rejects file
+        THEN only the valid deposit is credited and the three other lines are written with their reason
+        """
+        path = self.write('deposits.csv', 'account_num,amount\n{},25\n99999999,10\n{},-5\nabc,1\n'.format(
+            self.first, self.second))
+        rejects = os.path.join(self.tmpdir.name, 'rejects.csv')
+        result = self.runner.invoke(args=['ingest-deposits', path, '--rejects', rejects])
+        self.assertIn('rejected 3 line(s)', result.output)
+        self.assertEqual(self.balances(), [25, 0])
+        with open(rejects, newline='') as file:
+            reasons = [row['reason'] for row in csv.DictReader(file)]
+        self.assertEqual(sorted(reasons), ['amount must be at least 0.01', 'invalid account number', 'unknown account'])
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db, shard_router
+from app.models import Accounts, Transactions, Posting
+from .base import DatabaseTestCase
+
+
+class MultipleAccountsCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.client.post('/auth/open-account', data={})
+        self.first, self.second = self.session.query(Accounts).order_by(Accounts.account_num).all()
+
+    def test_deposit_and_transfer_between_own_accounts(self) -> None:
+        """
+        GIVEN a user with two accounts
+        WHEN 10 is deposited into the second account and 4 is transferred from the second to the first
+        THEN the balances are 4 and 6 and the dashboard lists both accounts with their recent activity
+        """
+        self.client.post('/auth/deposit', data={'account': self.second.account_num, 'amount': 10})
+        self.client.post('/auth/transfer', data={'from_account': self.second.account_num,
+                                                 'recipient_acc_num': self.first.account_num, 'amount': 4})
+        self.assertEqual(self.session.get(Accounts, self.first.account_num).balance, 4)
+        self.assertEqual(self.session.get(Accounts, self.second.account_num).balance, 6)
+
+        rows = shard_router.portfolio(self.first.owner, datetime.utcnow() - timedelta(days=30))
+        self.assertEqual([(row.account_num, row.balance, row.recent_count) for row in rows],
+                         [(self.first.account_num, 4, 2), (self.second.account_num, 6, 3)])
+        response = self.client.get('/?account={}'.format(self.second.account_num))
+        self.assertIn('Account No. {}'.format(self.second.account_num).encode(), response.data)
+        self.assertIn(b'Balance: 6.0', response.data)
+
+    def test_pages_stay_on_the_selected_account(self) -> None:
+        """
+        GIVEN the second account with three postings and two transactions per page
+        WHEN its history is shown
+        THEN the link to the older page keeps the second account selected
+        """
+        per_page = self.app.config['TRANSACTIONS_PER_PAGE']
+        self.app.config['TRANSACTIONS_PER_PAGE'] = 2
+        self.addCleanup(self.app.config.__setitem__, 'TRANSACTIONS_PER_PAGE', per_page)
+        for _ in range(2):
+            self.client.post('/auth/deposit', data={'account': self.second.account_num, 'amount': 5})
+        response = self.client.get('/?account={}'.format(self.second.account_num))
+        self.assertIn('href="/index?account={}&amp;page=2"'.format(self.second.account_num).encode(), response.data)
+
+    def test_dashboard_without_accounts(self) -> None:
+        """
+        GIVEN a logged in user whose accounts were all removed
+        WHEN the dashboard is shown
+        THEN it renders the empty portfolio with the link to open an account
+        """
+        for model in (Posting, Transactions, Accounts):
+            self.session.query(model).delete()
+        self.session.commit()
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Open another account', response.data)
+        self.assertNotIn(b'Account No.', response.data)
+
+    def test_cannot_use_someone_elses_account(self) -> None:
+        """
+        GIVEN a logged in user and an account they do not own
+        WHEN a deposit or a transfer names that account as their own
+        THEN the form is rejected and no balance changes
+        """
+        other = Accounts(owner=None, balance=100)
+        self.session.add(other)
+        self.session.commit()
+        self.client.post('/auth/deposit', data={'account': other.account_num, 'amount': 10})
+        self.client.post('/auth/transfer', data={'from_account': other.account_num,
+                                                 'recipient_acc_num': self.first.account_num, 'amount': 50})
+        self.assertEqual(self.session.get(Accounts, other.account_num).balance, 100)
+        self.assertEqual(self.session.get(Accounts, self.first.account_num).balance, 0)
+
+    def test_portfolio_is_one_query(self) -> None:
+        """
+        GIVEN a user with two accounts
+        WHEN the portfolio summary is loaded
+        THEN a single SELECT is issued for both accounts
+        """
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            rows = shard_router.portfolio(self.first.owner, datetime.utcnow() - timedelta(days=30))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('SELECT')]), 1)
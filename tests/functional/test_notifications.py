@@ -0,0 +1,144 @@
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from app.models import Accounts, OutboxMessage
+from app.notifications import dispatch_outbox
+from .base import DatabaseTestCase
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP stand-in: accepts every message and keeps it in messages, refuses recipients listed in refused
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.refused = set()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self) -> None:
+        self.reply('220 localhost')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'RCPT':
+                address = line.split(':', 1)[1].strip(' <>')
+                if address in self.server.refused:
+                    self.reply('550 refused')
+                    continue
+                recipients.append(address)
+            if command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw.decode())
+                self.server.messages.append((recipients, ''.join(data)))
+                recipients = []
+            self.reply('250 ok')
+
+
+class NotificationsCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'devtwo'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.own, self.other = self.session.query(Accounts).order_by(Accounts.account_num).all()
+        self.smtp = SMTPSink().__enter__()
+        state = self.app.extensions['mail']
+        self.mail_settings = state.server, state.port, state.suppress
+        state.server, state.port = self.smtp.server_address
+        state.suppress = False
+
+    def tearDown(self) -> None:
+        state = self.app.extensions['mail']
+        state.server, state.port, state.suppress = self.mail_settings
+        self.smtp.__exit__()
+        super().tearDown()
+
+    def test_transfer_queues_and_dispatcher_sends(self) -> None:
+        """
+        GIVEN a logged in user who deposits 10 and transfers 4
+        WHEN the requests return and then the dispatcher runs
+        THEN nothing was sent during the requests, three emails were queued and the dispatcher delivers them
+            over SMTP in one batch, a second run finds nothing due
+        """
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/transfer', data={'recipient_acc_num': self.other.account_num, 'amount': 4})
+        self.assertEqual(self.smtp.messages, [])
+        self.assertEqual([message.subject for message in self.session.query(OutboxMessage).order_by(OutboxMessage.id)],
+                         ['[Bank] Deposit received', '[Bank] Transfer sent', '[Bank] Transfer received'])
+
+        totals = dispatch_outbox(once=True)
+        self.assertEqual((totals['sent'], totals['batches']), (3, 1))
+        self.assertEqual([recipients for recipients, _ in self.smtp.messages],
+                         [['devonedoe@email.com'], ['devonedoe@email.com'], ['devtwodoe@email.com']])
+        self.assertIn('You received 4.0 from account {}'.format(self.own.account_num), self.smtp.messages[2][1])
+        self.assertTrue(all(message.sent_at for message in self.session.query(OutboxMessage)))
+        self.assertEqual(dispatch_outbox(once=True)['batches'], 0)
+
+    def test_failed_delivery_is_retried_then_abandoned(self) -> None:
+        """
+        GIVEN a deposit email whose recipient the SMTP server refuses
+        WHEN the dispatcher runs with two attempts and a one minute retry delay
+        THEN the first failure schedules a retry a minute later, the second abandons the message
+        """
+        self.smtp.refused.add('devonedoe@email.com')
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.assertEqual(dispatch_outbox(max_attempts=2, once=True)['retried'], 1)
+        message = self.session.query(OutboxMessage).one()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('Refused', message.last_error)
+        self.assertGreater(message.next_attempt_at, datetime.utcnow() + timedelta(seconds=50))
+        self.assertEqual(dispatch_outbox(max_attempts=2, once=True)['batches'], 0)
+
+        message.next_attempt_at = datetime.utcnow()
+        self.session.commit()
+        self.assertEqual(dispatch_outbox(max_attempts=2, once=True)['abandoned'], 1)
+        self.session.refresh(message)
+        self.assertEqual((message.attempts, message.next_attempt_at, message.sent_at), (2, None, None))
+
+    def test_smtp_outage_keeps_messages_queued(self) -> None:
+        """
+        GIVEN a queued email and an SMTP server that is down
+        WHEN the dispatcher runs
+        THEN the message stays queued for a retry and is delivered once the server is back
+        """
+        self.client.post('/auth/deposit', data={'amount': 10})
+        state = self.app.extensions['mail']
+        port, state.port = state.port, 1
+        self.assertEqual(dispatch_outbox(once=True)['retried'], 1)
+        state.port = port
+        message = self.session.query(OutboxMessage).one()
+        message.next_attempt_at = datetime.utcnow()
+        self.session.commit()
+        self.assertEqual(dispatch_outbox(once=True)['sent'], 1)
+        self.assertEqual(len(self.smtp.messages), 1)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+import sqlalchemy as sa
+from app.online_migration import ShadowTableMigration
+
+
+class ShadowTableMigrationTestCase(unittest.TestCase):
+    """Turns the integer amount of a transactions-like table into a float and adds a currency column"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = sa.create_engine('sqlite:///' + os.path.join(self.tmpdir, 'bank.sqlite'))
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE accounts (account_num INTEGER PRIMARY KEY)')
+            connection.exec_driver_sql('CREATE TABLE ledger (id INTEGER PRIMARY KEY, account_num INTEGER '
+                                       'REFERENCES accounts (account_num), amount INTEGER)')
+            connection.exec_driver_sql('CREATE INDEX ix_ledger_account_num ON ledger (account_num)')
+            connection.exec_driver_sql('CREATE TABLE postings (id INTEGER PRIMARY KEY, ledger_id INTEGER REFERENCES ledger (id))')
+            connection.exec_driver_sql('INSERT INTO accounts VALUES (1), (2)')
+            connection.exec_driver_sql('INSERT INTO ledger (account_num, amount) VALUES ' +
+                                       ', '.join('({}, {})'.format(1 + i % 2, i) for i in range(1, 101)))
+        self.target = sa.Table(
+            'ledger', sa.MetaData(),
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('account_num', sa.Integer, sa.ForeignKey('accounts.account_num')),
+            sa.Column('amount', sa.Float),
+            sa.Column('currency', sa.String(3), nullable=False, server_default='EUR'),
+            sa.Index('ix_ledger_account_num_amount', 'account_num', 'amount'),
+        )
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def migration(self, **kwargs) -> ShadowTableMigration:
+        return ShadowTableMigration(self.engine, self.target, columns={'amount': 'amount / 2.0'}, chunk_size=30,
+                                    pause=0, **kwargs)
+
+    def rows(self) -> list:
+        with self.engine.connect() as connection:
+            return connection.exec_driver_sql('SELECT id, account_num, amount, currency FROM ledger ORDER BY id').all()
+
+    def test_writes_during_backfill_are_caught_up(self) -> None:
+        """
+        GIVEN 100 rows copied in chunks of 30
+        WHEN another connection inserts, updates and deletes rows between the chunks
+        THEN the swapped table holds every live row in the new schema, the new index replaces the old one,
+            foreign keys still name the table and the helper tables are gone
+        """
+        writes = iter([
+            'INSERT INTO ledger (account_num, amount) VALUES (2, 1000)',
+            'UPDATE ledger SET amount = 500 WHERE id = 10',
+            'DELETE FROM ledger WHERE id IN (20, 90)',
+        ])
+
+        def write(progress: dict) -> None:
+            statement = next(writes, None)
+            if statement is not None:
+                with self.engine.begin() as connection:
+                    connection.exec_driver_sql(statement)
+
+        progress = self.migration(on_chunk=write).run()
+        self.assertEqual(progress['copied'], 100)
+        self.assertEqual(progress['replayed'], 4)
+
+        rows = self.rows()
+        self.assertEqual(len(rows), 99)
+        self.assertEqual(rows[9], (10, 1, 250.0, 'EUR'))
+        self.assertEqual(rows[-1], (101, 2, 500.0, 'EUR'))
+        self.assertNotIn(20, [row.id for row in rows])
+        self.assertEqual(rows[0], (1, 2, 0.5, 'EUR'))
+
+        inspector = sa.inspect(self.engine)
+        self.assertEqual(sorted(inspector.get_table_names()), ['accounts', 'ledger', 'postings'])
+        self.assertEqual([index['name'] for index in inspector.get_indexes('ledger')], ['ix_ledger_account_num_amount'])
+        self.assertEqual(inspector.get_foreign_keys('postings')[0]['referred_table'], 'ledger')
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE type = 'trigger'")
+                             .scalar(), 0)
+
+    def test_interrupted_run_resumes_from_checkpoint(self) -> None:
+        """
+        GIVEN a migration interrupted after its second chunk
+        WHEN it is run again
+        THEN it copies only the rows after the checkpoint and the result is complete
+        """
+        def interrupt(progress: dict) -> None:
+            if progress['chunks'] == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.migration(on_chunk=interrupt).run()
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql('SELECT count(*), sum(amount) FROM ledger').one(), (100, 5050))
+
+        progress = self.migration().run()
+        self.assertEqual(progress['copied'], 40)
+        self.assertEqual([row.amount for row in self.rows()], [i / 2 for i in range(1, 101)])
@@ -0,0 +1,59 @@
+from sqlalchemy import func, select, text
+from app import db
+from app.ledger import account_history, history_query
+from app.models import Accounts, Posting, Transactions
+from .base import DatabaseTestCase
+
+
+class PostingsCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'devtwo'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.own, self.other = self.session.query(Accounts).order_by(Accounts.account_num).all()
+
+    def test_transactions_post_signed_lines(self) -> None:
+        """
+        GIVEN two new accounts
+        WHEN the first deposits 10 and transfers 4 to the second
+        THEN the deposit posts once, the transfer posts -4 and +4, and each account's postings sum to its balance
+        """
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/transfer', data={'recipient_acc_num': self.other.account_num, 'amount': 4})
+        transfer = self.session.query(Transactions).order_by(Transactions.id.desc()).first()
+        self.assertEqual(sorted((posting.account_num, posting.amount) for posting in
+                                self.session.query(Posting).filter_by(txn_id=transfer.id)),
+                         [(self.own.account_num, -4), (self.other.account_num, 4)])
+        for account in (self.own, self.other):
+            total = self.session.query(func.sum(Posting.amount)).filter_by(account_num=account.account_num).scalar()
+            self.assertEqual(total, self.session.get(Accounts, account.account_num).balance)
+
+        history = account_history(self.session, self.own.account_num)
+        self.assertEqual([(posting.transaction_type.name, posting.amount) for posting in history],
+                         [('Transfer', -4), ('Deposit', 10), ('New Account', 0)])
+        response = self.client.get('/')
+        self.assertIn(b'devtwo - Transfer', response.data)
+        self.assertIn(b'<div class="transaction-amount">-4</div>', response.data)
+
+    def test_history_is_an_index_range_scan(self) -> None:
+        """
+        GIVEN the postings table
+        WHEN SQLite plans the history query and the balance sum of one account
+        THEN both search the (account_num, posted_at) index, the sum without reading the table and neither sorts
+        """
+        history = history_query(self.own.account_num).compile(db.engine, compile_kwargs={'literal_binds': True})
+        balance = select(func.sum(Posting.amount)).where(Posting.account_num == self.own.account_num) \
+            .compile(db.engine, compile_kwargs={'literal_binds': True})
+        for query, covering in ((history, False), (balance, True)):
+            plan = ' '.join(row[-1] for row in self.session.execute(text('EXPLAIN QUERY PLAN {}'.format(query))))
+            self.assertIn('ix_postings_table_account_num_posted_at (account_num=?)', plan)
+            self.assertEqual('COVERING INDEX' in plan, covering)
+            self.assertNotIn('TEMP B-TREE', plan)
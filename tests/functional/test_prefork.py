@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+from app import create_app, db, prefork
+from app.models import TransactionType
+from app.schema import bootstrap_schema
+from config import config, TestingConfig
+
+
+class PreforkTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        The database is a SQLite file, created and stamped at the migration head like a deployed one
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        config['prefork_testing'] = type('PreforkTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'data.sqlite'),
+            'BALANCE_CACHE_BACKEND': None,
+        })
+        self.app = create_app('prefork_testing')
+        with self.app.app_context():
+            bootstrap_schema()
+
+    def tearDown(self) -> None:
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+        del config['prefork_testing']
+        shutil.rmtree(self.tmpdir)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_child_gets_its_own_pool(self) -> None:
+        """
+        GIVEN a prepared app whose master opened a pooled connection after prepare()
+        WHEN the process forks
+        THEN the child queries through a new pool without touching the master's connection, which keeps working
+        """
+        prefork.prepare(self.app)
+        with self.app.app_context():
+            engine = db.engine
+            with engine.connect() as connection:
+                connection.execute(sa.text('SELECT 1'))
+            master_pool = engine.pool
+            self.assertEqual(master_pool.checkedin(), 1)
+
+            read, write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    os.close(read)
+                    with engine.connect() as connection:
+                        count = connection.execute(sa.select(sa.func.count()).select_from(TransactionType)).scalar()
+                    os.write(write, '{} {}'.format(engine.pool is not master_pool, count).encode())
+                    status = 0
+                finally:
+                    os._exit(status)
+            os.close(write)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.read(read, 64).decode(), 'True 5')
+            os.close(read)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+            self.assertIs(engine.pool, master_pool)
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute(sa.text('SELECT 1')).scalar(), 1)
+
+    def test_readiness_check(self) -> None:
+        """
+        GIVEN a database at the migration head with its reference data
+        WHEN a worker checks it, then again after a transaction type and then the migration stamp are removed
+        THEN the first check passes, the others report the missing type and the revision behind the head
+        """
+        self.assertEqual(prefork.check_ready(self.app), [])
+        with self.app.app_context():
+            db.session.execute(sa.delete(TransactionType).where(TransactionType.name == 'Deposit'))
+            db.session.commit()
+        self.assertEqual(prefork.check_ready(self.app),
+                         ['Transaction types missing: Deposit, run flask sync-reference-data'])
+        with self.app.app_context():
+            db.session.execute(sa.text('DELETE FROM alembic_version'))
+            db.session.commit()
+        problems = prefork.check_ready(self.app)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith('Database at revision none, migrations head is '), problems)
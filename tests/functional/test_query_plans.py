@@ -0,0 +1,166 @@
+import re
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+from sqlalchemy import event
+from app import db
+from app.models import Accounts, Role, User, load_user
+from .base import DatabaseTestCase
+
+# Tables growing with the number of users and transactions, a hot query must never read them in full
+LARGE_TABLES = {'users_table', 'accounts_table', 'transactions_table', 'postings_table'}
+
+# "SCAN transactions_table", "SCAN TABLE transactions_table" before SQLite 3.36, also with "USING COVERING INDEX"
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+@contextmanager
+def captured_selects(engine):
+    """Records the SELECT statements sent to engine, with their parameters, while the block runs"""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+def query_plan(connection, statement: str, parameters) -> List[str]:
+    """Details of SQLite's EXPLAIN QUERY PLAN, one string per step"""
+    return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+class QueryPlanCase(DatabaseTestCase):
+    """Access paths of the hot queries, as SQLite plans them on the current models
+        - A change to the models, or a migration, that drops or reorders an index these queries rely on fails here
+          instead of as a slow page in production
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'support'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+            self.client.get('/auth/logout')
+        self.own, self.other = [account.account_num for account in
+                                self.session.query(Accounts).order_by(Accounts.account_num)]
+
+    def login(self, first_name: str) -> None:
+        self.client.post('/auth/login', data={'email': '{}doe@email.com'.format(first_name), 'password': 'testpassword'})
+
+    def plans(self, statements) -> List[Tuple[str, List[str]]]:
+        connection = self.session.connection()
+        return [(statement, query_plan(connection, statement, parameters)) for statement, parameters in statements]
+
+    def assertAccessPaths(self, statements, expected: Dict[str, str]) -> None:
+        """Fails on a full scan of a large table or a sort of its rows, and when no search of a table in expected
+        goes through the index named there
+
+        Args:
+            statements (list): (statement, parameters) from captured_selects()
+            expected (dict): table name to the index, or 'INTEGER PRIMARY KEY', one of its searches must use
+        """
+        self.assertTrue(statements, 'no query captured')
+        used = {table: set() for table in expected}
+        for statement, plan in self.plans(statements):
+            for step in plan:
+                scan = FULL_SCAN.match(step)
+                self.assertFalse(scan and scan.group(1) in LARGE_TABLES, 'full scan in {}\n{}'.format(plan, statement))
+                for table in expected:
+                    if step.startswith('SEARCH {} '.format(table)) or step.startswith('SEARCH TABLE {} '.format(table)):
+                        used[table].add(step)
+            # A sort on top of limited subqueries is bounded by their limits, a sort of one table's rows is not
+            if statement.count('SELECT') == 1 and 'ORDER BY' in statement:
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, 'sorted rows in {}\n{}'.format(plan, statement))
+        for table, index in expected.items():
+            self.assertTrue(any(index in step for step in used[table]),
+                            '{} not read through {}: {}'.format(table, index, sorted(used[table])))
+
+    def test_login_by_email(self) -> None:
+        """
+        GIVEN a registered user
+        WHEN they log in
+        THEN the user is found through the unique email index
+        """
+        with captured_selects(db.engine) as statements:
+            self.login('devone')
+        self.assertAccessPaths([(statement, parameters) for statement, parameters in statements
+                                if 'users_table.email' in statement], {'users_table': 'ix_users_table_email'})
+
+    def test_load_user(self) -> None:
+        """
+        GIVEN a logged in user's id from the session cookie
+        WHEN the login manager loads the user
+        THEN it is a primary key lookup
+        """
+        user_id = self.session.query(User.id).filter_by(email='devonedoe@email.com').scalar()
+        self.session.expunge_all()
+        with captured_selects(db.engine) as statements:
+            self.assertEqual(load_user(str(user_id)).id, user_id)
+        self.assertAccessPaths(statements, {'users_table': 'INTEGER PRIMARY KEY'})
+
+    def test_index_history(self) -> None:
+        """
+        GIVEN a logged in user
+        WHEN they open the index page and the API history
+        THEN their accounts are found by owner, and the balances and history are ranges of the postings index,
+        already in newest first order
+        """
+        self.login('devone')
+        with captured_selects(db.engine) as statements:
+            self.assertEqual(self.client.get('/index').status_code, 200)
+            self.assertEqual(self.client.get('/api/history').status_code, 200)
+        self.assertAccessPaths(statements, {
+            'accounts_table': 'ix_accounts_table_owner',
+            'postings_table': 'ix_postings_table_account_num_posted_at',
+        })
+
+    def test_transfer_account_lookups(self) -> None:
+        """
+        GIVEN a logged in user
+        WHEN they transfer to another account
+        THEN their own accounts are found by owner and the recipient by account number
+        """
+        self.login('devone')
+        with captured_selects(db.engine) as statements:
+            self.client.post('/auth/transfer', data={
+                'from_account': self.own,
+                'recipient_acc_num': self.other,
+                'amount': 1
+            })
+        lookups = [(statement, parameters) for statement, parameters in statements
+                   if 'FROM accounts_table' in statement]
+        by_owner = [query for query in lookups if 'accounts_table.owner = ?' in query[0]]
+        by_number = [query for query in lookups if 'accounts_table.account_num = ?' in query[0]]
+        self.assertAccessPaths(by_owner, {'accounts_table': 'ix_accounts_table_owner'})
+        self.assertAccessPaths(by_number, {'accounts_table': 'INTEGER PRIMARY KEY'})
+
+    def test_transaction_search(self) -> None:
+        """
+        GIVEN a moderator
+        WHEN they search an account's transactions and a type's transactions
+        THEN the sender and receiver branches and the type search each read their composite index
+        """
+        support = self.session.query(User).filter_by(email='supportdoe@email.com').one()
+        support.role = self.session.query(Role).filter_by(name='Moderator').one()
+        self.session.commit()
+        self.login('support')
+        with captured_selects(db.engine) as statements:
+            self.client.get('/api/transactions/search', query_string={'account': self.own})
+        self.assertAccessPaths([query for query in statements if 'FROM transactions_table' in query[0]],
+                               {'transactions_table': 'ix_transactions_table_sender_date_time'})
+        self.assertTrue(any('ix_transactions_table_receiver_date_time' in step
+                            for _, plan in self.plans(statements) for step in plan))
+        with captured_selects(db.engine) as statements:
+            self.client.get('/api/transactions/search', query_string={'type_id': 1})
+        self.assertAccessPaths([query for query in statements if 'FROM transactions_table' in query[0]],
+                               {'transactions_table': 'ix_transactions_table_type_date_time'})
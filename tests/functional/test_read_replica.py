@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, read_replica
+from app.models import Role, TransactionType
+from config import config, TestingConfig
+
+
+class ReadReplicaTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Primary and replica are two SQLite files, the replica is only updated by explicit refreshes.
+        The app context is not kept pushed, so every request gets its own session and g like in production.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        config['replica_testing'] = type('ReplicaTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'primary.sqlite'),
+            'SQLALCHEMY_BINDS': {'replica': 'sqlite:///' + os.path.join(self.tmpdir, 'replica.sqlite')},
+            'READ_REPLICA_BIND': 'replica',
+            'BALANCE_CACHE_BACKEND': None, # cached balances are read from the primary
+        })
+        self.app = create_app('replica_testing')
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        with self.app.app_context():
+            db.drop_all()
+        del config['replica_testing']
+        db.metadatas.pop('replica', None) # registered by init_app, would leak into other apps' create_all()
+        shutil.rmtree(self.tmpdir)
+
+    def refresh_replica(self) -> None:
+        with self.app.app_context():
+            read_replica.refresh()
+
+    def test_read_only_view_uses_replica_after_write_window(self) -> None:
+        """
+        GIVEN a logged in user whose account exists on the replica
+        WHEN the user deposits 10 and reloads the index page
+        THEN the reload inside the read-your-writes window reads the primary,
+            after the window it reads the stale replica until the replica is refreshed
+        """
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword'
+        })
+        self.refresh_replica()
+
+        response = self.client.post('/auth/deposit', data={'amount': 10}, follow_redirects=True)
+        self.assertIn(b'Balance: 10.0', response.data)
+
+        self.app.config['READ_YOUR_WRITES_SECONDS'] = 0
+        response = self.client.get('/')
+        self.assertIn(b'Balance: 0.0', response.data)
+
+        self.refresh_replica()
+        response = self.client.get('/')
+        self.assertIn(b'Balance: 10.0', response.data)
@@ -0,0 +1,76 @@
+from app import recipient_directory
+from app.models import User, Accounts
+from .base import DatabaseTestCase
+
+
+class RecipientDirectoryCase(DatabaseTestCase):
+
+    def register(self, first_name: str, last_name: str, email: str) -> None:
+        self.client.post('/auth/register', data={
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': email,
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+
+    def test_lookup_by_name_and_account_number(self) -> None:
+        """
+        GIVEN two registered users, devone doe and devtwo smith, and a logged in client
+        WHEN recipients are looked up by first name prefix, last name prefix, account number and exact account
+        THEN each lookup returns the matching account with the owner's first name and last initial only
+        """
+        self.register('devone', 'doe', 'devonedoe@email.com')
+        self.register('devtwo', 'smith', 'devtwosmith@email.com')
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        smith = self.session.query(Accounts).join(User).filter(User.last_name == 'smith').one()
+
+        results = self.client.get('/auth/recipients?q=DEV').get_json()['results']
+        self.assertEqual(sorted(result['name'] for result in results), ['devone d.', 'devtwo s.'])
+        results = self.client.get('/auth/recipients?q=smi').get_json()['results']
+        self.assertEqual(results, [{'account_num': smith.account_num, 'name': 'devtwo s.'}])
+        results = self.client.get('/auth/recipients?q={}'.format(smith.account_num)).get_json()['results']
+        self.assertEqual(results[0]['account_num'], smith.account_num)
+        results = self.client.get('/auth/recipients?account={}'.format(smith.account_num)).get_json()['results']
+        self.assertEqual(results, [{'account_num': smith.account_num, 'name': 'devtwo s.'}])
+        self.assertEqual(self.client.get('/auth/recipients?account=999999').get_json()['results'], [])
+
+    def test_refresh_picks_up_accounts_from_other_workers(self) -> None:
+        """
+        GIVEN an index loaded from the database
+        WHEN 400 accounts are inserted without going through the register route, as another worker would
+        THEN a refresh adds all of them in one bulk load and they can be found by name
+        """
+        recipient_directory.refresh()
+        users = [User(first_name='user{}'.format(i), last_name='bulk', email='user{}@email.com'.format(i))
+                 for i in range(400)]
+        self.session.add_all([Accounts(account_owner=user) for user in users])
+        self.session.commit()
+        self.assertEqual(recipient_directory.refresh(), 400)
+        self.assertEqual(len(recipient_directory.search('user12', limit=20)), 11) # user12 and user120-129
+        self.assertEqual(recipient_directory.refresh(), 0)
+
+    def test_due_refresh_runs_in_the_background(self) -> None:
+        """
+        GIVEN a loaded index whose refresh interval has passed, and an account inserted by another worker
+        WHEN a recipient is looked up
+        THEN the refresh runs in another thread, after which the new account is found
+        """
+        recipient_directory.refresh()
+        self.session.add(Accounts(account_owner=User(first_name='devthree', last_name='roe', email='devthree@email.com')))
+        self.session.commit()
+        recipient_directory._refreshed_at -= self.app.config['RECIPIENT_DIRECTORY_REFRESH_SECONDS']
+        recipient_directory.search('devthree')
+        thread = recipient_directory._refresh_thread
+        self.assertIsNotNone(thread)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([result['name'] for result in recipient_directory.search('devthree')], ['devthree r.'])
+
+    def test_login_required(self) -> None:
+        """
+        GIVEN an anonymous client
+        WHEN the recipient lookup is requested
+        THEN it is redirected to the login page
+        """
+        self.assertEqual(self.client.get('/auth/recipients?q=dev').status_code, 302)
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from app import db
+from app.archive import archive_transactions, TRANSACTION_COLUMNS
+from app.models import Accounts, Transactions, ArchivedTransactions, TransactionType, LedgerTotal, ReconciliationCheckpoint
+from app.reconciliation import reconcile
+from .base import DatabaseTestCase
+
+
+class ReconciliationCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.first = Accounts(balance=0)
+        self.second = Accounts(balance=0)
+        self.session.add_all([self.first, self.second])
+        self.session.commit()
+
+    def post(self, txn_type: str, sender: Accounts, receiver: Accounts, amount: int, age: timedelta = timedelta()) -> None:
+        """Records a transaction and applies it to the balances the way the routes do"""
+        txn_type_id = self.session.query(TransactionType.id).filter_by(name=txn_type).scalar()
+        if sender is receiver:
+            sender.update_balance(-amount if txn_type == 'Withdrawal' else amount)
+        else:
+            sender.update_balance(-amount)
+            receiver.update_balance(amount)
+        self.session.add(Transactions(sender=sender.account_num, receiver=receiver.account_num, amount=amount,
+                                      date_time=datetime.utcnow() - age, transaction_type_id=txn_type_id))
+        self.session.commit()
+
+    def test_clean_ledger(self) -> None:
+        """
+        GIVEN a deposit of 20, a withdrawal of 5 and a transfer of 8
+        WHEN the ledger is reconciled
+        THEN the totals match the balances 7 and 8 and no drift is reported
+        """
+        self.post('Deposit', self.first, self.first, 20)
+        self.post('Withdrawal', self.first, self.first, 5)
+        self.post('Transfer', self.first, self.second, 8)
+        report, = reconcile()
+        self.assertEqual((report['processed'], report['accounts'], report['drift']), (3, 2, []))
+        self.assertEqual(self.session.get(LedgerTotal, self.first.account_num).net, 7)
+        self.assertEqual(self.session.get(LedgerTotal, self.second.account_num).net, 8)
+
+    def test_drift_is_reported(self) -> None:
+        """
+        GIVEN a deposit of 20 and a balance later overwritten to 25 without a transaction
+        WHEN the ledger is reconciled
+        THEN the account is reported with its balance and its ledger total
+        """
+        self.post('Deposit', self.first, self.first, 20)
+        self.first.balance = 25
+        self.session.commit()
+        report, = reconcile()
+        self.assertEqual(report['drift'], [(self.first.account_num, 25, 20)])
+
+    def test_incremental_runs_only_read_new_rows(self) -> None:
+        """
+        GIVEN a reconciled ledger of two transactions
+        WHEN one more transfer is made and the ledger is reconciled again, then fully recomputed
+        THEN the second run processes the new row only, totals stay in line with the balances, the full run
+            processes all three rows and ends at the same checkpoint
+        """
+        self.post('Deposit', self.first, self.first, 20)
+        self.post('Transfer', self.first, self.second, 5)
+        reconcile()
+        self.post('Transfer', self.second, self.first, 2)
+        report, = reconcile()
+        self.assertEqual((report['processed'], report['drift']), (1, []))
+        self.assertEqual(self.session.get(LedgerTotal, self.second.account_num).net, 3)
+        last_txn_id = self.session.query(db.func.max(Transactions.id)).scalar()
+        self.assertEqual(self.session.get(ReconciliationCheckpoint, 1).last_txn_id, last_txn_id)
+        report, = reconcile(full=True, batch_size=1)
+        self.assertEqual((report['processed'], report['last_txn_id'], report['drift']), (3, last_txn_id, []))
+        self.assertEqual(self.session.get(LedgerTotal, self.first.account_num).net, 17)
+
+    def test_archived_rows_are_counted(self) -> None:
+        """
+        GIVEN a deposit of 20 archived long ago and a recent transfer of 5
+        WHEN the ledger is reconciled
+        THEN both rows are summed and there is no drift
+        """
+        self.post('Deposit', self.first, self.first, 20, age=timedelta(days=400))
+        self.post('Transfer', self.first, self.second, 5)
+        self.assertEqual(archive_transactions(timedelta(days=365)), 1)
+        report, = reconcile()
+        self.assertEqual((report['processed'], report['drift']), (2, []))
+
+    def test_rows_being_archived_are_counted_once(self) -> None:
+        """
+        GIVEN a deposit of 20 copied to the archive and not yet deleted from transactions_table, as the archive job
+            leaves a chunk between its two commits with ARCHIVE_BIND
+        WHEN the ledger is reconciled
+        THEN the deposit is summed once and there is no drift
+        """
+        self.post('Deposit', self.first, self.first, 20, age=timedelta(days=400))
+        self.session.execute(ArchivedTransactions.__table__.insert().from_select(
+            TRANSACTION_COLUMNS, db.select(*[Transactions.__table__.c[name] for name in TRANSACTION_COLUMNS])))
+        self.session.commit()
+        report, = reconcile()
+        self.assertEqual((report['processed'], report['drift']), (1, []))
+        self.assertEqual(self.session.get(LedgerTotal, self.first.account_num).net, 20)
+
+    def test_cli_exit_status(self) -> None:
+        """
+        GIVEN a balance that does not match its transactions
+        WHEN flask reconcile runs
+        THEN it prints the drifted account and exits with status 1
+        """
+        self.post('Deposit', self.first, self.first, 20)
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['reconcile'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('No drift', result.output)
+        self.first.balance = 19
+        self.session.commit()
+        result = runner.invoke(args=['reconcile'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Drift on account {}: balance 19.00, ledger 20.00'.format(self.first.account_num), result.output)
@@ -1,25 +1,10 @@
-import unittest
-from app import create_app, db
-from app.models import User, Role
+from app.models import User
+from .base import DatabaseTestCase
 
-class RegisterLoginTestCase(unittest.TestCase):
-    def setUp(self)->None:
-        """
-        Create an environment for the test that is close to a running application. 
-        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
-        Brand new database gets created for tests with create_all().
-        """
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
-        self.client = self.app.test_client(use_cookies=True)
-    
-    def tearDown(self) -> None:
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
+class RegisterLoginTestCase(DatabaseTestCase):
+    """
+    Runs on the shared testing app, every test inside a transaction rolled back in tearDown (see base.py).
+    """
     
     def test_register_and_login(self)->None:
         """
@@ -53,3 +38,23 @@ class RegisterLoginTestCase(unittest.TestCase):
         response = self.client.get('/auth/logout', follow_redirects=True)
         self.assertEqual(response.status_code, 200)
         
+
+    def test_email_case_is_ignored(self) -> None:
+        """
+        GIVEN a user who registered as Loreum.Ipsum@Email.com
+        WHEN they log in as loreum.ipsum@email.com
+        THEN the address was stored lower-cased and the login succeeds
+        """
+        self.client.post('/auth/register', data={
+            'first_name': 'loreum',
+            'last_name': 'ipsum',
+            'email': 'Loreum.Ipsum@Email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.assertEqual(self.session.query(User.email).scalar(), 'loreum.ipsum@email.com')
+        response = self.client.post('/auth/login', data={
+            'email': 'loreum.ipsum@email.com',
+            'password': 'testpassword'
+        }, follow_redirects=True)
+        self.assertIn(b'Hello loreum', response.data)
@@ -1,18 +1,9 @@
-import unittest
-from app import create_app, db
+from .base import DatabaseTestCase
 
-class RoutesTestCase(unittest.TestCase):
-    def setUp(self)->None:
-        """
-        Create an environment for the test that is close to a running application. 
-        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
-        Brand new database gets created for tests with create_all().
-        """
-        self.app = create_app('testing')
-        with self.app.app_context():
-            db.create_all()
-        self.app = self.app.test_client()
-        
+class RoutesTestCase(DatabaseTestCase):
+    """
+    Runs on the shared testing app, every test inside a transaction rolled back in tearDown (see base.py).
+    """
     
     def test_home_page(self)->None:
         """
@@ -20,7 +11,7 @@ class RoutesTestCase(unittest.TestCase):
         When a get request is made to the home page
         Then validate the page exist by asserting the response code to be 200.
         """
-        response = self.app.get('/')
+        response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
     
     
@@ -30,7 +21,7 @@ class RoutesTestCase(unittest.TestCase):
         When a get request is made to the index page
         Then validate the page exist by asserting the response code to be 200.
         """
-        response = self.app.get('/index')
+        response = self.client.get('/index')
         self.assertEqual(response.status_code, 200)
     
     
@@ -40,7 +31,7 @@ class RoutesTestCase(unittest.TestCase):
         When a get request is made to the register page
         Then validate the page exist by asserting the response code to be 200.
         """
-        response = self.app.get('/auth/register')
+        response = self.client.get('/auth/register')
         self.assertEqual(response.status_code, 200)
     
     
@@ -50,5 +41,5 @@ class RoutesTestCase(unittest.TestCase):
         When a get request is made to the login page
         Then validate the page exist by asserting the response code to be 200.
         """
-        response = self.app.get('/auth/login')
+        response = self.client.get('/auth/login')
         self.assertEqual(response.status_code, 200)
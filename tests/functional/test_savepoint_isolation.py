@@ -0,0 +1,40 @@
+from app.models import User, Accounts
+from .base import DatabaseTestCase
+
+
+class SavepointIsolationTestCase(DatabaseTestCase):
+    """
+    Whichever of the two tests runs second checks that the first one's committed rows were rolled back.
+    """
+
+    def assert_clean_and_write(self) -> None:
+        self.assertEqual(User.query.count(), 0)
+        self.assertEqual(Accounts.query.count(), 0)
+        user = User(first_name='devone', last_name='doe', email='devonedoe@email.com')
+        self.session.add_all([user, Accounts(account_owner=user)])
+        self.session.commit()
+        self.assertEqual(Accounts.query.one().account_num, 1)
+
+    def test_first_writer(self) -> None:
+        """
+        GIVEN the shared testing database
+        WHEN a test commits a user and an account
+        THEN the database was empty before, and account numbering starts at 1
+        """
+        self.assert_clean_and_write()
+
+    def test_second_writer(self) -> None:
+        """
+        GIVEN the shared testing database
+        WHEN a test commits a user and an account
+        THEN the database was empty before, and account numbering starts at 1
+        """
+        self.assert_clean_and_write()
+
+    def test_reference_data_is_shared(self) -> None:
+        """
+        GIVEN the template built once per process
+        WHEN a test starts
+        THEN roles are already present without any per-test seeding
+        """
+        self.assertEqual(User(first_name='a', last_name='b', email='a@b.c').role.name, 'User')
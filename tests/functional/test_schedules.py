@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, date
+from app.models import Accounts, ScheduledTransfer
+from app.schedules import claim_due, run_schedules
+from .base import DatabaseTestCase
+
+
+class SchedulesCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.sender = Accounts(balance=20)
+        self.recipient = Accounts(balance=0)
+        self.session.add_all([self.sender, self.recipient])
+        self.session.commit()
+
+    def schedule(self, amount: float = 5, interval_days=7, due: timedelta = timedelta(minutes=1)) -> ScheduledTransfer:
+        order = ScheduledTransfer(sender=self.sender.account_num, receiver=self.recipient.account_num, amount=amount,
+                                  interval_days=interval_days, next_run_at=datetime.utcnow() - due)
+        self.session.add(order)
+        self.session.commit()
+        return order
+
+    def test_route_schedules_and_worker_executes(self) -> None:
+        """
+        GIVEN a logged in user with 20 in their account
+        WHEN they schedule a weekly transfer of 5 starting today and the worker runs
+        THEN 5 is transferred once, the order is due again in 7 days and a second run finds nothing due
+        """
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.client.post('/auth/deposit', data={'amount': 20})
+        own = self.session.query(Accounts).filter(Accounts.owner.isnot(None)).one()
+        response = self.client.post('/auth/schedules', data={
+            'from_account': own.account_num,
+            'recipient_acc_num': self.recipient.account_num,
+            'amount': 5,
+            'interval_days': 7,
+            'start_date': date.today().isoformat(),
+        }, follow_redirects=True)
+        self.assertIn(b'Transfer scheduled', response.data)
+
+        totals = run_schedules(once=True)
+        self.assertEqual(totals['executed'], 1)
+        self.assertEqual(self.session.get(Accounts, own.account_num).balance, 15)
+        self.assertEqual(self.session.get(Accounts, self.recipient.account_num).balance, 5)
+        order = self.session.query(ScheduledTransfer).one()
+        self.assertEqual(order.next_run_at.date(), date.today() + timedelta(days=7))
+        self.assertIsNone(order.claimed_by)
+        self.assertEqual(run_schedules(once=True)['batches'], 0)
+
+    def test_batches_and_missed_runs(self) -> None:
+        """
+        GIVEN five daily orders of 3 that were due 10 days ago and 20 in the sending account
+        WHEN the worker runs in batches of 2
+        THEN three batches execute each order once, leaving 5, and every order moves to its next occurrence after now
+            instead of catching up on the missed days
+        """
+        orders = [self.schedule(amount=3, interval_days=1, due=timedelta(days=10, minutes=1)) for _ in range(5)]
+        totals = run_schedules(batch_size=2, once=True)
+        self.assertEqual((totals['batches'], totals['executed']), (3, 5))
+        self.assertEqual(self.session.get(Accounts, self.sender.account_num).balance, 5)
+        now = datetime.utcnow()
+        for order in orders:
+            self.session.refresh(order)
+            self.assertTrue(now < order.next_run_at <= now + timedelta(days=1))
+
+    def test_insufficient_funds_one_off(self) -> None:
+        """
+        GIVEN a one-off order of 50 from an account holding 20
+        WHEN the worker runs
+        THEN nothing is transferred, the order records insufficient_funds and is deactivated
+        """
+        order = self.schedule(amount=50, interval_days=None)
+        totals = run_schedules(once=True)
+        self.assertEqual(totals['insufficient_funds'], 1)
+        self.session.refresh(order)
+        self.assertEqual((order.active, order.last_status), (False, 'insufficient_funds'))
+        self.assertEqual(self.session.get(Accounts, self.sender.account_num).balance, 20)
+
+    def test_claims_do_not_overlap(self) -> None:
+        """
+        GIVEN ten due orders
+        WHEN two workers claim batches of 4 and 10, and a third claims after the leases expired
+        THEN the first two claims are disjoint and cover all orders, the third takes the expired claims over
+        """
+        for _ in range(10):
+            self.schedule()
+        lease = timedelta(minutes=5)
+        first = {order.id for order in claim_due('worker-1', 4, lease)}
+        second = {order.id for order in claim_due('worker-2', 10, lease)}
+        self.assertEqual((len(first), len(second)), (4, 6))
+        self.assertFalse(first & second)
+        self.assertEqual(claim_due('worker-3', 10, lease), [])
+        later = datetime.utcnow() + timedelta(minutes=6)
+        self.assertEqual(len(claim_due('worker-3', 10, lease, now=later)), 10)
+
+    def test_cli_reports_metrics(self) -> None:
+        """
+        GIVEN two due orders
+        WHEN run-schedules runs once
+        THEN it reports two executed schedules and the throughput
+        """
+        self.schedule()
+        self.schedule()
+        result = self.app.test_cli_runner().invoke(args=['run-schedules', '--once'])
+        self.assertIn('Ran 2 schedule(s) in 1 batch(es), 0 failed', result.output)
+        self.assertIn('schedules/s', result.output)
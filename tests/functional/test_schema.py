@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import upgrade
+from app import create_app, db
+from app.models import Role, TransactionType
+from config import config, TestingConfig
+
+
+def schema_snapshot(engine) -> dict:
+    """Tables of a database with their columns, primary key, indexes, unique constraints and foreign keys"""
+    inspector = sa.inspect(engine)
+    snapshot = {}
+    for table in inspector.get_table_names():
+        if table == 'alembic_version':
+            continue
+        snapshot[table] = {
+            'columns': [(column['name'], str(column['type']), column['nullable'])
+                        for column in inspector.get_columns(table)],
+            'primary_key': inspector.get_pk_constraint(table)['constrained_columns'],
+            'indexes': sorted((index['name'], tuple(index['column_names']), bool(index['unique']))
+                              for index in inspector.get_indexes(table)),
+            'unique': sorted(tuple(unique['column_names']) for unique in inspector.get_unique_constraints(table)),
+            'foreign_keys': sorted((tuple(key['constrained_columns']), key['referred_table'],
+                                    tuple(key['referred_columns'])) for key in inspector.get_foreign_keys(table)),
+        }
+    return snapshot
+
+
+class SchemaTestCase(unittest.TestCase):
+    """Squashed baseline migration, `flask bootstrap` and the legacy revisions, each on its own SQLite file"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.mkdtemp()
+        self.apps = {}
+        for name in ('migrated', 'bootstrapped', 'legacy'):
+            config['schema_' + name] = type('SchemaTestingConfig', (TestingConfig,), {
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, name + '.sqlite'),
+            })
+            self.apps[name] = create_app('schema_' + name)
+        self.directory = os.path.join(os.path.dirname(self.apps['migrated'].root_path), 'migrations')
+        self.head = ScriptDirectory.from_config(
+            self.apps['migrated'].extensions['migrate'].migrate.get_config(self.directory)).get_current_head()
+
+    def tearDown(self) -> None:
+        for name, app in self.apps.items():
+            with app.app_context():
+                db.engine.dispose()
+            del config['schema_' + name]
+        shutil.rmtree(self.tmpdir)
+
+    def test_squashed_baseline_matches_models(self) -> None:
+        """
+        GIVEN an empty database upgraded with the squashed baseline and another one created with `flask bootstrap`
+        WHEN their schemas are compared with each other and with the models
+        THEN autogenerate finds no difference to the models, both schemas are identical and both are at the head
+        """
+        migrated, bootstrapped = self.apps['migrated'], self.apps['bootstrapped']
+        with migrated.app_context():
+            upgrade(directory=self.directory)
+            with db.engine.connect() as connection:
+                self.assertEqual(compare_metadata(MigrationContext.configure(connection), db.metadata), [])
+                self.assertEqual(MigrationContext.configure(connection).get_current_revision(), self.head)
+            migrated_schema = schema_snapshot(db.engine)
+        result = bootstrapped.test_cli_runner().invoke(args=['bootstrap'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with bootstrapped.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(MigrationContext.configure(connection).get_current_revision(), self.head)
+            bootstrapped_schema = schema_snapshot(db.engine)
+        self.assertEqual(set(migrated_schema), set(db.metadata.tables))
+        self.assertEqual(migrated_schema, bootstrapped_schema)
+
+    def test_legacy_database_converges_with_squashed_baseline(self) -> None:
+        """
+        GIVEN a copy of data-dev.sqlite at legacy revision 30114332bd51 and an empty database
+        WHEN the copy is upgraded through migrations/legacy and then migrations/, the empty one through migrations/
+        THEN both are at the head with identical schemas and the copy kept its rows
+        """
+        legacy, migrated = self.apps['legacy'], self.apps['migrated']
+        shutil.copy(os.path.join(os.path.dirname(self.directory), 'data-dev.sqlite'),
+                    os.path.join(self.tmpdir, 'legacy.sqlite'))
+        with legacy.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(MigrationContext.configure(connection).get_current_revision(), '30114332bd51')
+                counts = [connection.scalar(sa.text('SELECT count(*) FROM ' + table))
+                          for table in ('accounts_table', 'transactions_table')]
+            upgrade(directory=os.path.join(self.directory, 'legacy'))
+            upgrade(directory=self.directory)
+            with db.engine.connect() as connection:
+                self.assertEqual(MigrationContext.configure(connection).get_current_revision(), self.head)
+                self.assertEqual([connection.scalar(sa.text('SELECT count(*) FROM ' + table))
+                                  for table in ('accounts_table', 'transactions_table')], counts)
+            legacy_schema = schema_snapshot(db.engine)
+        with migrated.app_context():
+            upgrade(directory=self.directory)
+            migrated_schema = schema_snapshot(db.engine)
+        self.assertEqual(legacy_schema, migrated_schema)
+
+    def test_bootstrap_seeds_and_refuses_existing_schema(self) -> None:
+        """
+        GIVEN a database created with `flask bootstrap`
+        WHEN `flask db upgrade` and `flask bootstrap` run again
+        THEN the reference data is there, the upgrade has nothing to do and the second bootstrap fails
+        """
+        app = self.apps['bootstrapped']
+        runner = app.test_cli_runner()
+        self.assertEqual(runner.invoke(args=['bootstrap']).exit_code, 0)
+        with app.app_context():
+            self.assertEqual(db.session.query(Role).count(), 3)
+            self.assertEqual(db.session.query(TransactionType).count(), 5)
+            upgrade(directory=self.directory)
+            with db.engine.connect() as connection:
+                self.assertEqual(MigrationContext.configure(connection).get_current_revision(), self.head)
+        result = runner.invoke(args=['bootstrap'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('use flask db upgrade', result.output)
@@ -0,0 +1,106 @@
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import Accounts, Role, Transactions, TransactionType, User
+from app.search import TransactionFilter, search_query
+from .base import DatabaseTestCase
+
+
+class SearchCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'support'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+        self.own, self.other = [account.account_num for account in
+                                self.session.query(Accounts).order_by(Accounts.account_num)]
+        # Registration opens each account with a zero deposit, left out so the dates below are the only ones
+        self.session.query(Transactions).delete()
+        types = dict(self.session.query(TransactionType.name, TransactionType.id))
+        self.deposit, self.transfer = types['Deposit'], types['Transfer']
+        # Day 1: deposit 100, day 2: transfer 30 to other, day 3: other transfers 5 back, day 4: other deposits 70
+        start = datetime(2024, 3, 1, 12)
+        for day, (sender, receiver, amount, type_id) in enumerate([
+                (self.own, self.own, 100, self.deposit), (self.own, self.other, 30, self.transfer),
+                (self.other, self.own, 5, self.transfer), (self.other, self.other, 70, self.deposit)]):
+            self.session.add(Transactions(sender=sender, receiver=receiver, amount=amount, transaction_type_id=type_id,
+                                          date_time=start + timedelta(days=day)))
+        support = self.session.query(User).filter_by(email='supportdoe@email.com').one()
+        support.role = self.session.query(Role).filter_by(name='Moderator').one()
+        self.session.commit()
+
+    def login(self, first_name: str) -> None:
+        self.client.post('/auth/login', data={'email': '{}doe@email.com'.format(first_name), 'password': 'testpassword'})
+
+    def search(self, **params) -> dict:
+        response = self.client.get('/api/transactions/search', query_string=params)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()
+
+    def test_staff_only(self) -> None:
+        """
+        GIVEN a customer and a moderator
+        WHEN each opens the search page and API
+        THEN the customer gets 403 and the moderator the page, with a Search link in the navigation
+        """
+        self.login('devone')
+        self.assertEqual(self.client.get('/search').status_code, 403)
+        self.assertEqual(self.client.get('/api/transactions/search').status_code, 403)
+        self.client.get('/auth/logout')
+        self.login('support')
+        response = self.client.get('/search', query_string={'account': self.own})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'href="/search"', response.data)
+        self.assertEqual(response.data.count(b'2024-03-0'), 3)
+
+    def test_account_search_pages_newest_first(self) -> None:
+        """
+        GIVEN an account that deposited, sent and received
+        WHEN staff search its transactions two at a time
+        THEN the three transactions come newest first over two pages joined by the cursor, each once
+        """
+        self.login('support')
+        first = self.search(account=self.own, limit=2)
+        self.assertEqual([txn['amount'] for txn in first['transactions']], [5, 30])
+        second = self.search(account=self.own, limit=2, before=first['next'])
+        self.assertEqual([txn['amount'] for txn in second['transactions']], [100])
+        self.assertIsNone(second['next'])
+        self.assertEqual(second['transactions'][0]['type'], 'Deposit')
+
+    def test_criteria_combine(self) -> None:
+        """
+        GIVEN four transactions over four days
+        WHEN staff search by type and day range, by amount range within a date range, and by amount alone
+        THEN the matching transactions are returned, and the amount-only search is rejected
+        """
+        self.login('support')
+        transfers = self.search(type_id=self.transfer, date_from='2024-03-02', date_to='2024-03-02')
+        self.assertEqual([txn['amount'] for txn in transfers['transactions']], [30])
+        amounts = self.search(date_from='2024-03-01', amount_min=5, amount_max=70)
+        self.assertEqual([txn['amount'] for txn in amounts['transactions']], [70, 5, 30])
+        response = self.client.get('/api/transactions/search', query_string={'amount_min': 5})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('criteria', response.get_json()['errors'])
+
+    def test_query_plans_use_indexes(self) -> None:
+        """
+        GIVEN the search criteria the builder accepts
+        WHEN SQLite plans the queries
+        THEN every access to transactions_table goes through an index or the primary key, never a full scan
+        """
+        cursor = (datetime(2024, 3, 3), 0, 10)
+        for filters in [TransactionFilter(account=self.own), TransactionFilter(type_id=self.transfer),
+                        TransactionFilter(date_from=date(2024, 3, 1), date_to=date(2024, 3, 2), amount_min=10),
+                        TransactionFilter(account=self.own, type_id=self.deposit, amount_max=50), TransactionFilter()]:
+            query = search_query(filters, before=cursor)
+            compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = [row[-1] for row in self.session.execute(db.text('EXPLAIN QUERY PLAN {}'.format(compiled)))]
+            accesses = [step for step in plan if 'transactions_table' in step]
+            self.assertTrue(accesses, plan)
+            for step in accesses:
+                self.assertIn('USING', step, (filters, plan))
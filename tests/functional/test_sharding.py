@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from app import create_app, db, shard_router
+from app.archive import archive_transactions
+from app.models import User, Role, Accounts, Transactions, ArchivedTransactions, TransactionType, ShardTransfer, \
+    ShardTransferLog, Posting, LedgerTotal, OutboxMessage
+from app.reconciliation import reconcile
+from app.search import TransactionFilter, search_transactions, cursor, encode_cursor, decode_cursor
+from config import config, TestingConfig
+
+
+class ShardingTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Two SQLite files: the default database owns account numbers 1-999, the 'shard_b' bind owns 1000 onwards.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        config['sharded_testing'] = type('ShardedTestingConfig', (TestingConfig,), {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'shard_a.sqlite'),
+            'SQLALCHEMY_BINDS': {'shard_b': 'sqlite:///' + os.path.join(self.tmpdir, 'shard_b.sqlite')},
+            'ACCOUNT_SHARDS': [(None, 1, 999), ('shard_b', 1000, None)],
+        })
+        self.app = create_app('sharded_testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        shard_router.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        del config['sharded_testing']
+        db.metadatas.pop('shard_b', None) # registered by init_app, would leak into other apps' create_all()
+        shutil.rmtree(self.tmpdir)
+
+    def register(self, first_name: str) -> None:
+        response = self.client.post('/auth/register', data={
+            'first_name': first_name,
+            'last_name': 'doe',
+            'email': '{}doe@email.com'.format(first_name),
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def login(self, first_name: str) -> None:
+        response = self.client.post('/auth/login', data={
+            'email': '{}doe@email.com'.format(first_name),
+            'password': 'testpassword'
+        }, follow_redirects=True)
+        self.assertIn('Hello {}'.format(first_name).encode(), response.data)
+
+    def test_accounts_are_spread_over_shards(self) -> None:
+        """
+        GIVEN two shards
+        WHEN two users register
+        THEN their accounts are numbered from the range of the shard picked for them and stored in that shard's file only
+        """
+        self.register('devone')
+        self.register('devtwo')
+        self.assertEqual(shard_router.shard_for(1000).bind_key, 'shard_b')
+        self.assertIsNotNone(shard_router.get_account(1000))
+        self.assertIsNotNone(shard_router.get_account(1))
+        self.assertEqual(db.session.query(Accounts).count(), 1)
+
+    def test_account_number_taken_concurrently(self) -> None:
+        """
+        GIVEN a user whose accounts go to shard_b, which holds account 1000
+        WHEN another registration commits account 1001 after the next number was read but before it is inserted
+        THEN the insert is retried with the new maximum and the account gets 1002
+        """
+        self.register('devone')
+        user = User.query.filter_by(email='devonedoe@email.com').one()
+        shard_b = shard_router.session(shard_router.shard_for(1000))
+
+        def take_next_number(session, flush_context, instances):
+            with db.engines['shard_b'].begin() as connection:
+                connection.execute(sa.insert(Accounts.__table__).values(account_num=1001, balance=0))
+
+        sa.event.listen(shard_b, 'before_flush', take_next_number, once=True)
+        self.assertEqual(shard_router.create_account(user).account_num, 1002)
+        self.assertEqual(shard_b.query(Accounts.account_num).order_by(Accounts.account_num).all(),
+                         [(1000,), (1001,), (1002,)])
+
+    def test_cross_shard_transfer(self) -> None:
+        """
+        GIVEN accounts 1000 (shard_b) and 1 (default database)
+        WHEN account 1 deposits 10 and transfers 4 to account 1000
+        THEN both balances change, each shard records the transaction, the posting and the email of its own account,
+            and the coordinator log is committed
+        """
+        self.register('devone')
+        self.register('devtwo')
+        self.login('devtwo')
+        self.client.post('/auth/deposit', data={'amount': 10}, follow_redirects=True)
+        response = self.client.post('/auth/transfer', data={'recipient_acc_num': 1000, 'amount': 4}, follow_redirects=True)
+        self.assertIn(b'Account 1000 - Transfer', response.data)
+        self.assertEqual(shard_router.get_account(1).balance, 6)
+        self.assertEqual(shard_router.get_account(1000).balance, 4)
+        transfer = ShardTransfer.query.one()
+        self.assertEqual(transfer.state, 'committed')
+        shard_b = shard_router.session(shard_router.shard_for(1000))
+        self.assertIsNotNone(shard_b.get(ShardTransferLog, (transfer.id, 1000)))
+        self.assertIsNotNone(db.session.get(ShardTransferLog, (transfer.id, 1)))
+        self.assertEqual([(posting.account_num, posting.amount) for posting in shard_b.query(Posting).filter_by(counterparty=1)],
+                         [(1000, 4)])
+        self.assertEqual([(posting.account_num, posting.amount) for posting in db.session.query(Posting).filter_by(counterparty=1000)],
+                         [(1, -4)])
+        self.assertEqual([message.body.splitlines()[3] for message in shard_b.query(OutboxMessage)],
+                         ['The balance of account 1000 is now 4.0.'])
+        self.assertEqual([message.subject for message in db.session.query(OutboxMessage).order_by(OutboxMessage.id)],
+                         ['[Bank] Deposit received', '[Bank] Transfer sent'])
+
+    def test_search_pages_through_equal_ids_on_two_shards(self) -> None:
+        """
+        GIVEN a deposit on each shard with the same id and date_time, ids being only unique within a shard
+        WHEN the day is searched one transaction per page, each page continuing from the previous one's cursor
+        THEN each deposit is listed once, shard_b's first as it comes later in the shard order
+        """
+        self.register('devone')
+        self.register('devtwo')
+        deposit = TransactionType.query.filter_by(name='Deposit').one()
+        date_time = datetime(2024, 3, 1, 12)
+        for account_num in (1, 1000):
+            session = shard_router.session_for(shard_router.get_account(account_num))
+            session.add(Transactions(id=50, sender=account_num, receiver=account_num, amount=account_num,
+                                     date_time=date_time, transaction_type_id=deposit.id))
+            session.commit()
+        filters = TransactionFilter(date_from=date_time.date(), date_to=date_time.date())
+        pages, before = [], None
+        while True:
+            page = search_transactions(filters, before, limit=1)
+            if not page:
+                break
+            pages.append([(txn.sender, txn.id) for txn in page])
+            before = decode_cursor(encode_cursor(cursor(page[-1])))
+        self.assertEqual(pages, [[(1000, 50)], [(1, 50)]])
+
+    def test_reconcile_each_shard(self) -> None:
+        """
+        GIVEN a cross-shard transfer of 4 from account 1 to account 1000
+        WHEN the ledger is reconciled
+        THEN each shard sums only its own side of the transfer and neither reports drift
+        """
+        self.register('devone')
+        self.register('devtwo')
+        self.login('devtwo')
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/transfer', data={'recipient_acc_num': 1000, 'amount': 4})
+        reports = reconcile()
+        self.assertEqual([(report['bind_key'], report['drift']) for report in reports], [(None, []), ('shard_b', [])])
+        shard_b = shard_router.session(shard_router.shard_for(1000))
+        self.assertEqual([(total.account_num, total.net) for total in shard_b.query(LedgerTotal)], [(1000, 4)])
+        self.assertEqual([(total.account_num, total.net) for total in db.session.query(LedgerTotal)], [(1, 6)])
+
+    def test_archive_each_shard(self) -> None:
+        """
+        GIVEN a cross-shard transfer of 4 from account 1 to account 1000, dated 400 days ago on both shards
+        WHEN transactions older than 365 days are archived and the ledger is fully reconciled
+        THEN each shard moves its own rows into its own archive, and the archived rows still reconcile
+        """
+        self.register('devone')
+        self.register('devtwo')
+        self.login('devtwo')
+        self.client.post('/auth/deposit', data={'amount': 10})
+        self.client.post('/auth/transfer', data={'recipient_acc_num': 1000, 'amount': 4})
+        sessions = [db.session, shard_router.session(shard_router.shard_for(1000))]
+        old = datetime.utcnow() - timedelta(days=400)
+        for session in sessions:
+            session.execute(sa.update(Transactions).values(date_time=old))
+            session.commit()
+        hot = [session.query(Transactions).count() for session in sessions]
+        self.assertEqual(archive_transactions(timedelta(days=365)), sum(hot))
+        self.assertEqual([(session.query(Transactions).count(), session.query(ArchivedTransactions).count())
+                          for session in sessions], [(0, hot[0]), (0, hot[1])])
+        reports = reconcile(full=True)
+        self.assertEqual([report['drift'] for report in reports], [[], []])
+
+    def test_recover_rolls_forward_and_aborts(self) -> None:
+        """
+        GIVEN a prepared transfer applied only on the sender's shard, and one applied on neither
+        WHEN recovery runs
+        THEN the first is completed on the receiver's shard with its received email, and the second is aborted
+        """
+        self.register('devone')
+        self.register('devtwo')
+        sender = shard_router.get_account(1)
+        sender.balance = 10
+        db.session.commit()
+        stale = datetime.utcnow() - timedelta(hours=1)
+        half_done = ShardTransfer(sender=1, receiver=1000, amount=3, state='prepared', created_at=stale)
+        untouched = ShardTransfer(sender=1, receiver=1000, amount=5, state='prepared', created_at=stale)
+        db.session.add_all([half_done, untouched])
+        db.session.commit()
+        shard_router._apply(db.session, half_done, sender, -3, None)
+        db.session.commit()
+
+        self.assertEqual(shard_router.recover(), {'committed': 1, 'aborted': 1})
+        self.assertEqual(shard_router.get_account(1).balance, 7)
+        self.assertEqual(shard_router.get_account(1000).balance, 3)
+        self.assertEqual(db.session.get(ShardTransfer, untouched.id).state, 'aborted')
+        shard_b = shard_router.session(shard_router.shard_for(1000))
+        self.assertEqual([message.subject for message in db.session.query(OutboxMessage)], ['[Bank] Transfer sent'])
+        self.assertEqual([message.subject for message in shard_b.query(OutboxMessage)], ['[Bank] Transfer received'])
@@ -0,0 +1,103 @@
+from app.models import Accounts, BalanceStripe, OutboxMessage
+from app.stripes import compact_stripes
+from .base import DatabaseTestCase
+
+
+class StripedBalanceCase(DatabaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        for first_name in ('devone', 'merchant'):
+            self.client.post('/auth/register', data={
+                'first_name': first_name,
+                'last_name': 'doe',
+                'email': '{}doe@email.com'.format(first_name),
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+            self.client.get('/auth/logout')
+        self.customer, self.merchant = [account.account_num for account in
+                                        self.session.query(Accounts).order_by(Accounts.account_num)]
+        self.runner = self.app.test_cli_runner()
+        result = self.runner.invoke(args=['balances', 'stripe', str(self.merchant), '--stripes', '4'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def login(self, first_name: str) -> None:
+        self.client.post('/auth/login', data={'email': '{}doe@email.com'.format(first_name), 'password': 'testpassword'})
+
+    def transfer(self, sender: int, receiver: int, amount: float) -> None:
+        self.client.post('/auth/transfer', data={'from_account': sender, 'recipient_acc_num': receiver, 'amount': amount})
+
+    def merchant_state(self):
+        self.session.expire_all()
+        account = self.session.get(Accounts, self.merchant)
+        stripes = [stripe.balance for stripe in self.session.query(BalanceStripe).filter_by(account_num=self.merchant)]
+        return account.balance, sorted(stripes), account.total_balance
+
+    def test_credits_go_to_stripes_until_compacted(self) -> None:
+        """
+        GIVEN a merchant account split into 4 stripes
+        WHEN a customer pays it 10 three times and the stripes are compacted
+        THEN the payments are held in the stripes with the total counting them, and compaction moves the 30 into
+            the balance without changing the total
+        """
+        self.login('devone')
+        self.client.post('/auth/deposit', data={'amount': 100})
+        for _ in range(3):
+            self.transfer(self.customer, self.merchant, 10)
+        balance, stripes, total = self.merchant_state()
+        self.assertEqual((balance, sum(stripes), total, len(stripes)), (0, 30, 30, 4))
+        self.assertEqual(compact_stripes(), {'accounts': 1, 'moved': 30})
+        self.assertEqual(self.merchant_state(), (30, [0, 0, 0, 0], 30))
+        self.assertEqual(self.runner.invoke(args=['reconcile']).exit_code, 0)
+
+    def test_debits_check_the_consolidated_total(self) -> None:
+        """
+        GIVEN a merchant holding 30 in stripes and nothing in its balance
+        WHEN it sends 50, then 20
+        THEN 50 is refused as above the total, 20 is debited from the balance and the API reports the total
+        """
+        self.login('devone')
+        self.client.post('/auth/deposit', data={'amount': 30})
+        self.transfer(self.customer, self.merchant, 30)
+        self.client.get('/auth/logout')
+        self.login('merchant')
+        self.transfer(self.merchant, self.customer, 50)
+        self.assertEqual(self.merchant_state(), (0, [0, 0, 0, 30], 30))
+        self.transfer(self.merchant, self.customer, 20)
+        self.assertEqual(self.merchant_state(), (-20, [0, 0, 0, 30], 10))
+        self.assertEqual(self.client.get('/api/balance').get_json()['balance'], 10)
+
+    def test_emails_report_the_total_balance(self) -> None:
+        """
+        GIVEN a striped merchant
+        WHEN a customer pays it 30 and the merchant sends 20 back
+        THEN the received email reports the 30 held in stripes and the sent email the 10 left, not the stored
+            balance nor the SQL expression assigned to it by the debit
+        """
+        self.login('devone')
+        self.client.post('/auth/deposit', data={'amount': 30})
+        self.transfer(self.customer, self.merchant, 30)
+        self.client.get('/auth/logout')
+        self.login('merchant')
+        self.transfer(self.merchant, self.customer, 20)
+        bodies = [message.body for message in self.session.query(OutboxMessage).filter(
+            OutboxMessage.recipient == 'merchantdoe@email.com').order_by(OutboxMessage.id)]
+        self.assertEqual(len(bodies), 2)
+        self.assertIn('The balance of account {} is now 30'.format(self.merchant), bodies[0])
+        self.assertIn('The balance of account {} is now 10'.format(self.merchant), bodies[1])
+
+    def test_unstripe(self) -> None:
+        """
+        GIVEN a striped merchant holding 5 in a stripe
+        WHEN it is unstriped, and an unknown account is striped
+        THEN the 5 is folded into the balance and the stripes are gone, and the unknown account is an error
+        """
+        self.login('devone')
+        self.client.post('/auth/deposit', data={'amount': 5})
+        self.transfer(self.customer, self.merchant, 5)
+        self.assertEqual(self.runner.invoke(args=['balances', 'unstripe', str(self.merchant)]).exit_code, 0)
+        self.assertEqual(self.merchant_state(), (5, [], 5))
+        result = self.runner.invoke(args=['balances', 'stripe', '999'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Account 999 does not exist', result.output)
@@ -1,29 +1,12 @@
-import unittest
-from app import create_app, db
-from app.models import User, Role, Accounts, Transactions, TransactionType
+from app import db
+from app.models import Accounts, Transactions
+from .base import DatabaseTestCase
 
-class TransactionsCase(unittest.TestCase):
-    
-    
-    def setUp(self)->None:
-        """
-        Create an environment for the test that is close to a running application. 
-        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
-        Brand new database gets created for tests with create_all().
-        """
-        self.app = create_app('testing')
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        Role.insert_roles()
-        TransactionType.insert_transaction_types()
-        self.client = self.app.test_client(use_cookies=True)
-    
-    
-    def tearDown(self) -> None:
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
+class TransactionsCase(DatabaseTestCase):
+    """
+    Runs on the shared testing app: schema, roles and transaction types are built once (see base.py),
+    every test runs inside a transaction rolled back in tearDown.
+    """
     
     
     def test_register_and_login(self)->None:
@@ -126,6 +109,13 @@ class TransactionsCase(unittest.TestCase):
         self.assertEqual(transaction.amount, 10)
         self.assertEqual(transaction.transaction_type.name, "Deposit")
         
+        # Cached transaction list is invalidated by the deposit
+        self.assertIn(b'Deposit', response.data)
+        response = self.client.post('/auth/deposit', data={
+            'amount': 7
+        }, follow_redirects=True)
+        self.assertIn(b'<div class="transaction-amount">7</div>', response.data)
+        
         
     def test_successful_transfer(self) -> None:
         """
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+from app.analytics import AccountColumns, moving_average, spending_summary
+
+
+def columns(rows) -> AccountColumns:
+    amount, posted_at, type_id, counterparty = zip(*rows)
+    return AccountColumns(np.array(amount, dtype=np.float64), np.array(posted_at, dtype='datetime64[s]'),
+                          np.array(type_id, dtype=np.int64), np.array(counterparty, dtype=np.int64))
+
+
+class SpendingSummaryTestCase(unittest.TestCase):
+    TYPES = {2: 'Deposit', 3: 'Withdrawal', 4: 'Transfer'}
+
+    def test_monthly_and_category_breakdown(self) -> None:
+        """
+        GIVEN account 1 depositing in January, transferring to 2 and 3 in January and March and withdrawing in March
+        WHEN its spending is summarised
+        THEN February is a zero month, spending is split by month, type and counterparty, and 2 ranks first
+        """
+        summary = spending_summary(columns([
+            (100, '2024-01-02T10:00', 2, 1),
+            (-30, '2024-01-15T10:00', 4, 2),
+            (-10, '2024-01-20T10:00', 4, 3),
+            (20, '2024-03-01T10:00', 4, 2),
+            (-25, '2024-03-05T10:00', 4, 2),
+            (-5, '2024-03-31T23:59', 3, 1),
+        ]), 1, self.TYPES, window=2)
+        self.assertEqual(summary['months'], ['2024-01', '2024-02', '2024-03'])
+        self.assertEqual(summary['spent'], [40, 0, 30])
+        self.assertEqual(summary['received'], [100, 0, 20])
+        self.assertEqual(summary['moving_average'], [40, 20, 15])
+        self.assertEqual(summary['by_type'], {'Withdrawal': [0, 0, 5], 'Transfer': [40, 0, 25]})
+        self.assertEqual(summary['by_counterparty'], [{'account_num': 2, 'spent': 55, 'count': 2},
+                                                      {'account_num': 3, 'spent': 10, 'count': 1}])
+        self.assertEqual(summary['percentiles']['50'], 17.5)
+
+    def test_without_spending(self) -> None:
+        """
+        GIVEN an account without postings and one that only received money
+        WHEN they are summarised
+        THEN both have no percentiles, and the second one zero spending in its only month
+        """
+        empty = spending_summary(columns([(0, '2024-01-01', 1, 1)])._replace(
+            amount=np.array([]), posted_at=np.array([], dtype='datetime64[s]')), 1, self.TYPES)
+        self.assertEqual(empty['months'], [])
+        self.assertIsNone(empty['percentiles']['99'])
+        income = spending_summary(columns([(10, '2024-05-01', 2, 1)]), 1, self.TYPES)
+        self.assertEqual(income['spent'], [0])
+        self.assertEqual(income['by_type'], {})
+        self.assertIsNone(income['percentiles']['50'])
+        self.assertEqual(moving_average(np.array([3.0, 6.0, 9.0]), 5).tolist(), [3, 4.5, 6])
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app.balances import BalanceEntry, MemoryBalanceBackend, SharedBalanceBackend
+
+
+class BalanceBackendTestCase(unittest.TestCase):
+
+    def test_memory_backend_keeps_newer_versions(self) -> None:
+        """
+        GIVEN a memory backend of two entries holding account 1 at version 5
+        WHEN version 4 is put, then version 6, then two more accounts
+        THEN version 4 is refused, version 6 replaces 5 and account 1, least recently used, is evicted
+        """
+        backend = MemoryBalanceBackend(max_entries=2)
+        self.assertTrue(backend.put(1, BalanceEntry(5, 50.0, 5, 0)))
+        self.assertFalse(backend.put(1, BalanceEntry(4, 40.0, 4, 0)))
+        self.assertEqual(backend.get(1).balance, 50)
+        self.assertTrue(backend.put(1, BalanceEntry(6, 60.0, 6, 0)))
+        self.assertEqual(backend.get(1).balance, 60)
+        backend.put(2, BalanceEntry(1, 1.0, 1, 0))
+        backend.put(3, BalanceEntry(1, 1.0, 1, 0))
+        self.assertIsNone(backend.get(1))
+        self.assertEqual(len(backend), 2)
+
+    def test_shared_backend_is_seen_by_every_worker(self) -> None:
+        """
+        GIVEN two workers' shared backends on one store
+        WHEN the first stores version 6 and the second then tries version 5
+        THEN both read version 6
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        url = 'sqlite:///' + os.path.join(tmpdir, 'balances.sqlite')
+        first, second = SharedBalanceBackend(url), SharedBalanceBackend(url)
+        self.addCleanup(first.engine.dispose)
+        self.addCleanup(second.engine.dispose)
+        self.assertTrue(first.put(1, BalanceEntry(6, 60.0, 6, 1.5)))
+        self.assertFalse(second.put(1, BalanceEntry(5, 50.0, 5, 2.5)))
+        self.assertEqual(first.get(1), BalanceEntry(6, 60.0, 6, 1.5))
+        self.assertEqual(second.get(1), first.get(1))
+        self.assertIsNone(second.get(2))
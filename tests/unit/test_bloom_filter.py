@@ -0,0 +1,28 @@
+import unittest
+from app.emails import BloomFilter
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            self.bloom.add('user{}@email.com'.format(i))
+
+    def test_added_keys_are_always_found(self) -> None:
+        """
+        Given a filter filled to its capacity
+        When every added key is looked up
+        Then none is missed and re-adding a key leaves the count unchanged
+        """
+        self.assertTrue(all('user{}@email.com'.format(i) in self.bloom for i in range(1000)))
+        self.bloom.add('user1@email.com')
+        self.assertLessEqual(self.bloom.count, 1000)
+
+    def test_false_positive_rate(self) -> None:
+        """
+        Given a filter sized for a 1% error rate and filled to its capacity
+        When 10000 absent keys are looked up
+        Then at most 2% of them are reported present
+        """
+        hits = sum('other{}@email.com'.format(i) in self.bloom for i in range(10000))
+        self.assertLess(hits, 200)
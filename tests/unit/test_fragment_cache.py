@@ -0,0 +1,57 @@
+import unittest
+from app.cache import FragmentCache
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache = FragmentCache(max_entries=2, max_bytes=64)
+
+    def test_hit_requires_same_latest_transaction(self) -> None:
+        """
+        Given a fragment cached for an account at latest transaction id 5
+        When the cache is queried with id 5 and with a newer id 6
+        Then the first lookup hits and the second one misses
+        """
+        self.cache.set(1, 5, '<ul></ul>')
+        self.assertEqual(self.cache.get(1, 5), '<ul></ul>')
+        self.assertIsNone(self.cache.get(1, 6))
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        """
+        Given a cache holding at most two fragments
+        When a third account is cached after the first one was read
+        Then the second account, the least recently used, is evicted
+        """
+        self.cache.set(1, 1, 'a')
+        self.cache.set(2, 2, 'b')
+        self.cache.get(1, 1)
+        self.cache.set(3, 3, 'c')
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(2, 2))
+        self.assertEqual(self.cache.get(1, 1), 'a')
+
+    def test_memory_cap(self) -> None:
+        """
+        Given a cache capped at 64 bytes
+        When fragments exceeding the cap in total or individually are stored
+        Then the total size stays within the cap
+        """
+        self.cache.set(1, 1, 'x' * 40)
+        self.cache.set(2, 2, 'y' * 40)
+        self.assertLessEqual(self.cache.size, 64)
+        self.assertIsNone(self.cache.get(1, 1))
+        self.cache.set(3, 3, 'z' * 100)
+        self.assertIsNone(self.cache.get(3, 3))
+
+    def test_invalidate(self) -> None:
+        """
+        Given cached fragments for two accounts
+        When both sides of a transfer are invalidated
+        Then neither fragment is served and the size accounting is reset
+        """
+        self.cache.set(1, 1, 'a')
+        self.cache.set(2, 1, 'b')
+        self.cache.invalidate(1, 2)
+        self.assertIsNone(self.cache.get(1, 1))
+        self.assertIsNone(self.cache.get(2, 1))
+        self.assertEqual(self.cache.size, 0)
@@ -0,0 +1,64 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, TransactionType
+from app.reference_data import REFERENCE_DATA, sync_reference_data, sync_reference_data_if_changed
+
+
+class ReferenceDataTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self) -> None:
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    def test_one_statement_per_table(self) -> None:
+        """
+        GIVEN an empty database
+        WHEN the reference data is synced twice
+        THEN each run issues one INSERT per table and no SELECT, and no row is duplicated
+        """
+        sync_reference_data()
+        sync_reference_data()
+        inserts = [s for s in self.statements if s.startswith('INSERT')]
+        self.assertEqual(len(inserts), 2 * len(REFERENCE_DATA))
+        self.assertFalse([s for s in self.statements if s.startswith('SELECT')])
+        self.assertEqual(Role.query.count(), 3)
+        self.assertEqual(TransactionType.query.count(), 5)
+
+    def test_changed_columns_are_updated(self) -> None:
+        """
+        GIVEN a default flag moved to the wrong role
+        WHEN roles are re-inserted
+        THEN the User role is the only default one again
+        """
+        Role.insert_roles()
+        for role in Role.query.all():
+            role.default = role.name == 'Administrator'
+        db.session.commit()
+        Role.insert_roles()
+        self.assertEqual([role.name for role in Role.query.filter_by(default=True)], ['User'])
+
+    def test_version_check_skips_unchanged_data(self) -> None:
+        """
+        GIVEN reference data synced once through the version check
+        WHEN the check runs again
+        THEN it skips the sync, and the CLI reports the data as up to date
+        """
+        self.assertTrue(sync_reference_data_if_changed())
+        self.statements.clear()
+        self.assertFalse(sync_reference_data_if_changed())
+        self.assertFalse([s for s in self.statements if s.startswith('INSERT')])
+        result = self.app.test_cli_runner().invoke(args=['sync-reference-data', '--if-changed'])
+        self.assertIn('up to date', result.output)